@@ -29,6 +29,7 @@
 
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
+from neubot.utils_random import RandomFileBody
 
 #
 # The default body size is small enough that the body, and
@@ -106,18 +107,10 @@ class DASHServerSmpl(ServerHTTP):
                 body_size = DASH_MAXIMUM_BODY_SIZE
 
             #
-            # XXX We don't have a quick solution for generating
-            # and sending many random bytes from Python.
+            # The body is backed by a preallocated random file, so
+            # that plain-text streams can send it using sendfile().
             #
-            # Or, better, we have a couple of ideas, but they
-            # have not been implemented into Neubot yet.
-            #
-            pattern = request["Authorization"]
-            if not pattern:
-                pattern = "deadbeef"
-            body = pattern * ((body_size / len(pattern)) + 1)
-            if len(body) > body_size:
-                body = body[:body_size]
+            body = RandomFileBody(body_size)
 
             response = Message()
             response.compose(code="200", reason="Ok", body=body,
@@ -32,6 +32,7 @@
 #
 
 import cgi
+import sys
 
 from neubot.backend import BACKEND
 
@@ -44,9 +45,130 @@ from neubot.http.message import Message
 
 from neubot import utils
 
+#
+# We don't serialize the whole list of results at once, because
+# a year of results may stall the poller for seconds.  Instead, the
+# response body is a file-like that serializes PIECE_LEN bytes of
+# results at a time, when the stream is ready to send more, and that
+# pulls the results from a generator, so that we don't need to keep
+# them all in memory.
+#
+# When the caller specifies either `limit` or `cursor`, the body is
+# an object, containing the `results` list and the `next` cursor,
+# i.e. the value of `cursor` to get the next page of results, or null
+# if there are no more results.  Otherwise, the body is the list of
+# results, as it used to be.
+#
+PIECE_LEN = 65536
+
+class StreamingJSONList(object):
+
+    ''' Serializes a list of results incrementally '''
+
+    def __init__(self, rows, limit=-1, paginate=False, indent=None,
+                 sort_keys=False, chunked=True):
+        '''
+         Initialize using the @rows generator, which yields (result,
+         cursor) tuples.  Serialize at most @limit results (negative
+         means no limit) and wrap them into an object if @paginate is
+         True.  When @chunked is True use chunked transfer encoding.
+        '''
+        self.rows = iter(rows)
+        self.limit = limit
+        self.paginate = paginate
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.chunked = chunked
+        self.count = 0
+        self.cursor = None
+        self.next_cursor = None
+        self.started = False
+        self.closed = False
+
+    def _next_row(self):
+        ''' Returns the next result or None '''
+        try:
+            row, cursor = self.rows.next()
+        except StopIteration:
+            return None
+        if self.limit >= 0 and self.count >= self.limit:
+            # There is one more result, so there is one more page
+            self.next_cursor = self.cursor
+            return None
+        self.count += 1
+        self.cursor = cursor
+        return row
+
+    def read(self, count=sys.maxint):
+        ''' Read the next piece of the body '''
+
+        if self.closed:
+            return ''
+
+        vector, total = [], 0
+        if not self.started:
+            self.started = True
+            if self.paginate:
+                vector.append('{"results": [')
+            else:
+                vector.append('[')
+
+        while total < PIECE_LEN:
+            row = self._next_row()
+            if row is None:
+                if self.paginate:
+                    vector.append('], "next": %s}' %
+                                  json.dumps(self.next_cursor))
+                else:
+                    vector.append(']')
+                self.closed = True
+                break
+            piece = json.dumps(row, indent=self.indent,
+                               sort_keys=self.sort_keys)
+            if self.count > 1:
+                if self.indent:
+                    piece = ',\n' + piece
+                else:
+                    piece = ', ' + piece
+            vector.append(piece)
+            total += len(piece)
+
+        data = ''.join(vector)
+        if self.chunked:
+            data = '%x\r\n%s\r\n' % (len(data), data)
+            if self.closed:
+                data += '0\r\n\r\n'
+        return data
+
+def walk_generic(test, since, until, cursor=None):
+
+    '''
+     Generator that walks the results of a generic test, newest
+     first, and yields (result, cursor) tuples.  The cursor is the
+     timestamp of the result and the number of results with the
+     same timestamp that we have yielded so far.
+    '''
+
+    last, skip, same = None, 0, 0
+    if cursor is not None:
+        last, skip = cursor.split(':')
+        last, skip = float(last), int(skip)
+        until = last
+
+    for elem in BACKEND.walk_generic_range(test, since, until):
+        timestamp = elem["timestamp"]
+        if timestamp == last:
+            same += 1
+            if same <= skip:
+                continue
+        else:
+            last, skip, same = timestamp, 0, 1
+        yield elem, '%s:%d' % (timestamp, same)
+
 def api_data(stream, request, query):
     ''' Get data stored on the local database '''
     since, until = -1, -1
+    limit, cursor = -1, None
     test = ''
 
     dictionary = cgi.parse_qs(query)
@@ -57,6 +179,10 @@ def api_data(stream, request, query):
         since = int(dictionary["since"][0])
     if "until" in dictionary:
         until = int(dictionary["until"][0])
+    if "limit" in dictionary:
+        limit = int(dictionary["limit"][0])
+    if "cursor" in dictionary:
+        cursor = str(dictionary["cursor"][0])
 
     if test == 'bittorrent':
         table = table_bittorrent
@@ -74,7 +200,7 @@ def api_data(stream, request, query):
     response = Message()
 
     if table:
-        lst = table.listify(DATABASE.connection(), since, until)
+        rows = table.walk(DATABASE.connection(), since, until, cursor)
 
     #
     # TODO We should migrate all the tests to use the new
@@ -82,32 +208,24 @@ def api_data(stream, request, query):
     # the API to access "pages" of data by index.
     #
     # Until we change the API, we have an API that allows
-    # the caller to specify date ranges. For this reason
-    # below we emulate the date-ranges semantics provided
-    # by database-based tests.
+    # the caller to specify date ranges, and the backend
+    # seeks to the results in the given range.
     #
     # Note: we assume that, whatever the test structure,
     # there is a field called "timestamp".
     #
     else:
-        lst = []
-        indexes = [None]
-        indexes.extend(range(16))
-        for index in indexes:
-            tmp = BACKEND.walk_generic(test, index)
-            if not tmp:
-                break
-            found_start = False
-            for elem in reversed(tmp):
-                if until >= 0 and elem["timestamp"] > until:
-                    continue
-                if since >= 0 and elem["timestamp"] < since:
-                    found_start = True
-                    break
-                lst.append(elem)
-            if found_start:
-                break
-
-    body = json.dumps(lst, indent=indent, sort_keys=sort_keys)
-    response.compose(code="200", reason="Ok", body=body, mimetype=mimetype)
+        rows = walk_generic(test, since, until, cursor)
+
+    # HTTP/1.0 clients don't know chunked and read up to EOF
+    chunked = request.protocol != "HTTP/1.0"
+    body = StreamingJSONList(rows, limit, limit >= 0 or cursor is not None,
+                             indent, sort_keys, chunked)
+    if chunked:
+        response.compose(code="200", reason="Ok", chunked=body,
+                         mimetype=mimetype)
+    else:
+        response.compose(code="200", reason="Ok", up_to_eof=True,
+                         mimetype=mimetype)
+        response.body = body
     stream.send_response(request, response)
@@ -0,0 +1,128 @@
+# neubot/archive_writer.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Batched, compressed archive writer '''
+
+#
+# Saving each result into its own gzip file costs a full gzip header
+# and trailer, and a bunch of syscalls to create the directories and
+# fix their ownership, and busy servers end up with thousands of tiny
+# files per day.  So, results are instead appended to one compressed
+# segment per test and per hour, named like the per-result files but
+# with the time truncated to the hour, which contains one JSON object
+# per line.
+#
+# The writer just serializes and batches the results, and flush()
+# appends each batch to its segment as a gzip member, and that's fine
+# because readers concatenate the members.  The writer has no thread:
+# the server stores results using the storage pipeline (see the file
+# backend_pipeline.py), which invokes flush() from its own thread
+# every FLUSH_INTERVAL seconds or FLUSH_RECORDS results.  flush() does
+# not log: it raises an exception when it cannot write a segment and
+# its caller reports the error.
+#
+
+import StringIO
+import gzip
+import os
+import sys
+import time
+
+from neubot.compat import json
+
+def segment_components(test, thetime):
+    ''' Returns the path components of the segment of @test
+        that contains the results saved at @thetime '''
+    gmt = time.gmtime(thetime)
+    return [
+            time.strftime('%Y', gmt),
+            time.strftime('%m', gmt),
+            time.strftime('%d', gmt),
+            '%s.000000000Z_%s.gz' % (
+              time.strftime('%Y%m%dT%H:00:00', gmt), test)
+           ]
+
+class ArchiveWriter(object):
+
+    ''' Batched, compressed archive writer '''
+
+    def __init__(self, touch):
+        '''
+         Initialize the writer.  The @touch function receives a list
+         of path components, makes sure that the file exists, and
+         returns its full path.
+        '''
+        self.touch = touch
+        self.segments = {}
+        self.paths = {}
+
+    def append(self, test, message):
+        ''' Batch @message, the result of @test, for writing '''
+        components = tuple(segment_components(test, time.time()))
+        self.segments.setdefault(components, []).append(
+          json.dumps(message) + '\n')
+
+    def flush(self):
+        ''' Append the batched results to their segments '''
+        segments, self.segments = self.segments, {}
+        failed = []
+        for components, records in sorted(segments.items()):
+            try:
+                self._write(components, records)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except EnvironmentError:
+                failed.append('%s: %s' % ('/'.join(components),
+                                          sys.exc_info()[1]))
+        if failed:
+            raise RuntimeError('archive_writer: cannot write: %s' %
+                               '; '.join(failed))
+
+    def _write(self, components, records):
+        ''' Append @records to the segment at @components '''
+        #
+        # The segment path changes every hour, so we touch it only
+        # the first time we see it, and we forget the old paths
+        # when the day changes.  If the segment has been moved away
+        # meanwhile, e.g. by the upload scripts, we touch it again,
+        # so that it has the right ownership and permissions.
+        #
+        path = self.paths.get(components)
+        if path is None or not os.path.exists(path):
+            if not any(old[:3] == components[:3] for old in self.paths):
+                self.paths.clear()
+            path = self.paths[components] = self.touch(list(components))
+        #
+        # We compress in memory and append the gzip member with a
+        # single write(), so that, in pre-fork mode, the members that
+        # different workers append to the same segment don't mix.
+        #
+        buff = StringIO.StringIO()
+        member = gzip.GzipFile(fileobj=buff, mode='wb')
+        member.write(''.join(records))
+        member.close()
+        filep = open(path, 'ab')
+        try:
+            filep.write(buff.getvalue())
+        finally:
+            filep.close()
@@ -50,6 +50,7 @@ if __name__ == '__main__':
 
 from neubot.compat import json
 
+from neubot.backend_pipeline import StoragePipeline
 from neubot.backend_mlab import BackendMLab
 from neubot.backend_neubot import BackendNeubot
 from neubot.backend_null import BackendNull
@@ -84,6 +85,7 @@ class BackendProxy(object):
     def __init__(self):
         ''' Initialize backend proxy '''
         self.backend = BackendNeubot(self)
+        self.pipeline = None
         self.vfs = None
         self.datadir = None
         self.passwd = None
@@ -120,6 +122,48 @@ class BackendProxy(object):
         ''' Route calls to the real backend '''
         return getattr(self.backend, attr)
 
+    #
+    # By default results are stored by the thread that invokes the
+    # store methods, but the server enables the storage pipeline so
+    # that the poller loop does not wait for the disk (see the file
+    # neubot/backend_pipeline.py for more info).  Since results are
+    # stored later, the pipeline must be enabled only when no-one is
+    # going to read the results back immediately, as the agent does.
+    #
+
+    def enable_pipeline(self, poller):
+        ''' Store results using the storage pipeline '''
+        logging.debug('backend: enable storage pipeline')
+        self.pipeline = StoragePipeline(self, poller)
+
+    def _store(self, method, *args):
+        ''' Store results directly or using the pipeline '''
+        if self.pipeline:
+            self.pipeline.submit(method, *args)
+        else:
+            getattr(self.backend, method)(*args)
+
+    def bittorrent_store(self, message):
+        ''' Saves the results of a bittorrent test '''
+        self._store('bittorrent_store', message)
+
+    def store_raw(self, message):
+        ''' Saves the results of a raw test '''
+        self._store('store_raw', message)
+
+    def speedtest_store(self, message):
+        ''' Saves the results of a speedtest test '''
+        self._store('speedtest_store', message)
+
+    def store_generic(self, test, results):
+        """ Store the results of a generic test """
+        self._store('store_generic', test, results)
+
+    def snap(self, data):
+        ''' Take a snapshot of the storage pipeline state '''
+        if self.pipeline:
+            self.pipeline.snap(data)
+
     #
     # I adapted the following methods from the FileSystemPOSIX
     # class, which was contained by neubot/filesys_posix.py.
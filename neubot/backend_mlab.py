@@ -28,16 +28,16 @@
 # in a very scalable way.
 #
 
-import gzip
-import time
-
-from neubot.compat import json
-
+from neubot.archive_writer import ArchiveWriter
 from neubot.backend_null import BackendNull
 
 class BackendMLab(BackendNull):
     ''' M-Lab backend '''
 
+    def __init__(self, proxy):
+        BackendNull.__init__(self, proxy)
+        self.writer = None
+
     def bittorrent_store(self, message):
         ''' Saves the results of a bittorrent test '''
         self.do_store('bittorrent', message)
@@ -56,41 +56,24 @@ class BackendMLab(BackendNull):
 
     def do_store(self, test, message):
         ''' Saves the results of the given test '''
-
-        # Get time information
-        thetime = time.time()
-        gmt = time.gmtime(thetime)
-        nanosec = int((thetime % 1.0) * 1000000000)
-
-        #
-        # Build path components.
-        # The time format is ISO8601, except that we use nanosecond
-        # and not microsecond precision.
-        #
-        components = [
-                      time.strftime('%Y', gmt),
-                      time.strftime('%m', gmt),
-                      time.strftime('%d', gmt),
-                      '%s.%09dZ_%s.gz' % (
-                        time.strftime('%Y%m%dT%H:%M:%S', gmt),
-                        nanosec, test)
-                     ]
-
-        #
-        # Make sure that the path exists and that ownership
-        # and permissions are OK.
-        #
-        fullpath = self.proxy.datadir_touch(components)
-
         #
-        # Open the output file for appending, write into
-        # it the message and close.
-        # We open for appending just in case two tests
-        # terminates at the same time (unlikely!).
+        # The archive writer batches the results and appends them
+        # to the current segment of the test when flushed, i.e.
+        # periodically when we store using the storage pipeline and
+        # immediately otherwise.  Segment names follow the ISO8601
+        # format, except that we use nanosecond and not microsecond
+        # precision, as we did when each result had its own file.
         #
-        filep = gzip.open(fullpath, 'ab')
-        json.dump(message, filep)
-        filep.close()
+        if not self.writer:
+            self.writer = ArchiveWriter(self.proxy.datadir_touch)
+        self.writer.append(test, message)
+        if not self.proxy.pipeline:
+            self.writer.flush()
+
+    def flush(self):
+        ''' Make sure that the stored results are on disk '''
+        if self.writer:
+            self.writer.flush()
 
     def walk_generic(self, test, index):
         """ Walk over the results of a generic test """
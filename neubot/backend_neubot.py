@@ -31,11 +31,7 @@
 
 import logging
 import os
-
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+import threading
 
 from neubot.database import DATABASE
 from neubot.database import table_bittorrent
@@ -43,8 +39,7 @@ from neubot.database import table_speedtest
 from neubot.database import table_raw
 
 from neubot.backend_null import BackendNull
-
-from neubot import utils_path
+from neubot.result_log import ResultLog
 
 SPLIT_INTERVAL = 1024
 SPLIT_NUM_FILES = 15
@@ -55,6 +50,7 @@ class BackendNeubot(BackendNull):
     def __init__(self, proxy):
         BackendNull.__init__(self, proxy)
         self.generic = {}
+        self.lock = threading.Lock()
 
     def bittorrent_store(self, message):
         ''' Saves the results of a bittorrent test '''
@@ -81,83 +77,68 @@ class BackendNeubot(BackendNull):
         table_speedtest.insert(DATABASE.connection(), message)
 
     #
-    # 'Generic' load/store functions. We append test results into a vector,
-    # which is also serialized to disk using pickle. When the number of
-    # items in the vector exceeds a threshold, we rotate the logfiles created
-    # using pickle, and we start over with an empty vector.
+    # 'Generic' load/store functions.  We append test results to a
+    # log that is split into segments of up to SPLIT_INTERVAL results
+    # each, and we keep the current segment plus SPLIT_NUM_FILES older
+    # segments (see neubot/result_log.py for more info).
     #
     # Also we access results by index, as the Twitter API does. Each index
-    # is the number of a logfile. When there is no index, we serve the logfile
-    # that is currently being written.
+    # is the number of a segment. When there is no index, we serve the
+    # segment that is currently being written.
     #
     # Dash Elhauge had the original idea behind this implementation, my
     # fault if it took too much to implement it.
     #
+    # With the storage pipeline, both the storage thread and the poller
+    # thread may open the log of a test, so we open it with the lock
+    # held, otherwise we could open it twice and, e.g., import the old
+    # pickles twice.
+    #
+
+    def _result_log(self, test):
+        """ Returns the result log of a generic test or None """
+        self.lock.acquire()
+        try:
+            if not test in self.generic:
+                datadir = self.proxy.datadir
+                if not datadir or not os.path.isdir(datadir):
+                    return None
+                # With the pipeline, flush() does the fsync()
+                self.generic[test] = ResultLog(test, datadir,
+                                               self.proxy.datadir_touch,
+                                               SPLIT_INTERVAL,
+                                               SPLIT_NUM_FILES + 1,
+                                               not self.proxy.pipeline)
+            return self.generic[test]
+        finally:
+            self.lock.release()
 
     def store_generic(self, test, results):
         """ Store the results of a generic test """
+        result_log = self._result_log(test)
+        if not result_log:
+            raise RuntimeError('backend_neubot: datadir not initialized')
+        result_log.append(results)
 
-        components = [ "%s.pickle" % test ]
-        fullpath = self.proxy.datadir_touch(components)
-
-        # Load
-        if not test in self.generic:
-            filep = open(fullpath, "rb")
-            content = filep.read()
-            filep.close()
-            if content:
-                self.generic[test] = pickle.loads(content)
-            else:
-                self.generic[test] = []
-
-        # Rotate
-        if len(self.generic[test]) >= SPLIT_INTERVAL:
-
-            tmppath = fullpath + "." + str(SPLIT_NUM_FILES)
-            if os.path.isfile(tmppath):
-                os.unlink(tmppath)
-
-            for index in range(SPLIT_NUM_FILES, 0, -1):
-                srcpath = fullpath + "." + str(index - 1)
-                if not os.path.isfile(srcpath):
-                    continue
-                destpath = fullpath + "." + str(index)
-                os.rename(srcpath, destpath)
-
-            tmppath = fullpath + ".0"
-            filep = open(tmppath, "wb")
-            pickle.dump(self.generic[test], filep)
-            filep.close()
-            self.generic[test] = []
-
-        # Write
-        self.generic[test].append(results)
-        filep = open(fullpath, "wb")
-        pickle.dump(self.generic[test], filep)
-        filep.close()
+    def flush(self):
+        ''' Make sure that the stored results are on disk '''
+        for result_log in list(self.generic.values()):
+            result_log.sync()
 
     def walk_generic(self, test, index):
         """ Walk over the results of a generic test """
-
-        filename = "%s.pickle" % test
-        if index != None:
-            filename += "." + str(int(index))
-
-        fullpath = utils_path.append(self.proxy.datadir, filename, False)
-        if not fullpath:
+        result_log = self._result_log(test)
+        if not result_log:
             return []
+        return result_log.walk(index)
 
-        if not os.path.isfile(fullpath):
+    def walk_generic_range(self, test, since, until):
+        """ Walk over the results of a generic test in the
+            given time range, newest first """
+        result_log = self._result_log(test)
+        if not result_log:
             return []
-
-        filep = open(fullpath, "rb")
-        content = filep.read()
-        filep.close()
-
-        if not content:
-            return []
-
-        return pickle.loads(content)
+        return result_log.iter_range(since, until)
 
     def datadir_init(self, uname=None, datadir=None):
         ''' Initialize datadir (if needed) '''
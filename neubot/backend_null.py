@@ -44,5 +44,35 @@ class BackendNull(object):
     def walk_generic(self, test, index):
         """ Walk over the results of a generic test """
 
+    def flush(self):
+        ''' Make sure that the stored results are on disk '''
+
+    #
+    # Backends that cannot seek to a time range emulate it walking
+    # over the results by index.  Note that we assume that results
+    # are sorted by timestamp.
+    #
+    def walk_generic_range(self, test, since, until):
+        """ Walk over the results of a generic test in the
+            given time range, newest first """
+        lst = []
+        indexes = [None]
+        indexes.extend(range(16))
+        for index in indexes:
+            tmp = self.walk_generic(test, index)
+            if not tmp:
+                break
+            found_start = False
+            for elem in reversed(tmp):
+                if until >= 0 and elem["timestamp"] > until:
+                    continue
+                if since >= 0 and elem["timestamp"] < since:
+                    found_start = True
+                    break
+                lst.append(elem)
+            if found_start:
+                break
+        return lst
+
     def datadir_init(self, uname=None, datadir=None):
         ''' Initialize datadir (if needed) '''
@@ -0,0 +1,203 @@
+# neubot/backend_pipeline.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Off-loop storage pipeline '''
+
+#
+# The server saves results while handling /collect requests, and so,
+# whichever the backend, the sqlite commit, the fsync or the gzip write
+# used to block the poller loop, and with it the tests of the other
+# clients, which saw the delay as a latency spike.
+#
+# With the pipeline, the backend proxy copies the result and queues
+# it, and a storage thread invokes the real backend.  The queue is
+# bounded: when it is full, the poller thread waits for the storage
+# thread to catch up, because we prefer to slow down everyone rather
+# than to lose results.  The storage thread asks the backend to flush
+# the stored results every FLUSH_INTERVAL seconds, or as soon as there
+# are FLUSH_RECORDS of them, and then it tells the poller thread that
+# they are durable writing into a self-pipe.
+#
+# The poller and the logger are not thread safe (the log handlers may
+# write into the log streaming connections, see log.py), so neither
+# the storage thread nor the backend methods it invokes may use them.
+# The outcome of each store is reported and logged by the poller
+# thread, and the messages that the backend methods log on the
+# storage thread are intercepted by a filter on the root logger (we
+# only use the root logger) and replayed on the poller thread.
+#
+
+import atexit
+import collections
+import copy
+import logging
+import threading
+import time
+import traceback
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from neubot.wakeup_pipe import WakeupPipe
+
+# Maximum number of queued results
+MAXQUEUE = 1024
+
+# Flush every FLUSH_INTERVAL seconds or FLUSH_RECORDS records
+FLUSH_INTERVAL = 1.0
+FLUSH_RECORDS = 64
+
+# How long we wait for the storage thread at exit
+EXIT_TIMEOUT = 10.0
+
+class StoragePipeline(object):
+
+    ''' Off-loop storage pipeline '''
+
+    def __init__(self, proxy, poller, maxqueue=MAXQUEUE,
+                 flush_interval=FLUSH_INTERVAL,
+                 flush_records=FLUSH_RECORDS):
+        ''' Initialize the pipeline that stores results using the
+            backend of @proxy and acknowledges them on @poller '''
+        self.proxy = proxy
+        self.poller = poller
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.queue = queue.Queue(maxqueue)
+        self.acks = collections.deque()
+        self.pipe = None
+        self.thread = None
+        self.records = collections.deque()
+        self.queued = 0
+        self.stored = 0
+        self.failed = 0
+        self.waited = 0
+
+    def submit(self, method, *args):
+        ''' Queue the invocation of backend @method '''
+        if not self.thread:
+            self._start()
+        # The caller may modify the result after we return
+        item = (method, copy.deepcopy(args))
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            logging.warning('backend_pipeline: queue full, waiting')
+            self.waited += 1
+            self.queue.put(item)
+        self.queued += 1
+
+    def _start(self):
+        ''' Start the storage thread '''
+        self.pipe = WakeupPipe(self.poller, self._acknowledged)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        logging.getLogger().addFilter(self)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def filter(self, record):
+        ''' Defer the messages logged by the storage thread '''
+        if threading.currentThread() is not self.thread:
+            return True
+        self.records.append(record)
+        return False
+
+    def close(self):
+        ''' Store the queued results and stop the storage thread '''
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join(EXIT_TIMEOUT)
+            if self.thread.isAlive():
+                logging.warning('backend_pipeline: storage thread is stuck')
+                return
+            self.thread = None
+            logging.getLogger().removeFilter(self)
+            self._acknowledged()
+            self.pipe.close()
+            self.pipe = None
+
+    def _acknowledged(self):
+        ''' Process the acknowledgements (poller thread) '''
+        while self.records:
+            logging.getLogger().handle(self.records.popleft())
+        while self.acks:
+            method, error = self.acks.popleft()
+            if error:
+                self.failed += 1
+                logging.error('backend_pipeline: %s failed: %s',
+                              method, error)
+            else:
+                self.stored += 1
+
+    def _run(self):
+        ''' Main loop of the storage thread '''
+        done, deadline = [], None
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+            try:
+                item = self.queue.get(True, timeout)
+            except queue.Empty:
+                item = ()
+            if item:
+                done.append((item[0], self._call(item[0], item[1])))
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+            if done and (item is None or len(done) >= self.flush_records
+                         or time.time() >= deadline):
+                self._flush(done)
+                done, deadline = [], None
+            if item is None:
+                break
+
+    def _call(self, method, args):
+        ''' Invoke backend @method and returns the error or None '''
+        try:
+            getattr(self.proxy.backend, method)(*args)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            return traceback.format_exc()
+        return None
+
+    def _flush(self, done):
+        ''' Flush the backend and acknowledge the @done stores '''
+        error = self._call('flush', ())
+        for method, result in done:
+            self.acks.append((method, result or error))
+        self.pipe.wakeup()
+
+    def snap(self, data):
+        ''' Take a snapshot of the pipeline state '''
+        data['storage'] = {
+                           'failed': self.failed,
+                           'pending': self.queued - self.stored -
+                                      self.failed,
+                           'queued': self.queued,
+                           'stored': self.stored,
+                           'waited': self.waited,
+                          }
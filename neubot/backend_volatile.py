@@ -41,3 +41,10 @@ class BackendVolatile(BackendNull):
     def walk_generic(self, test, index):
         """ Walk over the results of a generic test """
         return self.generic.get(test, [])
+
+    def walk_generic_range(self, test, since, until):
+        """ Walk over the results of a generic test in the
+            given time range, newest first """
+        return [elem for elem in reversed(self.generic.get(test, []))
+                if (since < 0 or elem["timestamp"] >= since) and
+                   (until < 0 or elem["timestamp"] <= until)]
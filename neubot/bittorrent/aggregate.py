@@ -0,0 +1,79 @@
+# neubot/bittorrent/aggregate.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Aggregate download speed of parallel flows '''
+
+#
+# When the test uses many flows, we cannot just sum the speed
+# measured by each flow, because each flow measures over its own
+# time window and flows do not start and stop at the same time.
+# So, we measure the aggregate speed over the window in which all
+# the flows are downloading: the window opens when the last flow
+# receives its first piece and closes when the first flow is done,
+# and at both ends we sum bytes_recv_tot over all the streams.
+#
+
+from neubot import utils
+
+class AggregateSpeed(object):
+
+    ''' Aggregate download speed of parallel flows '''
+
+    def __init__(self, count):
+        self.count = count
+        self.streams = []
+        self.begin_ticks = 0.0
+        self.begin_bytes = 0
+        self.speed = 0.0
+        self.complete = False
+
+    def _bytes_recv(self):
+        ''' Returns the total number of bytes received '''
+        return sum(stream.bytes_recv_tot for stream in self.streams)
+
+    def flow_started(self, stream):
+        ''' Invoked when a flow receives its first piece '''
+        self.streams.append(stream)
+        if len(self.streams) == self.count:
+            self.begin_ticks = utils.ticks()
+            self.begin_bytes = self._bytes_recv()
+
+    def flow_stopped(self, stream):
+        ''' Invoked when a flow has finished downloading '''
+        if self.complete or not self.begin_ticks:
+            return
+        self.complete = True
+        elapsed = utils.ticks() - self.begin_ticks
+        if elapsed > 0:
+            self.speed = (self._bytes_recv() - self.begin_bytes) / elapsed
+
+    def get_speed(self, speeds):
+        '''
+         Returns the aggregate speed or, if we could not measure it,
+         e.g. because a flow stopped before the others started, the
+         sum of the per-flow @speeds.  With a single flow, returns
+         the speed of that flow, as in the single flow test.
+        '''
+        if self.count > 1 and self.speed > 0:
+            return self.speed
+        return sum(speeds)
@@ -16,15 +16,32 @@
 #
 
 import array
+import binascii
+import os
 import random
+import re
 
-counts = []
-for i in xrange(256):
-    t = 0
-    for j in xrange(8):
-        t = t + ((i >> j) & 1)
-    counts.append(chr(t))
-counts = ''.join(counts)
+#
+# Bulk operations convert the bitfield into a Python long, with
+# the first piece in the most significant bit, so that AND, ANDNOT
+# and population count run over whole machine words in C rather
+# than over single bits in Python.
+#
+
+def _tolong(bitstring):
+    ''' Converts a bitstring to a long '''
+    if not bitstring:
+        return 0L
+    return long(binascii.hexlify(bitstring), 16)
+
+def _fromlong(value, numbytes):
+    ''' Converts a long to a bitstring of @numbytes bytes '''
+    hexstring = '%x' % value
+    return binascii.unhexlify(hexstring.zfill(2 * numbytes))
+
+def _popcount(value):
+    ''' Returns the number of bits set in @value '''
+    return bin(value).count('1')
 
 class Bitfield(object):
     def __init__(self, length, bitstring=None):
@@ -46,8 +63,7 @@ class Bitfield(object):
             else:
                 if len(bitstring) != rlen:
                     raise ValueError("%s != %s" % (len(bitstring), rlen))
-            self.numfalse = length - sum(array.array('B',
-              bitstring.translate(counts)))
+            self.numfalse = length - _popcount(_tolong(bitstring))
             if self.numfalse != 0:
                 self.bits = array.array('B', bitstring)
             else:
@@ -83,6 +99,29 @@ class Bitfield(object):
         else:
             return self.bits.tostring()
 
+    def tolong(self):
+        ''' Returns the bitfield as a long '''
+        return _tolong(str(self))
+
+    def _fromlong(self, value):
+        ''' Returns a new bitfield of the same length from a long '''
+        return Bitfield(self.length, _fromlong(value, (self.length + 7) >> 3))
+
+    def __and__(self, other):
+        if self.length != other.length:
+            raise ValueError("%s != %s" % (self.length, other.length))
+        return self._fromlong(self.tolong() & other.tolong())
+
+    def andnot(self, other):
+        ''' Returns the bits set in self and not set in other '''
+        if self.length != other.length:
+            raise ValueError("%s != %s" % (self.length, other.length))
+        return self._fromlong(self.tolong() & ~other.tolong())
+
+    def count(self):
+        ''' Returns the number of bits set '''
+        return self.length - self.numfalse
+
     def __getstate__(self):
         d = {}
         d['length'] = self.length
@@ -92,9 +131,55 @@ class Bitfield(object):
     def __setstate__(self, d):
         Bitfield.__init__(self, d['length'], d['s'])
 
+# Maps a random byte to either zero or 0xFF with equal probability
+HALF = ''.join([chr(0)] * 128 + [chr(0xFF)] * 128)
+
 def make_bitfield(numpieces):
-    bitfield = Bitfield(numpieces)
-    length = len(bitfield.bits)
-    for idx in random.sample(range(length), int(length/2)):
-        bitfield.bits[idx] = 255
+    ''' Make a bitfield where about half of the bytes are set '''
+    rlen, extra = divmod(numpieces, 8)
+    bitstring = os.urandom(rlen).translate(HALF)
+    if extra and random.random() < 0.5:
+        bitstring += chr(0xFF << (8 - extra) & 0xFF)
+    elif extra:
+        bitstring += chr(0)
+    bitfield = Bitfield(numpieces, bitstring)
+    #
+    # Code like sched_idx() used to peek at .bits, which is None
+    # when all the bits are set, so make sure it exists.
+    #
+    if bitfield.bits is None:
+        bitfield.bits = array.array('B', bitstring)
     return bitfield
+
+#
+# Yields the indexes of the bits set in @bitfield in random order.
+# While many bits are set we pick a random index and retry if it's
+# not set (or already picked), which takes few attempts.  When the
+# density becomes low we switch to shuffling the list of the bits
+# that are still set.  Either way, the cost is O(1) amortized per
+# index and we never walk the whole bitfield in Python.
+#
+def iter_random(bitfield):
+    ''' Yields the bits set in @bitfield in random order '''
+
+    bits = array.array('B', str(bitfield))
+    length = len(bitfield)
+    left = _popcount(_tolong(bits.tostring()))
+
+    while left > 0 and left * 16 >= length:
+        index = random.randrange(length)
+        pos, mask = index >> 3, 128 >> (index & 7)
+        if bits[pos] & mask:
+            bits[pos] &= ~mask
+            left -= 1
+            yield index
+
+    vector = []
+    for match in re.finditer('[^\x00]', bits.tostring()):
+        pos = match.start()
+        for shift in range(8):
+            if bits[pos] & 128 >> shift:
+                vector.append((pos << 3) + shift)
+    random.shuffle(vector)
+    for index in vector:
+        yield index
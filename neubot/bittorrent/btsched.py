@@ -22,29 +22,22 @@
 
 ''' BitTorrent requests scheduler '''
 
-import random
+from neubot.bittorrent.bitfield import iter_random
 
 #
 # Given our bitfield and peer's bitfield, this generator
 # returns all the indexes of the pieces we're missing and
 # that the peer has.
-# Note that we walk our bitmap in random order so the list
+# Note that we pick the pieces in random order so the list
 # of requested pieces is not monotonic.
 #
 def sched_idx(bitfield, peer_bitfield):
 
     ''' Schedules the next index '''
 
-    assert(len(bitfield.bits) == len(peer_bitfield.bits))
-    vector = range(len(bitfield.bits))
-    random.shuffle(vector)
-    for index in vector:
-        if not bitfield.bits[index] and peer_bitfield.bits[index]:
-            idx = index << 3
-            kvec = range(8)
-            random.shuffle(kvec)
-            for k in kvec:
-                yield idx + k
+    assert(len(bitfield) == len(peer_bitfield))
+    for index in iter_random(peer_bitfield.andnot(bitfield)):
+        yield index
 
 #
 # Given our bitfield, the peer's bitfield, the number of bytes
@@ -54,13 +47,18 @@ def sched_idx(bitfield, peer_bitfield):
 # Note that there is an initial burst whose goal is to try to
 # fill the pipeline between us and the peer, in order to emulate
 # a continuous transfer of a huge file.
+# By default the burst is one third of the target bytes, but the
+# caller can pass a smaller one, e.g. the size of the request
+# window, and we will add it to the target bytes.
 #
-def sched_req(bitfield, peer_bitfield, targetbytes, piecelen, blocklen):
+def sched_req(bitfield, peer_bitfield, targetbytes, piecelen, blocklen,
+              burstlen=None):
 
     ''' Schedules the next list of pieces we must request '''
 
     # Adapt initial burst to the channel
-    burstlen = int(targetbytes/3)
+    if burstlen is None:
+        burstlen = int(targetbytes/3)
     total = burstlen + targetbytes
 
     # Create next-piece-index generator
@@ -78,6 +76,22 @@ def sched_req(bitfield, peer_bitfield, targetbytes, piecelen, blocklen):
         else:
             yield [req]
 
+#
+# Returns the number of blocks of size `blocklen` that we should
+# keep outstanding to fill the pipe between us and the peer, given
+# the round trip time `rtt` and the expected `speed` in bytes per
+# second.  We request twice the bandwidth-delay product because
+# each block is a sizeable fraction of a small BDP, and we bound
+# the result so that a wrong estimate does no harm.
+#
+def sched_window(rtt, speed, blocklen, minimum, maximum):
+
+    ''' Returns the size of the request window '''
+
+    bdp = 2 * rtt * speed
+    window = int((bdp + blocklen - 1) // blocklen)
+    return max(minimum, min(window, maximum))
+
 #
 # Generator that returns BitTorrent REQUESTs parameters
 # to request up to `total` bytes.  Each piece has size
@@ -31,6 +31,7 @@ import hashlib
 import sys
 import logging
 
+from neubot.bittorrent.aggregate import AggregateSpeed
 from neubot.bittorrent.peer import PeerNeubot
 from neubot.http.client import ClientHTTP
 from neubot.http.message import Message
@@ -63,6 +64,8 @@ class BitTorrentClient(ClientHTTP):
         self.success = False
         self.my_side = {}
         self.final_state = False
+        self.aggregate = None
+        self.flows = []
 
     def connect_uri(self, uri=None, count=None):
         if not uri:
@@ -83,7 +86,8 @@ class BitTorrentClient(ClientHTTP):
 
         request = Message()
         body = json.dumps({"test_version": CONFIG['bittorrent_test_version'],
-                           "target_bytes": self.conf['bittorrent.bytes.up']})
+                           "target_bytes": self.conf['bittorrent.bytes.up'],
+                           "streams": self.conf['bittorrent.streams']})
         request.compose(method="POST", pathquery="/negotiate/bittorrent",
           host=self.host_header, body=body, mimetype="application/json")
         request["authorization"] = self.conf.get("_authorization", "")
@@ -116,14 +120,28 @@ class BitTorrentClient(ClientHTTP):
             logging.debug("* My ID: %s", sha1.hexdigest())
             self.http_stream = stream
             self.negotiating = False
-            peer = PeerNeubot(self.poller)
-            peer.version = CONFIG['bittorrent_test_version']
-            peer.complete = self.peer_test_complete
-            peer.connection_lost = self.peer_connection_lost
-            peer.connection_failed = self.peer_connection_failed
-            peer.configure(self.conf)
-            peer.connect((self.http_stream.peername[0],
-                          self.conf["bittorrent.port"]))
+
+            #
+            # In parallel mode we run one peer per flow, and each
+            # flow is given its share of the target bytes.  All the
+            # flows use the same identifier, which is how the server
+            # knows they belong to the same negotiated session.
+            #
+            count = self.conf["bittorrent.streams"]
+            self.aggregate = AggregateSpeed(count)
+            for _ in range(count):
+                peer = PeerNeubot(self.poller)
+                peer.version = CONFIG['bittorrent_test_version']
+                peer.complete = self.peer_test_complete
+                peer.connection_lost = self.peer_connection_lost
+                peer.connection_failed = self.peer_connection_failed
+                peer.configure(self.conf)
+                if count > 1:
+                    peer.target_bytes = max(1, peer.target_bytes // count)
+                    peer.make_sched()
+                peer.aggregate = self.aggregate
+                peer.connect((self.http_stream.peername[0],
+                              self.conf["bittorrent.port"]))
 
     def peer_connection_failed(self, connector, exception):
         logging.warning('bittorrent_client: test connect() failed')
@@ -132,6 +150,9 @@ class BitTorrentClient(ClientHTTP):
         stream.close()
 
     def peer_connection_lost(self, stream):
+        # Flows close their connection as soon as they are done
+        if stream.parent in [flow[0] for flow in self.flows]:
+            return
         if not self.success:
             logging.warning('bittorrent_client: test connection lost')
             stream = self.http_stream
@@ -139,11 +160,26 @@ class BitTorrentClient(ClientHTTP):
             stream.close()
 
     def peer_test_complete(self, stream, download_speed, rtt, target_bytes):
+
+        # Wait for all the flows to complete
+        self.flows.append((stream.parent, download_speed, rtt, target_bytes))
+        if len(self.flows) < self.conf["bittorrent.streams"]:
+            return
+
         self.success = True
         stream = self.http_stream
 
+        speeds = [flow[1] for flow in self.flows]
+        download_speed = self.aggregate.get_speed(speeds)
+        rtt = self.flows[0][2]
+        window = self.flows[0][0].window
+
         # Update the downstream channel estimate
-        estimate.DOWNLOAD = target_bytes
+        estimate.DOWNLOAD = sum(flow[3] for flow in self.flows)
+
+        if len(self.flows) > 1:
+            STATE.update("test_download",
+                         utils.speed_formatter(download_speed))
 
         self.my_side = {
             # The server will override our timestamp
@@ -167,6 +203,13 @@ class BitTorrentClient(ClientHTTP):
 
             # Test version (added Neubot 0.4.12)
             'test_version': CONFIG['bittorrent_test_version'],
+
+            # Request window of test version 3 (added Neubot 0.5.0)
+            'request_window': window,
+
+            # Parallel flows (added Neubot 0.5.0)
+            'streams': len(self.flows),
+            'download_speeds': json.dumps(speeds),
         }
 
         logging.info("BitTorrent: collecting in progress...")
@@ -196,6 +239,8 @@ class BitTorrentClient(ClientHTTP):
             #
             m = json.loads(response.body.read())
             self.my_side["upload_speed"] = m["upload_speed"]
+            self.my_side["upload_speeds"] = m.get("upload_speeds",
+              json.dumps([m["upload_speed"]]))
 
             upload = utils.speed_formatter(m["upload_speed"])
             STATE.update("test_progress", "100%", publish=False)
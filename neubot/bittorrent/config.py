@@ -42,6 +42,10 @@ PIECE_LEN = 1 << 17
 
 MAXMESSAGE = 1 << 18
 
+# Bounds of the request window of test version 3
+MINWINDOW = 2
+MAXWINDOW = 64
+
 PROPERTIES = (
     ('bittorrent.address', '', 'Address to listen/connect to ("" = auto)'),
     ('bittorrent.bytes.down', 0, 'Num of bytes to download (0 = auto)'),
@@ -54,7 +58,9 @@ PROPERTIES = (
     ('bittorrent.numpieces', NUMPIECES, 'Num of pieces in bitfield'),
     ('bittorrent.piece_len', PIECE_LEN, 'Length of each piece'),
     ('bittorrent.port', 6881, 'Port to listen/connect to (0 = auto)'),
+    ('bittorrent.streams', 1, 'Num of parallel flows'),
     ('bittorrent.watchdog', WATCHDOG, 'Maximum test run-time in seconds'),
+    ('bittorrent.window', 0, 'Num of outstanding requests (0 = auto)'),
 )
 
 CONFIG.register_defaults_helper(PROPERTIES)
@@ -37,6 +37,7 @@ if __name__ == '__main__':
 from neubot.bittorrent.bitfield import Bitfield
 from neubot.bittorrent.bitfield import make_bitfield
 from neubot.bittorrent.btsched import sched_req
+from neubot.bittorrent.btsched import sched_window
 from neubot.bittorrent.stream import StreamBitTorrent
 from neubot.net.poller import POLLER
 from neubot.net.stream import StreamHandler
@@ -44,12 +45,15 @@ from neubot.net.stream import StreamHandler
 from neubot.bittorrent import config
 from neubot.config import CONFIG
 from neubot.state import STATE
+from neubot.utils_random import ARENA
 
 from neubot import utils
 from neubot import utils_net
 from neubot import utils_rc
 
 # Constants
+from neubot.bittorrent.config import MAXWINDOW
+from neubot.bittorrent.config import MINWINDOW
 from neubot.bittorrent.config import PIECE_LEN
 
 LO_THRESH = 3
@@ -80,6 +84,10 @@ class PeerNeubot(StreamHandler):
         self.rtt = 0
         self.version = 1
         self.begin_upload = 0.0
+        self.window = 0
+        self.request_ticks = 0.0
+        self.sched_bytes = 0
+        self.aggregate = None
 
     def configure(self, conf):
         StreamHandler.configure(self, conf)
@@ -90,10 +98,41 @@ class PeerNeubot(StreamHandler):
         self.target_bytes = conf["bittorrent.bytes.down"]
         self.make_sched()
 
-    def make_sched(self):
+    def make_sched(self, burstlen=None, target_bytes=None):
+        if target_bytes is None:
+            target_bytes = self.target_bytes
+        self.sched_bytes = target_bytes
         self.sched_req = sched_req(self.bitfield, self.peer_bitfield,
-          self.target_bytes, self.conf["bittorrent.piece_len"],
-          self.conf["bittorrent.piece_len"])
+          target_bytes, self.conf["bittorrent.piece_len"],
+          self.conf["bittorrent.piece_len"], burstlen)
+
+    def compute_window(self, rtt):
+        ''' Returns the request window for test version 3 '''
+        window = self.conf.get("bittorrent.window", 0)
+        if window > 0:
+            return window
+        #
+        # The target bytes are computed (see estimate.py) so that
+        # the test runs for about TARGET seconds, therefore they
+        # also give us an estimate of the download speed.
+        #
+        return sched_window(rtt, self.target_bytes / float(TARGET),
+          self.conf["bittorrent.piece_len"], MINWINDOW, MAXWINDOW)
+
+    def send_requests(self, stream):
+        ''' Send the next requests scheduled by sched_req '''
+        try:
+            vector = self.sched_req.next()
+        except StopIteration:
+            #
+            # The schedule is finite, but the test is time-driven,
+            # so make a new one.  Double its size each time, since
+            # making a schedule is not cheap.
+            #
+            self.make_sched(0, 2 * self.sched_bytes)
+            vector = self.sched_req.next()
+        for index, begin, length in vector:
+            stream.send_request(index, begin, length)
 
     def connect(self, endpoint, count=1):
         self.connector_side = True
@@ -190,14 +229,7 @@ class PeerNeubot(StreamHandler):
         if self.version == 2:
             return
 
-        #
-        # TODO Here we should use the random block
-        # generator but before we do that we should
-        # also make sure it does not slow down the
-        # bittorrent test.
-        #
-        block = chr(random.randint(32, 126)) * length
-        stream.send_piece(index, begin, block)
+        stream.send_piece(index, begin, ARENA.view(length))
 
     def send_complete(self, stream):
         ''' Invoked when the send queue is empty '''
@@ -218,15 +250,8 @@ class PeerNeubot(StreamHandler):
             if self.version == 3:
                 return
 
-            #
-            # TODO Here we should use the random block
-            # generator but before we do that we should
-            # also make sure it does not slow down the
-            # bittorrent test.
-            #
-            block = chr(random.randint(32, 126)) * PIECE_LEN
             index = random.randrange(self.numpieces)
-            stream.send_piece(index, 0, block)
+            stream.send_piece(index, 0, ARENA.view(PIECE_LEN))
 
     def got_interested(self, stream):
         if self.connector_side and self.state != SENT_NOT_INTERESTED:
@@ -286,6 +311,16 @@ class PeerNeubot(StreamHandler):
             xfered = stream.bytes_recv_tot - self.saved_bytes
             elapsed = utils.ticks() - self.saved_ticks
             self.dload_speed = xfered/elapsed
+            if self.aggregate:
+                self.aggregate.flow_stopped(stream)
+
+            #
+            # With version 3 the next test uses target bytes to
+            # size the request window, so keep them in sync with
+            # the speed we have just measured.
+            #
+            if self.version == 3:
+                self.target_bytes = int(self.dload_speed * TARGET)
 
             # Properly terminate download
             self.state = SENT_NOT_INTERESTED
@@ -318,11 +353,29 @@ class PeerNeubot(StreamHandler):
         else:
             self.state = DOWNLOADING
 
+            #
+            # With version 3 we keep a window of outstanding
+            # requests that is large enough to fill the pipe,
+            # and we send a new request each time a piece
+            # arrives.  The first burst of sched_req() is
+            # exactly one window of requests.
+            #
+            if self.version == 3:
+                logging.info('BitTorrent: download in progress...')
+                self.window = self.compute_window(self.rtt)
+                logging.debug('BitTorrent: request window: %d',
+                              self.window)
+                self.make_sched(self.window *
+                                self.conf["bittorrent.piece_len"])
+                self.request_ticks = utils.ticks()
+                self.send_requests(stream)
+                return
+
             #
             # We just need to send one request to tell
             # the peer we would like the download to start.
             #
-            if self.version >= 2:
+            if self.version == 2:
                 logging.info('BitTorrent: download in progress...')
                 index = random.randrange(self.numpieces)
                 stream.send_request(index, 0, PIECE_LEN)
@@ -362,6 +415,29 @@ class PeerNeubot(StreamHandler):
         if not self.saved_ticks:
             self.saved_bytes = stream.bytes_recv_tot
             self.saved_ticks = utils.ticks()
+            if self.aggregate and self.version >= 2:
+                self.aggregate.flow_started(stream)
+
+        #
+        # With version 3 each piece makes room in the window for
+        # another request.  When we don't know the RTT, i.e. on
+        # the listener side, we estimate it using the first piece
+        # and, if needed, we grow the window accordingly.
+        #
+        if self.version == 3:
+            count = 1
+            if not self.rtt and self.request_ticks:
+                rtt = utils.ticks() - self.request_ticks
+                self.request_ticks = 0.0
+                window = self.compute_window(rtt)
+                if window > self.window:
+                    count += window - self.window
+                    self.window = window
+                    logging.debug('BitTorrent: request window: %d',
+                                  self.window)
+            for _ in range(count):
+                self.send_requests(stream)
+            return
 
         #
         # The download is driven by the sender and
@@ -369,8 +445,8 @@ class PeerNeubot(StreamHandler):
         # Periodically send some requests to the other
         # end, with probability 10%.
         #
-        if self.version >= 2:
-            if self.version == 3 or random.random() < 0.1:
+        if self.version == 2:
+            if random.random() < 0.1:
                 index = random.randrange(self.numpieces)
                 stream.send_request(index, 0, PIECE_LEN)
             return
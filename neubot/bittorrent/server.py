@@ -21,6 +21,7 @@
 #
 
 from neubot.negotiate.server_bittorrent import NEGOTIATE_SERVER_BITTORRENT
+from neubot.bittorrent.aggregate import AggregateSpeed
 from neubot.bittorrent.peer import PeerNeubot
 from neubot.bittorrent.config import _random_bytes
 
@@ -53,16 +54,28 @@ class ServerPeer(PeerNeubot):
         if not stream.id in NEGOTIATE_SERVER_BITTORRENT.peers:
             raise RuntimeError("Unauthorized peer")
 
+        #
+        # The peer is authorized to open as many flows as it has
+        # negotiated, and all of them share the same identifier
+        # and measure the aggregate speed together.
+        #
+        record = NEGOTIATE_SERVER_BITTORRENT.peers[stream.id]
+        record["connected"] += 1
+        if record["connected"] > record["streams"]:
+            raise RuntimeError("Too many flows")
+        if not "aggregate" in record:
+            record["aggregate"] = AggregateSpeed(record["streams"])
+        self.aggregate = record["aggregate"]
+
         #
         # Override the number of bytes using information passed
         # from the peer and regenerate the schedule so that we
-        # actually transfer that number of bytes.
+        # actually transfer that number of bytes.  Each flow
+        # transfers its share of the bytes.
         # Override the test_version information as well.
         #
-        self.target_bytes = NEGOTIATE_SERVER_BITTORRENT.peers[stream.id][
-                                                   "target_bytes"]
-        self.version = NEGOTIATE_SERVER_BITTORRENT.peers[stream.id][
-                                                   "test_version"]
+        self.target_bytes = record["target_bytes"] // record["streams"]
+        self.version = record["test_version"]
         self.make_sched()
 
         PeerNeubot.connection_ready(self, stream)
@@ -70,8 +83,12 @@ class ServerPeer(PeerNeubot):
     def complete(self, stream, speed, rtt, target_bytes):
         # Avoid leak: do not add an entry if not needed
         if stream.id in NEGOTIATE_SERVER_BITTORRENT.peers:
-            NEGOTIATE_SERVER_BITTORRENT.peers[stream.id] = {
-                                     "upload_speed": speed,
-                                     "timestamp": utils.timestamp(),
-                                     "target_bytes": target_bytes,
-                                    }
+            record = NEGOTIATE_SERVER_BITTORRENT.peers[stream.id]
+            record["flows"].append((speed, target_bytes))
+            if len(record["flows"]) < record["streams"]:
+                return
+            speeds = [flow[0] for flow in record["flows"]]
+            record["upload_speeds"] = speeds
+            record["upload_speed"] = self.aggregate.get_speed(speeds)
+            record["timestamp"] = utils.timestamp()
+            record["target_bytes"] = sum(flow[1] for flow in record["flows"])
@@ -78,6 +78,7 @@ class StreamBitTorrent(Stream):
         self.count = 0
         self.id = None
         self.piece = None
+        self.recv_viewmode = True
 
     def connection_made(self):
         ''' Invoked when the connection is established '''
@@ -146,8 +147,14 @@ class StreamBitTorrent(Stream):
     def send_piece(self, index, begin, block):
         ''' Send the PIECE message '''
         logging.debug("> PIECE %d %d len=%d", index, begin, len(block))
-        self._send_message(struct.pack("!cII%ss" % len(block), PIECE,
-          index, begin, block))
+        #
+        # Queue the header and the block separately, so that the
+        # block, which typically is a view of a shared buffer, is
+        # not copied into a new string just to prepend the header.
+        #
+        self.start_send(struct.pack("!IcII", 9 + len(block), PIECE,
+                                    index, begin))
+        self.start_send(block)
 
     def _send_message(self, *msg_a):
         ''' Convenience function to send a message '''
@@ -164,59 +171,104 @@ class StreamBitTorrent(Stream):
         self.parent.send_complete(self)
 
     #
-    # We use three state variables in this loop: self.left is the
+    # We use four state variables in this loop: self.left is the
     # size left to read in the next message, self.count is the amount
-    # of bytes we've read so far, and self.buff contains a portion
-    # of the next message.
+    # of bytes we've read so far, self.buff contains a portion of the
+    # next message, and self.piece is not None while we are skipping
+    # the payload of a PIECE message.
+    #
+    # The stream is in `view` receive mode, therefore @s is a view
+    # of a shared receive buffer and we walk it using an offset,
+    # without creating intermediate views.  We copy only the bytes
+    # of the control messages, which are small, and the header of
+    # PIECE messages.  The payload of PIECE messages is just counted,
+    # because Neubot does not care about its content, and the parent
+    # is told the length of the block rather than the block itself.
     #
     def recv_complete(self, s):
 
         ''' Invoked when recv() completes '''
 
-        while s and not (self.close_pending or self.close_complete):
+        offset, length = 0, len(s)
 
-            # If we don't know the length then read it
-            if self.left == 0:
-                amt = min(len(s), 4 - self.count)
-                self.buff.append(s[:amt])
-                s = buffer(s, amt)
-                self.count += amt
+        while offset < length and not (self.close_pending or
+                                       self.close_complete):
 
-                if self.count == 4:
+            # Skip the payload of PIECE messages
+            if self.piece:
+                amt = min(length - offset, self.left)
+                offset += amt
+                self.left -= amt
+
+                if self.left == 0:
+                    index, begin, count = self.piece
+                    self.piece = None
+                    logging.debug("< PIECE %d %d len=%d", index, begin, count)
+                    self.parent.got_piece(self, index, begin, count)
+
+            # If we don't know the length then read it
+            elif self.left == 0:
+                if self.count == 0 and length - offset >= 4:
+                    self.left = struct.unpack_from("!I", s, offset)[0]
+                    offset += 4
+                else:
+                    amt = min(length - offset, 4 - self.count)
+                    self.buff.append(s[offset:offset + amt])
+                    offset += amt
+                    self.count += amt
+                    if self.count < 4:
+                        continue
                     self.left = toint("".join(self.buff))
-                    if self.left == 0:
-                        logging.debug("< KEEPALIVE")
-                    elif self.left > MAXMESSAGE:
-                        raise RuntimeError('Message too big')
                     del self.buff[:]
                     self.count = 0
 
-                elif self.count > 4:
-                    raise RuntimeError("Invalid self.count")
+                if self.left == 0:
+                    logging.debug("< KEEPALIVE")
+                elif self.left > MAXMESSAGE:
+                    raise RuntimeError('Message too big')
 
             # Bufferize and pass upstream messages
-            elif self.left > 0:
-                amt = min(len(s), self.left)
-                self.buff.append(s[:amt])
-                s = buffer(s, amt)
+            else:
+                want = self.left
+
+                # Bufferize just the header of PIECE messages
+                if self.complete and self.count + self.left > 9:
+                    if self.buff:
+                        first = self.buff[0][:1]
+                    else:
+                        first = s[offset]
+                    if first == PIECE:
+                        want = 9 - self.count
+
+                amt = min(length - offset, want)
+                self.buff.append(s[offset:offset + amt])
+                offset += amt
                 self.left -= amt
                 self.count += amt
 
                 if self.left == 0:
-                    self._got_message("".join(self.buff))
+                    message = "".join(self.buff)
                     del self.buff[:]
                     self.count = 0
+                    self._got_message(message)
 
-                elif self.left < 0:
-                    raise RuntimeError("Invalid self.left")
-
-            # Something's wrong
-            else:
-                raise RuntimeError("Invalid self.left")
+                elif amt == want and want < self.left + amt:
+                    header = "".join(self.buff)
+                    del self.buff[:]
+                    self.count = 0
+                    self._got_piece_header(header)
 
         if not (self.close_pending or self.close_complete):
             self.start_recv()
 
+    def _got_piece_header(self, header):
+        ''' Invoked when we receive the header of a PIECE message '''
+        self.got_anything = True
+        index, begin = struct.unpack("!xII", header)
+        if index >= self.parent.numpieces:
+            raise RuntimeError("PIECE: index out of bounds")
+        self.piece = index, begin, self.left
+
     def _got_message(self, message):
 
         ''' Invoked when we receive a complete message '''
@@ -297,12 +349,13 @@ class StreamBitTorrent(Stream):
 
         elif t == PIECE:
             n = len(message) - 9
-            i, a, b = struct.unpack("!xII%ss" % n, message)
+            i, a = struct.unpack("!xII", message[:9])
             logging.debug("< PIECE %d %d len=%d", i, a, n)
             if i >= self.parent.numpieces:
                 raise RuntimeError("PIECE: index out of bounds")
-            self.parent.got_piece(self, i, a, b)
+            self.parent.got_piece(self, i, a, n)
 
     def connection_lost(self, exception):
         ''' Invoked when the connection is lost '''
         del self.buff[:]
+        self.piece = None
@@ -48,6 +48,10 @@ class Brigade(object):
         self.brigade.append(octets)
         self.total += len(octets)
 
+    def unshare(self):
+        ''' Copy buckets so we don't reference borrowed buffers '''
+        self.brigade = deque(BYTES(bucket) for bucket in self.brigade)
+
     def skip(self, length):
         ''' Skip up to lenght bytes from brigade '''
         if self.total >= length:
@@ -96,3 +100,96 @@ class Brigade(object):
         self.brigade.appendleft(tmp)
         self.total += len(tmp)
         return EMPTY
+
+#
+# The RingBrigade keeps the buffered bytes in a single contiguous
+# buffer and a read offset, so getline() scans for the newline in
+# place and skip() and pullup() just move the offset forward, with
+# no per-call joins.  When nothing is buffered, bufferise() just
+# keeps a reference to the incoming bytes, so a protocol that pulls
+# up whole receive buffers (e.g. HTTP bodies) does not copy them.
+# Otherwise we append to a bytearray and we drop the consumed head
+# when it is larger than the unconsumed tail, so that the cost of
+# compacting is amortized.
+#
+# Like Brigade, it can hold the views passed by streams in view
+# receive mode until unshare() is called.
+#
+
+class RingBrigade(object):
+
+    ''' Contiguous bucket brigade '''
+
+    def __init__(self):
+        self.buffer = EMPTY
+        self.offset = 0
+        self.total = 0
+
+    def _consume(self, length):
+        ''' Move the offset length bytes forward '''
+        self.offset += length
+        self.total -= length
+        if self.total == 0:
+            self.buffer = EMPTY
+            self.offset = 0
+
+    def _own(self):
+        ''' Make sure the buffer is not a borrowed view '''
+        if not isinstance(self.buffer, (BYTES, bytearray)):
+            self.buffer = bytearray(six.buff(self.buffer, self.offset))
+            self.offset = 0
+        elif (isinstance(self.buffer, bytearray) and
+              self.offset > self.total):
+            del self.buffer[:self.offset]
+            self.offset = 0
+
+    def bufferise(self, octets):
+        ''' Bufferise incoming data '''
+        if not octets:
+            return
+        if not self.total:
+            self.buffer = octets
+            self.offset = 0
+        else:
+            if not isinstance(self.buffer, bytearray):
+                self.buffer = bytearray(six.buff(self.buffer, self.offset))
+                self.offset = 0
+            self._own()
+            self.buffer += octets
+        self.total += len(octets)
+
+    def unshare(self):
+        ''' Copy the buffer so we don't reference borrowed buffers '''
+        if self.total:
+            self._own()
+
+    def skip(self, length):
+        ''' Skip up to lenght bytes from brigade '''
+        if self.total >= length:
+            self._consume(length)
+            return 0
+        return length
+
+    def pullup(self, length):
+        ''' Pullup length bytes from brigade '''
+        if length <= 0 or self.total < length:
+            return EMPTY
+        if isinstance(self.buffer, BYTES):
+            retval = self.buffer[self.offset:self.offset + length]
+        else:
+            retval = BYTES(six.buff(self.buffer, self.offset, length))
+        self._consume(length)
+        return retval
+
+    def getline(self, maxline):
+        ''' Read line from brigade '''
+        if not self.total:
+            return EMPTY
+        self._own()
+        index = self.buffer.find(NEWLINE, self.offset,
+                                 self.offset + maxline)
+        if index >= 0:
+            return self.pullup(index + 1 - self.offset)
+        if self.total >= maxline:
+            raise RuntimeError('brigade: line too long')
+        return EMPTY
@@ -0,0 +1,70 @@
+# neubot/buffer_pool.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Pool of reusable receive buffers '''
+
+# Python3-ready: yes
+
+#
+# Streams in `view` receive mode recv_into() a buffer taken from
+# this pool and pass the protocol a view of the received bytes
+# (a buffer object with Python 2, a memoryview with Python 3).
+# The buffer goes back into the pool as soon as the protocol
+# callback returns, hence THE VIEW IS ONLY VALID DURING THE
+# CALLBACK and protocols that want to keep the bytes around
+# must copy them.
+#
+# Since Neubot is single threaded, typically there is just one
+# buffer in use at a time and it is reused by all the streams,
+# so there are no per-read allocations.  We allocate more than
+# one buffer only when a callback triggers another read, e.g.
+# when the client side of an SSL stream kicks off the handshake.
+#
+
+# Size of each buffer
+BUFSIZE = 1 << 18
+
+# Maximum number of idle buffers we keep around
+MAXIDLE = 4
+
+class BufferPool(object):
+
+    ''' Pool of reusable receive buffers '''
+
+    def __init__(self, bufsize=BUFSIZE, maxidle=MAXIDLE):
+        self.bufsize = bufsize
+        self.maxidle = maxidle
+        self.idle = []
+
+    def get(self):
+        ''' Get a buffer from the pool '''
+        if self.idle:
+            return self.idle.pop()
+        return bytearray(self.bufsize)
+
+    def put(self, buff):
+        ''' Return a buffer to the pool '''
+        if len(self.idle) < self.maxidle:
+            self.idle.append(buff)
+
+BUFFER_POOL = BufferPool()
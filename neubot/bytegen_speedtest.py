@@ -22,17 +22,25 @@
 
 ''' Generates bytes for the speedtest test '''
 
+import collections
 import getopt
 import sys
 
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
-from neubot.utils_random import RANDOMBLOCKS
+from neubot.utils_random import ARENA
 from neubot import utils
 
 PIECE_LEN = 262144
 
+#
+# Each chunk is the chunked encoding header, a fresh view of ARENA
+# at a random offset, and the trailing CRLF.  We return them as
+# separate pieces, so that the payload is never copied here, and
+# the stream gathers the small pieces with the data when sending.
+#
+
 class BytegenSpeedtest(object):
     ''' Bytes generator for speedtest '''
 
@@ -42,10 +50,13 @@ class BytegenSpeedtest(object):
         self.ticks = utils.ticks()
         self.closed = False
         self.piece_len = piece_len
+        self.pieces = collections.deque()
 
     def read(self, count=sys.maxint):
         ''' Read count bytes '''
 
+        if self.pieces:
+            return self.pieces.popleft()
         if self.closed:
             return ''
         if count < self.piece_len:
@@ -53,18 +64,17 @@ class BytegenSpeedtest(object):
 
         diff = utils.ticks() - self.ticks
         if diff < self.seconds:
-            data = RANDOMBLOCKS.get_block()[:self.piece_len]
-            length = '%x\r\n' % self.piece_len
-            vector = [ length, data, '\r\n' ]
-        else:
-            vector = [ '0\r\n', '\r\n' ]
-            self.closed = True
+            self.pieces.append(ARENA.view(self.piece_len))
+            self.pieces.append('\r\n')
+            return '%x\r\n' % self.piece_len
 
-        return ''.join(vector)
+        self.closed = True
+        return '0\r\n\r\n'
 
     def close(self):
         ''' Close  '''
         self.closed = True
+        self.pieces.clear()
 
 def main(args):
     ''' Main() function '''
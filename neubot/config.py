@@ -236,7 +236,7 @@ CONFIG.register_descriptions({
     "agent.master": "Set master server address",
     "agent.rendezvous": "Enable rendezvous client",
     "agent.use_syslog": "Force syslog usage in any case",
-    "bittorrent_test_version": "Version 1 is the old one, version 2 controls duration at the sender",
+    "bittorrent_test_version": "Version 1 is the old one, version 2 controls duration at the sender, version 3 also pipelines requests",
     "enabled": "Enable Neubot to perform automatic transmission tests",
     'verbose': 'Set to 1 to get more log messages',
     "prefer_ipv6": "Prefer IPv6 over IPv4 when resolving domain names",
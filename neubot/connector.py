@@ -25,31 +25,100 @@
 # Adapted from neubot/net/stream.py
 # Python3-ready: yes
 
-import collections
+#
+# We race connection attempts, following RFC 8305 (Happy Eyeballs).
+# The endpoint may be a space-separated list of addresses and each of
+# them may resolve to many IPv4 and IPv6 addresses.  We interleave the
+# addresses of the two families, starting with the preferred one, and
+# the addresses of the different endpoints, and we start a connection
+# attempt every ATTEMPT_DELAY seconds, or as soon as the previous one
+# fails, without waiting for the previous ones to fail.  The first
+# attempt that succeeds wins, the others are aborted, and the connect
+# time is the one measured by the winner.
+#
+
 import logging
+import socket
 
 from neubot.defer import Deferred
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
+from neubot.resolver import RESOLVER
 
 from neubot import utils_net
 from neubot import utils
 
-class Connector(Pollable):
+# Delay between connection attempts (as recommended by RFC 8305)
+ATTEMPT_DELAY = 0.25
 
-    ''' Pollable socket connector '''
+def interleave(first, second):
+    ''' Interleave two lists, starting from the first one '''
+    result = []
+    for index in range(max(len(first), len(second))):
+        if index < len(first):
+            result.append(first[index])
+        if index < len(second):
+            result.append(second[index])
+    return result
 
-    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra):
+def interleave_families(addrinfo, prefer_ipv6):
+    ''' Interleave IPv4 and IPv6 addresses in addrinfo '''
+    preferred = socket.AF_INET6 if prefer_ipv6 else socket.AF_INET
+    return interleave([ainfo for ainfo in addrinfo if ainfo[0] == preferred],
+                      [ainfo for ainfo in addrinfo if ainfo[0] != preferred])
+
+class ConnectAttempt(Pollable):
+
+    ''' A connection attempt '''
+
+    def __init__(self, connector, epnt, sock):
         Pollable.__init__(self)
+        self.connector = connector
+        self.epnt = epnt
+        self.sock = sock
+        self.timestamp = utils.ticks()
+        self.watchdog = 10
+        POLLER.set_writable(self)
+
+    def __repr__(self):
+        return str(self.epnt)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def handle_write(self):
+        POLLER.unset_writable(self)
+        if not utils_net.isconnected(self.epnt, self.sock):
+            self.connector.attempt_failed(self)
+            return
+        self.connector.attempt_succeeded(self, utils.ticks())
+
+    def handle_close(self):
+        self.connector.attempt_failed(self)
 
-        self.epnts = collections.deque()
+    def abort(self):
+        ''' Abort this attempt '''
+        POLLER.unset_writable(self)
+        self.sock.close()
+
+class Connector(object):
+
+    ''' Socket connector '''
+
+    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra):
         self.parent = parent
         self.prefer_ipv6 = prefer_ipv6
         self.sslconfig = sslconfig
         self.extra = extra
         self.sock = None
         self.timestamp = 0
-        self.watchdog = 10
+        self.winner = None
+
+        self.candidates = []
+        self.attempts = []
+        self.resolving = 0
+        self.timer = None
+        self.done = False
 
         self.aterror = Deferred()
         self.aterror.add_callback(self.parent.handle_connect_error)
@@ -57,14 +126,16 @@ class Connector(Pollable):
         # For logging purpose, save original endpoint
         self.endpoint = endpoint
 
+        epnts = []
         if " " in endpoint[0]:
             for address in endpoint[0].split():
-                tmp = (address.strip(), endpoint[1])
-                self.epnts.append(tmp)
+                epnts.append((address.strip(), endpoint[1]))
         else:
-            self.epnts.append(endpoint)
+            epnts.append(endpoint)
 
-        self._connect()
+        self.resolving = len(epnts)
+        for epnt in epnts:
+            RESOLVER.resolve(epnt, self._resolved)
 
     def __repr__(self):
         return str(self.endpoint)
@@ -73,48 +144,88 @@ class Connector(Pollable):
         ''' Register a cleanup function '''
         self.aterror.add_callback(func)
 
-    def _connection_failed(self):
-        ''' Failed to connect first available epnt '''
-        if self.sock:
-            POLLER.unset_writable(self)
-            self.sock = None  # MUST be below unset_writable()
-        if not self.epnts:
-            self.aterror.callback_each_np(self)
+    def _resolved(self, epnt, addrinfo):
+        ''' Add the addresses of epnt to the candidates '''
+        self.resolving -= 1
+        if self.done:
             return
-        self._connect()
-
-    def _connect(self):
-        ''' Connect first available epnt '''
-        sock = utils_net.connect(self.epnts.popleft(), self.prefer_ipv6)
-        if sock:
-            self.sock = sock
-            self.timestamp = utils.ticks()
-            POLLER.set_writable(self)
+        if addrinfo:
+            addrinfo = interleave_families(addrinfo, self.prefer_ipv6)
+            self.candidates = interleave(self.candidates,
+                                         [(epnt, ainfo) for ainfo in addrinfo])
+        if not self.attempts and not self.timer:
+            self._next_attempt()
         else:
-            self._connection_failed()
-
-    def fileno(self):
-        return self.sock.fileno()
+            self._maybe_failed()
+
+    def _next_attempt(self, *args):
+        ''' Start the next connection attempt '''
+        self.timer = None
+        while self.candidates:
+            epnt, ainfo = self.candidates.pop(0)
+            sock = utils_net.connect_ainfo(ainfo)
+            if sock:
+                self.attempts.append(ConnectAttempt(self, epnt, sock))
+                if self.candidates or self.resolving:
+                    self.timer = POLLER.schedule(ATTEMPT_DELAY,
+                                                 self._next_attempt)
+                return
+        self._maybe_failed()
+
+    def _maybe_failed(self):
+        ''' Report failure if no attempt can succeed '''
+        if (not self.done and not self.attempts and not self.candidates
+                and not self.resolving):
+            self.done = True
+            logging.error('connector: cannot connect to %s',
+                          utils_net.format_epnt(self.endpoint))
+            self.aterror.callback_each_np(self)
 
-    def handle_write(self):
-        POLLER.unset_writable(self)
-        if not utils_net.isconnected(self.endpoint, self.sock):
-            self._connection_failed()
+    def attempt_failed(self, attempt):
+        ''' Invoked when a connection attempt fails '''
+        if attempt not in self.attempts:
             return
+        self.attempts.remove(attempt)
+        # The parent owns the socket we passed it, close the others
+        if self.sock is attempt.sock:
+            self.sock = None
+        else:
+            attempt.sock.close()
+        # Don't wait for the timer to try the next candidate
+        if self.timer:
+            self.timer.cancel()
+        self._next_attempt()
+
+    def attempt_succeeded(self, attempt, ticks):
+        ''' Invoked when a connection attempt succeeds '''
+        if attempt not in self.attempts:
+            return
+        self.sock = attempt.sock
+        self.timestamp = attempt.timestamp
+        self.winner = attempt.epnt
         deferred = Deferred()
         deferred.add_callback(self._handle_connect)
         deferred.add_errback(self._handle_connect_error)
-        deferred.callback(utils.ticks())
+        deferred.callback((attempt, ticks))
 
-    def _handle_connect(self, ticks):
+    def _handle_connect(self, args):
         ''' Internally handle connect '''
-        self.parent.handle_connect(self, self.sock, (ticks - self.timestamp),
-          self.sslconfig, self.extra)
+        attempt, ticks = args
+        self.parent.handle_connect(self, attempt.sock,
+          (ticks - attempt.timestamp), self.sslconfig, self.extra)
+        self.done = True
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.candidates = []
+        self.attempts.remove(attempt)
+        for loser in self.attempts:
+            loser.abort()
+        self.attempts = []
 
     def _handle_connect_error(self, error):
         ''' Internally handle connect error '''
         logging.warning('connector: connect() error: %s', str(error))
-        self._connection_failed()
-
-    def handle_close(self):
-        self._connection_failed()
+        for attempt in list(self.attempts):
+            if attempt.sock is self.sock:
+                self.attempt_failed(attempt)
@@ -25,6 +25,7 @@
 import logging
 import os
 import sqlite3
+import threading
 
 from neubot.database import table_config
 from neubot.database import table_geoloc
@@ -45,6 +46,8 @@ class DatabaseManager(object):
         self.path = system.get_default_database_path()
         self.readonly = False
         self.dbc = None
+        self.thread = None
+        self.local = threading.local()
 
     def set_path(self, path):
         ''' Overrides default database path '''
@@ -56,6 +59,20 @@ class DatabaseManager(object):
 
     def connection(self):
         ''' Return connection to database '''
+
+        #
+        # A sqlite3 connection cannot be used by a thread other than
+        # the one that created it, so the other threads, e.g. the one
+        # of the storage pipeline, get their own connection, after the
+        # first connection has created and migrated the database.
+        #
+        if self.dbc and threading.current_thread() is not self.thread:
+            dbc = getattr(self.local, 'dbc', None)
+            if not dbc:
+                dbc = self.local.dbc = sqlite3.connect(self.path)
+                dbc.row_factory = sqlite3.Row
+            return dbc
+
         if not self.dbc:
             database_xxx.linux_fixup_databasedir()
             if self.path != ":memory:":
@@ -63,6 +80,7 @@ class DatabaseManager(object):
 
             logging.debug("* Database: %s", self.path)
             self.dbc = sqlite3.connect(self.path)
+            self.thread = threading.current_thread()
 
             #
             # To avoid the need to map at hand columns in
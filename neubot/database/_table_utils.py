@@ -192,6 +192,88 @@ def make_select(table, template, **kwargs):
     query = "".join(vector)
     return query
 
+def make_create_index(table):
+
+    '''
+     Given the table name this function returns the query to create
+     an index on the timestamp.  Since id is an alias for the rowid,
+     the index is sorted by timestamp and id, which is the order in
+     which we walk tables page by page.
+    '''
+
+    table = __check(table)
+    return "CREATE INDEX IF NOT EXISTS %s_timestamp ON %s (timestamp);" % (
+                                                               table, table)
+
+def make_select_page(table, template, since=-1, until=-1, cursor=False):
+
+    '''
+     Given the table name and a template dictionary this function
+     returns the query to walk the specified table, newest first,
+     one page at a time.  If @cursor is True the page starts after
+     the row identified by the :cursor_ts and :cursor_id parameters.
+     The query also returns the row id and the maximum number of rows
+     is the :limit parameter.
+    '''
+
+    if not "timestamp" in template:
+        raise ValueError("Template does not contain 'timestamp'")
+
+    vector = [ "SELECT id" ]
+    for key in template.keys():
+        vector.append(", %s" % __check(key))
+    vector.append(" FROM %s" % __check(table))
+
+    conditions = []
+    if since >= 0:
+        conditions.append("timestamp >= :since")
+    if until >= 0:
+        conditions.append("timestamp < :until")
+    if cursor:
+        conditions.append("(timestamp < :cursor_ts OR (timestamp = "
+                          ":cursor_ts AND id < :cursor_id))")
+    if conditions:
+        vector.append(" WHERE ")
+        vector.append(" AND ".join(conditions))
+
+    vector.append(" ORDER BY timestamp DESC, id DESC LIMIT :limit;")
+    query = "".join(vector)
+    return query
+
+# Number of rows we fetch at a time in walk()
+WALK_BATCH = 128
+
+def walk(connection, table, template, since=-1, until=-1, cursor=None):
+
+    '''
+     Generator that walks the given table, newest first, starting
+     after @cursor, if not None, and yields (row, cursor) tuples,
+     where row is a dictionary and cursor is the string that
+     identifies the row.  Rows are fetched WALK_BATCH at a time,
+     with no statement left open between batches, so that the
+     caller can consume the rows at its own pace and we don't
+     keep the whole table in memory.
+    '''
+
+    params = {"since": since, "until": until, "limit": WALK_BATCH}
+    if cursor is not None:
+        params["cursor_ts"], params["cursor_id"] = [int(value) for value
+                                                    in cursor.split(":")]
+    query = make_select_page(table, template, since, until,
+                             cursor is not None)
+
+    while True:
+        rows = connection.execute(query, params).fetchall()
+        for row in rows:
+            row = dict(row)
+            ident = row.pop("id")
+            yield row, "%d:%d" % (row["timestamp"], ident)
+        if len(rows) < WALK_BATCH:
+            break
+        params["cursor_ts"], params["cursor_id"] = (rows[-1]["timestamp"],
+                                                    rows[-1]["id"])
+        query = make_select_page(table, template, since, until, True)
+
 def rename_column_query(table1, template1, table2, template2):
 
     ''' Returns the query that copies from table1, described by
@@ -521,6 +521,36 @@ def migrate_from_4_4_to_4_5(connection):
     logging.info('migrate2: from schema version 4.4 to 4.5... complete')
 
 
+# ===================
+# Migrate: 4.5 -> 4.6
+# ===================
+
+def migrate_from_4_5_to_4_6(connection):
+    ''' Migrate: 4.5 -> 4.6 '''
+    logging.info('migrate2: from schema version 4.5 to 4.6... in progress')
+    connection.execute("ALTER TABLE bittorrent ADD request_window INTEGER;")
+    connection.execute('''UPDATE config SET value='4.6'
+                              WHERE name='version';''')
+    connection.commit()
+    logging.info('migrate2: from schema version 4.5 to 4.6... complete')
+
+
+# ===================
+# Migrate: 4.6 -> 4.7
+# ===================
+
+def migrate_from_4_6_to_4_7(connection):
+    ''' Migrate: 4.6 -> 4.7 '''
+    logging.info('migrate2: from schema version 4.6 to 4.7... in progress')
+    connection.execute("ALTER TABLE bittorrent ADD streams INTEGER;")
+    connection.execute("ALTER TABLE bittorrent ADD download_speeds TEXT;")
+    connection.execute("ALTER TABLE bittorrent ADD upload_speeds TEXT;")
+    connection.execute('''UPDATE config SET value='4.7'
+                              WHERE name='version';''')
+    connection.commit()
+    logging.info('migrate2: from schema version 4.6 to 4.7... complete')
+
+
 # ====
 # Main
 # ====
@@ -529,6 +559,8 @@ MIGRATORS = {
     '4.2': MigrateFrom42To43.migrate,
     '4.3': migrate_from_4_3_to_4_4,
     '4.4': migrate_from_4_4_to_4_5,
+    '4.5': migrate_from_4_5_to_4_6,
+    '4.6': migrate_from_4_6_to_4_7,
 }
 
 def migrate(connection):
@@ -50,14 +50,22 @@ TEMPLATE = {
 
     # Added Neubot 0.4.12
     "test_version": 1,
+
+    # Added Neubot 0.5.0
+    "request_window": 0,
+    "streams": 1,
+    "download_speeds": "",
+    "upload_speeds": "",
 }
 
 CREATE_TABLE = _table_utils.make_create_table("bittorrent", TEMPLATE)
+CREATE_INDEX = _table_utils.make_create_index("bittorrent")
 INSERT_INTO = _table_utils.make_insert_into("bittorrent", TEMPLATE)
 
 def create(connection, commit=True):
     ''' Create the bittorrent table '''
     connection.execute(CREATE_TABLE)
+    connection.execute(CREATE_INDEX)
     if commit:
         connection.commit()
 
@@ -78,6 +86,11 @@ def listify(connection, since=-1, until=-1):
         vector.append(dict(row))
     return vector
 
+def walk(connection, since=-1, until=-1, cursor=None):
+    ''' Walks the content of bittorrent table, newest first '''
+    return _table_utils.walk(connection, "bittorrent", TEMPLATE,
+                             since, until, cursor)
+
 def prune(connection, until=None, commit=True):
     ''' Removes old results from bittorrent table '''
     if not until:
@@ -80,11 +80,13 @@ def __json_to_mapped_row(result):
            }
 
 CREATE_TABLE = _table_utils.make_create_table('raw', TEMPLATE)
+CREATE_INDEX = _table_utils.make_create_index('raw')
 INSERT_INTO = _table_utils.make_insert_into('raw', TEMPLATE)
 
 def create(connection, commit=True):
     ''' Create the RAW table '''
     connection.execute(CREATE_TABLE)
+    connection.execute(CREATE_INDEX)
     if commit:
         connection.commit()
 
@@ -106,6 +108,11 @@ def listify(connection, since=-1, until=-1):
         vector.append(dict(row))
     return vector
 
+def walk(connection, since=-1, until=-1, cursor=None):
+    ''' Walks the content of RAW table, newest first '''
+    return _table_utils.walk(connection, 'raw', TEMPLATE,
+                             since, until, cursor)
+
 def prune(connection, until=None, commit=True):
     ''' Removes old results from RAW table '''
     if not until:
@@ -53,11 +53,13 @@ TEMPLATE = {
 }
 
 CREATE_TABLE = _table_utils.make_create_table("speedtest", TEMPLATE)
+CREATE_INDEX = _table_utils.make_create_index("speedtest")
 INSERT_INTO = _table_utils.make_insert_into("speedtest", TEMPLATE)
 
 def create(connection, commit=True):
     ''' Create a new speedtest table '''
     connection.execute(CREATE_TABLE)
+    connection.execute(CREATE_INDEX)
     if commit:
         connection.commit()
 
@@ -78,6 +80,11 @@ def listify(connection, since=-1, until=-1):
         vector.append(dict(row))
     return vector
 
+def walk(connection, since=-1, until=-1, cursor=None):
+    ''' Walks the content of speedtest table, newest first '''
+    return _table_utils.walk(connection, "speedtest", TEMPLATE,
+                             since, until, cursor)
+
 def prune(connection, until=None, commit=True):
     ''' Removes old results from the table '''
     if not until:
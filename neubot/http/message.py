@@ -32,6 +32,7 @@ import socket
 import os
 import logging
 
+from neubot.log import is_verbose
 from neubot.log import oops
 
 from neubot import compat
@@ -49,6 +50,40 @@ REDIRECT = '''\
 </HTML>
 '''
 
+#
+# Serializing the headers of hot-path responses (e.g. the ones
+# of negotiate, collect and speedtest latency) was dominated by
+# the cost of capitalizing header names and joining the pieces
+# of the status line.  So we cache, for each combination of
+# status line and header names, a template, i.e. the tuple of
+# the constant pieces, so that we just splice in the values.
+#
+TEMPLATES = {}
+MAXTEMPLATES = 256
+
+CANONICAL_NAMES = {}
+MAXCANONICAL = 1024
+
+def canonicalize(name):
+    ''' Canonicalize header name, e.g. content-type -> Content-Type '''
+    canonical = CANONICAL_NAMES.get(name)
+    if canonical is None:
+        canonical = "-".join([s.capitalize() for s in name.split("-")])
+        if len(CANONICAL_NAMES) >= MAXCANONICAL:
+            CANONICAL_NAMES.clear()
+        CANONICAL_NAMES[name] = canonical
+    return canonical
+
+def _build_template(firstline, names):
+    ''' Build the template for firstline and header names '''
+    template = []
+    prefix = firstline + "\r\n"
+    for name in names:
+        template.append(prefix + canonicalize(name) + ": ")
+        prefix = "\r\n"
+    template.append(prefix + "\r\n")
+    return tuple(template)
+
 def urlsplit(uri):
     ''' Wrapper for urlparse.urlsplit() '''
     scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
@@ -125,45 +160,46 @@ class Message(object):
     #
     def serialize_headers(self):
         ''' Serialize message headers '''
-        vector = []
+
+        names = tuple(self.headers.keys())
 
         if self.method:
-            vector.append(self.method)
-            vector.append(" ")
             if self.pathquery:
-                vector.append(self.pathquery)
+                target = self.pathquery
             elif self.uri:
-                vector.append(self.uri)
+                target = self.uri
             else:
-                vector.append("/")
-            vector.append(" ")
-            vector.append(self.protocol)
-
+                target = "/"
+            # The request line changes too often to cache it
+            vector = [" ".join((self.method, target, self.protocol))]
+            key = (None, names)
+            firstline = ""
         else:
-            vector.append(self.protocol)
-            vector.append(" ")
-            vector.append(self.code)
-            vector.append(" ")
-            vector.append(self.reason)
-
-        logging.debug("> %s", "".join(vector))
-        vector.append("\r\n")
-
-        for key, value in self.headers.items():
-            key = "-".join(map(lambda s: s.capitalize(), key.split("-")))
-            vector.append(key)
-            vector.append(": ")
-            vector.append(value)
-
-            logging.debug("> %s: %s", key, value)
-            vector.append("\r\n")
-
-        logging.debug(">")
-        vector.append("\r\n")
-
-        string = "".join(vector)
-        string = utils.stringify(string)
-        return StringIO.StringIO(string)
+            vector = []
+            key = (self.protocol, self.code, self.reason, names)
+            firstline = " ".join((self.protocol, self.code, self.reason))
+
+        template = TEMPLATES.get(key)
+        if template is None:
+            template = _build_template(firstline, names)
+            if len(TEMPLATES) >= MAXTEMPLATES:
+                TEMPLATES.clear()
+            TEMPLATES[key] = template
+
+        vector.append(template[0])
+        index = 1
+        for name in names:
+            vector.append(self.headers[name])
+            vector.append(template[index])
+            index += 1
+
+        string = utils.stringify("".join(vector))
+
+        if is_verbose():
+            for line in string.split("\r\n")[:-1]:
+                logging.debug("> %s", line)
+
+        return string
 
     def serialize_body(self):
         ''' Serialize message body '''
@@ -26,6 +26,8 @@
 
 import logging
 
+from neubot.http_parser import END_OF_HEADERS
+from neubot.http_parser import HTTPParser
 from neubot.net.stream import MAXBUF
 from neubot.net.stream import Stream
 
@@ -43,13 +45,6 @@ MAXLINE = 1 << 15
 STATES = ["IDLE", "BOUNDED", "UNBOUNDED", "CHUNK", "CHUNK_END", "FIRSTLINE",
           "HEADER", "CHUNK_LENGTH", "TRAILER", "ERROR"]
 
-#
-# When messages are not bigger than SMALLMESSAGE we join headers
-# and body in a single buffer and we send that buffer.  If the buffer
-# happens to be very small, it might fit a single L2 packet.
-#
-SMALLMESSAGE = 8000
-
 class StreamHTTP(Stream):
 
     ''' Specializes stream in order to handle the Hyper-Text Transfer
@@ -58,7 +53,7 @@ class StreamHTTP(Stream):
     def __init__(self, poller):
         ''' Initialize the stream '''
         Stream.__init__(self, poller)
-        self.incoming = []
+        self.incoming = HTTPParser(MAXLINE)
         self.state = FIRSTLINE
         self.left = 0
 
@@ -77,21 +72,15 @@ class StreamHTTP(Stream):
 
     # Send
 
-    def send_message(self, message, smallmessage=SMALLMESSAGE):
+    def send_message(self, message):
         ''' Send a message '''
-        if message.length >= 0 and message.length <= smallmessage:
-            vector = []
-            vector.append(message.serialize_headers().read())
-            body = message.serialize_body()
-            if not isinstance(body, basestring):
-                vector.append(body.read())
-            else:
-                vector.append(body)
-            data = "".join(vector)
-            self.start_send(data)
-        else:
-            self.start_send(message.serialize_headers())
-            self.start_send(message.serialize_body())
+        #
+        # No need to join headers and body of small messages here,
+        # because the send path gathers small pieces and sends them
+        # using a single system call.
+        #
+        self.start_send(message.serialize_headers())
+        self.start_send(message.serialize_body())
 
     # Recv
 
@@ -103,39 +92,32 @@ class StreamHTTP(Stream):
         #This one should be debug2 as well
         #logging.debug("HTTP receiver: got %d bytes", len(data))
 
-        # merge with previous fragments (if any)
-        if self.incoming:
-            self.incoming.append(data)
-            data = "".join(self.incoming)
-            del self.incoming[:]
+        self.incoming.bufferise(data)
 
-        # consume the current fragment
-        offset = 0
-        length = len(data)
-        while length > 0:
+        # consume the buffered data
+        while True:
             #ostate = self.state        # needed by commented-out code below
 
             # when we know the length we're looking for a piece
             if self.left > 0:
-                count = min(self.left, length)
-                piece = buffer(data, offset, count)
-                self.left -= count
-                offset += count
-                length -= count
+                piece = self.incoming.getpiece(self.left)
+                if not piece:
+                    break
+                self.left -= len(piece)
                 self._got_piece(piece)
 
-            # otherwise we're looking for the next line
+            # otherwise we're looking for the next header or line
             elif self.left == 0:
-                index = data.find("\n", offset)
-                if index == -1:
-                    if length > MAXLINE:
-                        raise RuntimeError("Line too long")
-                    break
-                index = index + 1
-                line = data[offset:index]
-                length -= (index - offset)
-                offset = index
-                self._got_line(line)
+                if self.state == HEADER:
+                    header = self.incoming.getheader()
+                    if header is None:
+                        break
+                    self._got_header(header)
+                else:
+                    line = self.incoming.getline()
+                    if not line:
+                        break
+                    self._got_line(line)
 
             # robustness
             else:
@@ -149,12 +131,6 @@ class StreamHTTP(Stream):
 #           logging.debug("HTTP receiver: %s -> %s",
 #                         STATES[ostate], STATES[self.state])
 
-        # keep the eventual remainder for later
-        if length > 0:
-            remainder = data[offset:]
-            self.incoming.append(remainder)
-            logging.debug("HTTP receiver: remainder %d", len(remainder))
-
         # get the next fragment
         self.start_recv()
 
@@ -179,25 +155,6 @@ class StreamHTTP(Stream):
                     self.state = HEADER
             else:
                 raise RuntimeError("Invalid first line")
-        elif self.state == HEADER:
-            if line.strip():
-                logging.debug("< %s", line)
-                # not handling mime folding
-                index = line.find(":")
-                if index >= 0:
-                    key, value = line.split(":", 1)
-                    self.got_header(key.strip(), value.strip())
-                else:
-                    raise RuntimeError("Invalid header line")
-            else:
-                logging.debug("<")
-                self.state, self.left = self.got_end_of_headers()
-                if self.state == ERROR:
-                    # allow upstream to filter out unwanted requests
-                    self.close()
-                elif self.state == FIRSTLINE:
-                    # this is the case of an empty body
-                    self.got_end_of_body()
         elif self.state == CHUNK_LENGTH:
             vector = line.split()
             if vector:
@@ -226,6 +183,25 @@ class StreamHTTP(Stream):
         else:
             raise RuntimeError("Not expecting a line")
 
+    def _got_header(self, header):
+        ''' We've got an header... what do we do? '''
+        if header is not END_OF_HEADERS:
+            key, value = header
+            # not handling mime folding
+            if key is None:
+                raise RuntimeError("Invalid header line")
+            logging.debug("< %s: %s", key, value)
+            self.got_header(key, value)
+        else:
+            logging.debug("<")
+            self.state, self.left = self.got_end_of_headers()
+            if self.state == ERROR:
+                # allow upstream to filter out unwanted requests
+                self.close()
+            elif self.state == FIRSTLINE:
+                # this is the case of an empty body
+                self.got_end_of_body()
+
     def _got_piece(self, piece):
         ''' We've got a piece... what do we do? '''
         if self.state == BOUNDED:
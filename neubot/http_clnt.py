@@ -33,11 +33,12 @@ import sys
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
-from neubot.brigade import Brigade
 from neubot.handler import Handler
+from neubot.http_parser import HTTPParser
 from neubot.poller import POLLER
 from neubot.stream import Stream
 
+from neubot import http_parser
 from neubot import six
 from neubot import utils_version
 
@@ -66,12 +67,12 @@ SPACE = six.b(' ')
 TAB = six.b('\t')
 TRANSFER_ENCODING = six.b('transfer-encoding')
 
-class ClientContext(Brigade):
+class ClientContext(HTTPParser):
 
     ''' HTTP client context '''
 
     def __init__(self, extra, connection_made, connection_lost):
-        Brigade.__init__(self)
+        HTTPParser.__init__(self, MAXLINE)
 
         self.outq = []
         self.outfp = None
@@ -301,11 +302,10 @@ class HttpClient(Handler):
             # Note: make sure there are no leading or trailing spaces
             context.headers[context.last_hdr] = value.strip()
             return
-        index = line.find(COLON)
-        if index >= 0:
-            name, value = line.split(COLON, 1)
-            name = name.strip().lower()
-            value = value.strip()
+        header = http_parser.split_header(line)
+        if header:
+            name, value = header
+            name = name.lower()
             if name not in context.headers:
                 context.headers[name] = value
             else:
@@ -0,0 +1,145 @@
+# neubot/http_parser.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Incremental HTTP parser '''
+
+# Python3-ready: yes
+
+#
+# The parser is shared by neubot/http/stream.py and by neubot/http_clnt.py
+# and it works on top of a RingBrigade, i.e. a single growing buffer plus
+# a read offset.  Fragments are appended to the buffer as they arrive, and
+# lines are searched in place, starting from the read offset, so a line
+# that is split across many fragments does not cause the already received
+# bytes to be joined again and again.
+#
+# The parser does not know anything about requests and responses: that is
+# the job of the state machine of the caller, which asks the parser for the
+# next line, header or piece depending on its state.  In particular, headers
+# are split in place, using the offset of the colon, so that we copy just
+# the name and the value and not the whole line.
+#
+
+from neubot.brigade import RingBrigade
+from neubot.brigade import BYTES
+
+from neubot import six
+
+# Default maximum line length
+MAXLINE = 1 << 15
+
+COLON = six.b(':')
+EMPTY = six.b('')
+NEWLINE = six.b('\n')
+SPACE = six.b(' ')
+TAB = six.b('\t')
+
+# Returned by getheader() at the end of headers
+END_OF_HEADERS = (EMPTY, EMPTY)
+
+def split_header(line):
+    ''' Split header line into (name, value) or return None '''
+    index = line.find(COLON)
+    if index < 0:
+        return None
+    return line[:index].strip(), line[index + 1:].strip()
+
+class HTTPParser(RingBrigade):
+
+    ''' Incremental HTTP parser '''
+
+    def __init__(self, maxline=MAXLINE):
+        RingBrigade.__init__(self)
+        self.maxline = maxline
+
+    def _find_newline(self, maxline):
+        ''' Return the index of the next newline or -1 '''
+        if not self.total:
+            return -1
+        if maxline is None:
+            maxline = self.maxline
+        self._own()
+        index = self.buffer.find(NEWLINE, self.offset,
+                                 self.offset + maxline)
+        if index < 0 and self.total >= maxline:
+            raise RuntimeError('http_parser: line too long')
+        return index
+
+    def getline(self, maxline=None):
+        ''' Return next line or empty string if it's not complete '''
+        index = self._find_newline(maxline)
+        if index < 0:
+            return EMPTY
+        return self.pullup(index + 1 - self.offset)
+
+    def getheader(self, maxline=None):
+
+        '''
+         Returns the next header as a (name, value) tuple, or the
+         END_OF_HEADERS tuple if the next line is empty, or None if
+         the next line is not complete.  If the header continues the
+         previous one (i.e. starts with space or tab) name is None.
+        '''
+
+        index = self._find_newline(maxline)
+        if index < 0:
+            return None
+
+        buff, start = self.buffer, self.offset
+        self.skip(index + 1 - start)
+
+        first = buff[start:start + 1]
+        if first in (SPACE, TAB):
+            value = BYTES(buff[start:index]).strip()
+            if not value:
+                return END_OF_HEADERS
+            return None, value
+
+        colon = buff.find(COLON, start, index)
+        if colon < 0:
+            if not BYTES(buff[start:index]).strip():
+                return END_OF_HEADERS
+            raise RuntimeError('http_parser: invalid header line')
+
+        return (BYTES(buff[start:colon]).strip(),
+                BYTES(buff[colon + 1:index]).strip())
+
+    def getpiece(self, maxlen):
+
+        '''
+         Returns up to maxlen bytes of the body, or an empty string if
+         nothing is buffered.  The piece is a view when the buffer is
+         an immutable string, to avoid copying it.
+        '''
+
+        count = min(self.total, maxlen)
+        if count <= 0:
+            return EMPTY
+        if isinstance(self.buffer, BYTES):
+            if self.offset == 0 and count == len(self.buffer):
+                piece = self.buffer
+            else:
+                piece = six.buff(self.buffer, self.offset, count)
+            self.skip(count)
+            return piece
+        return self.pullup(count)
@@ -25,9 +25,24 @@
 # Adapted from neubot/net/stream.py
 # Python3-ready: yes
 
+#
+# When many clients connect at the same time, e.g. at the top of the
+# hour, accepting one connection per readability event means one loop
+# iteration per connection.  So, we accept up to MAXACCEPT connections
+# per event, stopping as soon as accept() would block.
+#
+
+import sys
+
+from neubot.config import CONFIG
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
 
+from neubot import utils_net
+
+# Maximum number of connections accepted per event
+MAXACCEPT = 64
+
 class Listener(Pollable):
 
     ''' Pollable socket listener '''
@@ -53,15 +68,33 @@ class Listener(Pollable):
         return self.lsock.fileno()
 
     def handle_read(self):
-        # Make sure we route exceptions properly
-        try:
-            sock = self.lsock.accept()[0]
-            sock.setblocking(False)
-            self.parent.handle_accept(self, sock, self.sslconfig, self.sslcert)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except:
-            self.parent.handle_accept_error(self)
+        for _ in range(MAXACCEPT):
+            # Make sure we route exceptions properly
+            try:
+                sock = self.lsock.accept()[0]
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                if getattr(sys.exc_info()[1], 'errno',
+                           None) not in utils_net.WOULDBLOCK:
+                    self.parent.handle_accept_error(self)
+                return
+            try:
+                sock.setblocking(False)
+                self.parent.handle_accept(self, sock, self.sslconfig,
+                                          self.sslcert)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                self.parent.handle_accept_error(self)
 
     def handle_close(self):
         self.parent.handle_listen_close(self)
+
+CONFIG.register_defaults({
+    'net.listen.reuseport': False,
+})
+
+CONFIG.register_descriptions({
+    'net.listen.reuseport': 'Set SO_REUSEPORT on listening sockets',
+})
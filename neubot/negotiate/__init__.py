@@ -31,6 +31,12 @@ from neubot.http.server import HTTP_SERVER
 
 CONFIG.register_defaults({
     'negotiate.parallelism': 7,
+    'negotiate.parallelism_bittorrent': 3,
+    'negotiate.parallelism_raw': 3,
+    'negotiate.parallelism_speedtest': 0,
+    'negotiate.prefix_burst': 8,
+    'negotiate.prefix_parallelism': 3,
+    'negotiate.prefix_rate': 3,
     'negotiate.min_thresh': 32,
     'negotiate.max_thresh': 64,
 })
@@ -47,6 +53,18 @@ def run(poller, conf):
 
     CONFIG.register_descriptions({
         'negotiate.parallelism': 'Number of parallel tests',
+        'negotiate.parallelism_bittorrent':
+          'Number of parallel BitTorrent tests (0 = no limit)',
+        'negotiate.parallelism_raw':
+          'Number of parallel raw tests (0 = no limit)',
+        'negotiate.parallelism_speedtest':
+          'Number of parallel speedtest tests (0 = no limit)',
+        'negotiate.prefix_burst':
+          'Number of tests a client prefix can queue for at once (0 = no limit)',
+        'negotiate.prefix_parallelism':
+          'Number of parallel tests per client prefix (0 = no limit)',
+        'negotiate.prefix_rate':
+          'Number of tests per minute a client prefix can queue for',
         'negotiate.min_thresh': 'Minimum trehshold for RED',
         'negotiate.max_thresh': 'Maximum trehshold for RED',
     })
@@ -0,0 +1,265 @@
+# neubot/negotiate/admission.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Negotiate server admission control '''
+
+#
+# The negotiate queue is FIFO and at most negotiate.parallelism
+# streams are unchoked at a time.  On top of that we keep a few
+# token buckets, to decide which streams can be unchoked:
+#
+# 1. each module has a bucket of test slots, so that heavy tests,
+#    e.g. raw and BitTorrent, cannot take all the slots and starve
+#    lightweight tests;
+#
+# 2. each client prefix (i.e. /24 for IPv4 and /64 for IPv6, which
+#    is roughly one home or office network) has a bucket of test
+#    slots, so that a single NAT cannot monopolise the unchoked
+#    slots, and a bucket that refills slowly over time, used to
+#    rate limit the number of tests a prefix can enter the queue
+#    for.
+#
+# Slots are taken when a stream is unchoked and are given back when
+# the stream leaves the queue.  A waiting stream that cannot take a
+# slot stays choked, but it does not block the streams behind it.
+#
+# In pre-fork mode the global and per module slots are shared among
+# the worker processes by the arbiter (see arbiter.py), while the
+# prefix buckets are per worker: each client prefix is steered to
+# a single worker (see server_prefork.py).
+#
+
+import socket
+
+from neubot.config import CONFIG
+from neubot import utils
+
+# Sweep idle prefixes when their number doubles
+MINSWEEP = 1024
+
+class TokenBucket(object):
+
+    ''' Token bucket '''
+
+    def __init__(self, capacity, rate=0.0):
+        ''' Initialize bucket with @capacity tokens, refilled at the
+            given @rate in tokens per second (zero means that tokens
+            are only given back explicitly) '''
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.ticks = utils.ticks()
+
+    def _refill(self):
+        ''' Refill the bucket depending on the elapsed time '''
+        if self.rate > 0:
+            now = utils.ticks()
+            self.tokens = min(self.capacity, self.tokens +
+                              (now - self.ticks) * self.rate)
+            self.ticks = now
+
+    def available(self):
+        ''' Returns True if we can take a token '''
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self):
+        ''' Take a token, returns False if the bucket is empty '''
+        if not self.available():
+            return False
+        self.tokens -= 1
+        return True
+
+    def give(self):
+        ''' Give back a token '''
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def full(self):
+        ''' Returns True if the bucket is full '''
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def snap(self):
+        ''' Take a snapshot of the bucket '''
+        self._refill()
+        return {
+                'capacity': self.capacity,
+                'rate': self.rate,
+                'tokens': self.tokens,
+               }
+
+def prefix_of(address):
+    ''' Map @address to client prefix or None if not an address '''
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, address)
+    except (socket.error, ValueError):
+        try:
+            packed = socket.inet_pton(socket.AF_INET, address)
+        except (socket.error, ValueError):
+            return None
+    else:
+        if not packed.startswith('\0' * 10 + '\xff\xff'):
+            return socket.inet_ntop(socket.AF_INET6,
+                                    packed[:8] + '\0' * 8) + '/64'
+        packed = packed[12:]
+    return socket.inet_ntop(socket.AF_INET, packed[:3] + '\0') + '/24'
+
+class Admission(object):
+
+    ''' Decides which streams can be unchoked '''
+
+    def __init__(self):
+        ''' Initialize admission control '''
+        self.modules = {}
+        self.prefixes = {}
+        self.streams = {}
+        self.running = set()
+        self.rejected = 0
+        self.sweep_thresh = MINSWEEP
+        self.arbiter = None
+
+    def _module_slots(self, name):
+        ''' Returns the slots of module @name or None '''
+        if name not in self.modules:
+            capacity = CONFIG.get('negotiate.parallelism_' + name, 0)
+            if capacity > 0:
+                self.modules[name] = TokenBucket(capacity)
+            else:
+                self.modules[name] = None
+        return self.modules[name]
+
+    def _prefix_buckets(self, prefix):
+        ''' Returns the (slots, rate) buckets of @prefix '''
+        if prefix not in self.prefixes:
+            if len(self.prefixes) >= self.sweep_thresh:
+                self._sweep()
+            self.prefixes[prefix] = (
+              TokenBucket(CONFIG['negotiate.prefix_parallelism']),
+              TokenBucket(CONFIG['negotiate.prefix_burst'],
+                          CONFIG['negotiate.prefix_rate'] / 60.0))
+        return self.prefixes[prefix]
+
+    def _sweep(self):
+        ''' Forget prefixes whose buckets are full '''
+        for prefix, (slots, rate) in list(self.prefixes.items()):
+            if slots.full() and rate.full():
+                del self.prefixes[prefix]
+        self.sweep_thresh = max(MINSWEEP, 2 * len(self.prefixes))
+
+    def admit(self, stream, module):
+        ''' Returns True if @stream can enter the queue to run
+            a @module test, False if its prefix is rate limited '''
+        prefix = prefix_of(stream.peername[0])
+        if prefix is not None and CONFIG['negotiate.prefix_burst'] > 0:
+            if not self._prefix_buckets(prefix)[1].take():
+                self.rejected += 1
+                return False
+        self.streams[stream] = (module, prefix)
+        return True
+
+    def can_unchoke(self, stream):
+        ''' Returns True if a waiting @stream can be unchoked '''
+        if stream in self.running or stream not in self.streams:
+            return False
+        module, prefix = self.streams[stream]
+        if self.arbiter:
+            if not self.arbiter.available(module):
+                return False
+        else:
+            if len(self.running) >= CONFIG['negotiate.parallelism']:
+                return False
+            slots = self._module_slots(module)
+            if slots is not None and not slots.available():
+                return False
+        if (prefix is not None and
+            CONFIG['negotiate.prefix_parallelism'] > 0 and
+            not self._prefix_buckets(prefix)[0].available()):
+            return False
+        return True
+
+    def unchoke(self, stream, module):
+        ''' Try to unchoke @stream, which wants to run a @module
+            test, and returns True on success '''
+        if stream in self.running:
+            return True
+        if stream not in self.streams:
+            self.streams[stream] = (module, prefix_of(stream.peername[0]))
+        if not self.can_unchoke(stream):
+            return False
+        module, prefix = self.streams[stream]
+        if self.arbiter:
+            # Another worker may have taken the last slot meanwhile
+            if not self.arbiter.take(module):
+                return False
+        else:
+            slots = self._module_slots(module)
+            if slots is not None:
+                slots.take()
+        if prefix is not None and CONFIG['negotiate.prefix_parallelism'] > 0:
+            self._prefix_buckets(prefix)[0].take()
+        self.running.add(stream)
+        return True
+
+    def release(self, stream):
+        ''' Forget @stream and returns True if it was unchoked '''
+        record = self.streams.pop(stream, None)
+        if stream not in self.running:
+            return False
+        self.running.remove(stream)
+        module, prefix = record
+        if self.arbiter:
+            self.arbiter.give(module)
+        else:
+            slots = self._module_slots(module)
+            if slots is not None:
+                slots.give()
+        if prefix in self.prefixes:
+            self.prefixes[prefix][0].give()
+        return True
+
+    def snap(self, data):
+        ''' Take a snapshot of admission control state '''
+        modules = {}
+        for name, slots in self.modules.items():
+            if slots is not None:
+                modules[name] = slots.snap()
+        busy = {}
+        for prefix, (slots, _) in self.prefixes.items():
+            if slots.tokens < slots.capacity:
+                busy[prefix] = slots.capacity - int(slots.tokens)
+        data['admission'] = {
+                             'parallelism': CONFIG['negotiate.parallelism'],
+                             'prefix_burst': CONFIG['negotiate.prefix_burst'],
+                             'prefix_parallelism':
+                               CONFIG['negotiate.prefix_parallelism'],
+                             'prefix_rate': CONFIG['negotiate.prefix_rate'],
+                             'modules': modules,
+                             'prefixes': len(self.prefixes),
+                             'prefixes_running': busy,
+                             'rejected': self.rejected,
+                             'running': len(self.running),
+                             'waiting': len(self.streams) -
+                                        len(self.running),
+                            }
+        if self.arbiter:
+            self.arbiter.snap(data)
@@ -0,0 +1,208 @@
+# neubot/negotiate/arbiter.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Share test slots among server worker processes '''
+
+#
+# In pre-fork mode each worker process has its own negotiate queue,
+# but the test slots (negotiate.parallelism and the per module slots,
+# see admission.py) must be shared, otherwise N workers would run N
+# times the configured number of tests.  So the supervisor creates,
+# before forking, an anonymous shared memory area with one row per
+# worker, where each worker counts the tests it is running, in total
+# and per module.  To take a slot, a worker locks the area, sums the
+# rows and, if there is room, increments its own row.
+#
+# We lock with lockf() on a temporary file, because POSIX record
+# locks are per process, even though the workers share the file
+# descriptor, and are released if the process dies, so that a worker
+# that crashes while holding the lock does not block the others.
+#
+# Each release increments a generation counter, which workers check
+# periodically to wake up their choked streams when another worker
+# gives slots back.  Each row also contains the heartbeat and the
+# ready flag of the worker, used by the supervisor.  The header also
+# contains the number of workers that are serving, which the workers
+# use to steer connections (see server_prefork.py).
+#
+
+import fcntl
+import mmap
+import struct
+import tempfile
+import time
+
+from neubot.config import CONFIG
+
+# Modules with per module slots
+MODULES = ('bittorrent', 'raw', 'speedtest')
+
+# Generation counter, number of serving workers
+HEADER = struct.Struct('=Qi')
+
+# Heartbeat, ready flag, running tests, running tests per module
+ROW = struct.Struct('=dii' + 'i' * len(MODULES))
+
+class Arbiter(object):
+
+    ''' Share test slots among server worker processes '''
+
+    def __init__(self, workers):
+        ''' Create shared state for @workers workers '''
+        self.workers = workers
+        self.memory = mmap.mmap(-1, HEADER.size + workers * ROW.size)
+        self.lockfile = tempfile.TemporaryFile()
+        self.index = None
+
+    def attach(self, index):
+        ''' Invoked in the worker process to set its index '''
+        self.index = index
+
+    def _lock(self):
+        ''' Lock the shared memory area '''
+        fcntl.lockf(self.lockfile.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(self):
+        ''' Unlock the shared memory area '''
+        fcntl.lockf(self.lockfile.fileno(), fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        ''' Returns the offset of row @index '''
+        return HEADER.size + index * ROW.size
+
+    def _read(self, index):
+        ''' Read row @index as a list '''
+        return list(ROW.unpack_from(self.memory, self._offset(index)))
+
+    def _write(self, index, row):
+        ''' Write row @index '''
+        ROW.pack_into(self.memory, self._offset(index), *row)
+
+    def _bump(self):
+        ''' Increment the generation counter '''
+        generation, live = HEADER.unpack_from(self.memory, 0)
+        HEADER.pack_into(self.memory, 0, generation + 1, live)
+
+    def generation(self):
+        ''' Returns the generation counter '''
+        return HEADER.unpack_from(self.memory, 0)[0]
+
+    def set_live(self, live):
+        ''' Set the number of serving workers (supervisor) '''
+        self._lock()
+        try:
+            HEADER.pack_into(self.memory, 0, self.generation(), live)
+        finally:
+            self._unlock()
+
+    def live(self):
+        ''' Returns the number of serving workers '''
+        return HEADER.unpack_from(self.memory, 0)[1]
+
+    def _running(self):
+        ''' Returns the running tests, in total and per module '''
+        total = [0] * (1 + len(MODULES))
+        for index in range(self.workers):
+            for column, value in enumerate(self._read(index)[2:]):
+                total[column] += value
+        return total
+
+    def _has_room(self, running, module):
+        ''' Returns True if there is room for a @module test '''
+        if running[0] >= CONFIG['negotiate.parallelism']:
+            return False
+        if module in MODULES:
+            capacity = CONFIG.get('negotiate.parallelism_' + module, 0)
+            column = 1 + MODULES.index(module)
+            if capacity > 0 and running[column] >= capacity:
+                return False
+        return True
+
+    def available(self, module):
+        ''' Returns True if we can take a slot for @module '''
+        return self._has_room(self._running(), module)
+
+    def take(self, module):
+        ''' Take a slot for @module, returns False on failure '''
+        self._lock()
+        try:
+            if not self._has_room(self._running(), module):
+                return False
+            row = self._read(self.index)
+            row[2] += 1
+            if module in MODULES:
+                row[3 + MODULES.index(module)] += 1
+            self._write(self.index, row)
+            return True
+        finally:
+            self._unlock()
+
+    def give(self, module):
+        ''' Give back a slot for @module '''
+        self._lock()
+        try:
+            row = self._read(self.index)
+            row[2] = max(0, row[2] - 1)
+            if module in MODULES:
+                column = 3 + MODULES.index(module)
+                row[column] = max(0, row[column] - 1)
+            self._write(self.index, row)
+            self._bump()
+        finally:
+            self._unlock()
+
+    def reset(self, index):
+        ''' Forget the state of worker @index (supervisor) '''
+        self._lock()
+        try:
+            self._write(index, [time.time(), 0] + [0] * (1 + len(MODULES)))
+            self._bump()
+        finally:
+            self._unlock()
+
+    def heartbeat(self, ready=True):
+        ''' Tell the supervisor that this worker is alive '''
+        row = self._read(self.index)
+        row[0], row[1] = time.time(), int(ready)
+        self._write(self.index, row)
+
+    def is_ready(self, index):
+        ''' Returns True if worker @index is ready '''
+        return bool(self._read(index)[1])
+
+    def last_heartbeat(self, index):
+        ''' Returns the time of the last heartbeat of worker @index '''
+        return self._read(index)[0]
+
+    def snap(self, data):
+        ''' Take a snapshot of the shared state '''
+        running = self._running()
+        data['arbiter'] = {
+                           'generation': self.generation(),
+                           'index': self.index,
+                           'live': self.live(),
+                           'modules': dict(zip(MODULES, running[1:])),
+                           'running': running[0],
+                           'workers': self.workers,
+                          }
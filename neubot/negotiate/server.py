@@ -22,15 +22,20 @@
 
 ''' Negotiate server '''
 
-import collections
 import random
 import logging
 
 from neubot.config import CONFIG
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
+from neubot.negotiate.admission import Admission
+from neubot.poller import POLLER
+from neubot.simplejson import OrderedDict
 from neubot.compat import json
 
+# Interval between checks for slots released by other workers
+ARBITER_INTERVAL = 0.5
+
 class NegotiateServerModule(object):
 
     ''' Each test should implement this interface '''
@@ -52,6 +57,52 @@ class NegotiateServerModule(object):
         ''' Invoked when a stream is authorized to take the test '''
         return { 'authorization': str(hash(stream)) }
 
+#
+# The queue is an ordered dictionary, as suggested by Libero Camillo,
+# so that streams are appended and removed in O(1).  The position of
+# a stream is the number of streams before it: we keep an index of
+# the positions and we rebuild it lazily, i.e. only when someone asks
+# for a position after one or more streams have left the queue.
+#
+class NegotiateQueue(object):
+
+    ''' Queue of streams waiting to take a test '''
+
+    def __init__(self):
+        ''' Initialize the queue '''
+        self.streams = OrderedDict()
+        self.index = {}
+        self.stale = False
+
+    def __len__(self):
+        return len(self.streams)
+
+    def __iter__(self):
+        return iter(self.streams)
+
+    def __contains__(self, stream):
+        return stream in self.streams
+
+    def append(self, stream):
+        ''' Append a stream to the queue '''
+        if not self.stale:
+            self.index[stream] = len(self.streams)
+        self.streams[stream] = None
+
+    def remove(self, stream):
+        ''' Remove a stream from the queue '''
+        del self.streams[stream]
+        if self.index.pop(stream, None) != len(self.streams):
+            self.stale = True
+
+    def position(self, stream):
+        ''' Returns the position of a stream '''
+        if self.stale:
+            self.index = dict((elem, position) for position, elem
+                              in enumerate(self.streams))
+            self.stale = False
+        return self.index[stream]
+
 class NegotiateServer(ServerHTTP):
 
     ''' Common code layer for /negotiate and /collect '''
@@ -59,9 +110,13 @@ class NegotiateServer(ServerHTTP):
     def __init__(self, poller):
         ''' Initialize the negotiator '''
         ServerHTTP.__init__(self, poller)
-        self.queue = collections.deque()
+        self.queue = NegotiateQueue()
+        self.admission = Admission()
         self.modules = {}
-        self.known = set()
+        self.notified = {}
+        self.released = False
+        self.wakeup_pending = False
+        self.generation = 0
 
     def register_module(self, name, module):
         ''' Register a module '''
@@ -118,16 +173,19 @@ class NegotiateServer(ServerHTTP):
         # accept or drop it, depending on the length of the
         # queue.  The decision whether to accept or not depends
         # on the current queue length and follows the Random
-        # Early Discard algorithm.  When we accept it, we also
+        # Early Discard algorithm, and on whether the client
+        # prefix has exceeded its rate limit (see admission.py
+        # for more info).  When we accept it, we also
         # register a function to be called when the stream is
         # closed so that we can update the queue.  And we
         # immediately send a response.
         # When it's not the first time we see a stream, we just
         # take note that we owe it a response.  But we won't
-        # respond until its queue position changes.
+        # respond until its queue position changes (which may
+        # have already happened while the response was in flight).
         #
         elif request.uri.startswith('/negotiate/'):
-            if not stream in self.known:
+            if not stream in self.queue:
                 position = len(self.queue)
                 min_thresh = CONFIG['negotiate.min_thresh']
                 max_thresh = CONFIG['negotiate.max_thresh']
@@ -135,12 +193,17 @@ class NegotiateServer(ServerHTTP):
                                        max_thresh - min_thresh):
                     stream.close()
                     return
+                module = request.uri.replace('/negotiate/', '')
+                if not self.admission.admit(stream, module):
+                    stream.close()
+                    return
                 self.queue.append(stream)
-                self.known.add(stream)
+                self.notified[stream] = position
                 stream.atclose(self._update_queue)
                 self._do_negotiate((stream, request, position))
             else:
                 stream.opaque = request
+                self._wakeup(stream, self.queue.position(stream))
 
         # For robustness
         else:
@@ -150,12 +213,11 @@ class NegotiateServer(ServerHTTP):
         ''' Respond to a /negotiate request '''
         stream, request, position = baton
 
-        module = request.uri.replace('/negotiate/', '')
-        module = self.modules[module]
+        name = request.uri.replace('/negotiate/', '')
+        module = self.modules[name]
         request_body = json.load(request.body)
 
-        parallelism = CONFIG['negotiate.parallelism']
-        unchoked = int(position < parallelism)
+        unchoked = int(self.admission.unchoke(stream, name))
         response_body = {
                          'queue_pos': position,
                          'real_address': stream.peername[0],
@@ -177,49 +239,104 @@ class NegotiateServer(ServerHTTP):
                          mimetype='application/json')
         stream.send_response(request, response)
 
+    def _wakeup(self, stream, position):
+        ''' Send the pending comet response if position changed '''
+        if not stream.opaque:
+            return
+        if self.notified.get(stream, position) == position:
+            return
+        request, stream.opaque = stream.opaque, None
+        self.notified[stream] = position
+        self._do_negotiate((stream, request, position))
+
     #
-    # In theory this function should walk the queue and remove the
-    # lost stream.  But, actually, it seems better/faster to create
-    # and fill a new queue.
-    # In the new queue we will add streams before @lost_stream and
-    # streams after @lost_stream that (i) have no pending comet
-    # request or (ii) have a pending comet request and successfully
-    # manage to send it.
-    # Note: in case of error sending the pending comet request,
-    # unregister atclose hook to prevent recursion.
-    # TODO Libero Camillo suggests to use an ordered dictionary to
-    # implement the queue.  I like the idea and I will look into
-    # that after the pending Neubot release.
+    # When a stream leaves the queue, the streams behind it move
+    # forward and the ones with a pending comet request should be
+    # told their new position.  Also, when the stream was unchoked,
+    # it gives its test slots back and a stream that was choked for
+    # lack of slots may be unchoked even if its position does not
+    # change.  We don't do that immediately but
+    # at the next poller tick, so that, when many streams leave the
+    # queue at once, we walk the queue and we send a response to
+    # each stream at most once.
     #
     def _update_queue(self, lost_stream, ignored):
         ''' Invoked when a connection is lost '''
-        queue, found = collections.deque(), False
+        if lost_stream in self.queue:
+            self.queue.remove(lost_stream)
+        self.notified.pop(lost_stream, None)
+        if self.admission.release(lost_stream):
+            self.released = True
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            POLLER.sched(0, self._wakeup_waiters)
+
+    #
+    # Walk the queue and wakeup the streams whose position has
+    # changed or that can now be unchoked.  We forget what we told
+    # to the latter, so that, if their comet request is in flight,
+    # it is answered as soon as it arrives.
+    # In case of error sending the pending comet request,
+    # unregister atclose hook to prevent recursion and remove the
+    # stream from the queue.
+    #
+    def _wakeup_waiters(self, *args):
+        ''' Wakeup streams whose position has changed '''
+        self.wakeup_pending = False
+        released, self.released = self.released, False
+        failed = []
         position = 0
         for stream in self.queue:
-            if not found:
-                if lost_stream != stream:
-                    position += 1
-                    queue.append(stream)
-                else:
-                    found = True
-                    self.known.remove(stream)
-            elif not stream.opaque:
+            if released and self.admission.can_unchoke(stream):
+                self.notified[stream] = None
+            try:
+                self._wakeup(stream, position)
                 position += 1
-                queue.append(stream)
-            else:
-                request, stream.opaque = stream.opaque, None
-                try:
-                    self._do_negotiate((stream, request, position))
-                    position += 1
-                    queue.append(stream)
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except:
-                    logging.error('Exception', exc_info=1)
-                    stream.unregister_atclose(self._update_queue)
-                    self.known.remove(stream)
-                    stream.close()
-        self.queue = queue
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                logging.error('Exception', exc_info=1)
+                failed.append(stream)
+        for stream in failed:
+            stream.unregister_atclose(self._update_queue)
+            self.queue.remove(stream)
+            self.notified.pop(stream, None)
+            if self.admission.release(stream):
+                self.released = True
+            stream.close()
+        if self.released and not self.wakeup_pending:
+            self.wakeup_pending = True
+            POLLER.sched(0, self._wakeup_waiters)
+
+    #
+    # In pre-fork mode, other workers may give test slots back
+    # and, when that happens, our choked streams may be unchoked,
+    # so we periodically check whether that happened.
+    #
+    def use_arbiter(self, arbiter):
+        ''' Share test slots with other workers using @arbiter '''
+        self.admission.arbiter = arbiter
+        self.generation = arbiter.generation()
+        POLLER.sched(ARBITER_INTERVAL, self._check_arbiter)
+
+    def _check_arbiter(self, *args):
+        ''' Wakeup streams if other workers released slots '''
+        POLLER.sched(ARBITER_INTERVAL, self._check_arbiter)
+        generation = self.admission.arbiter.generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.released = True
+            if not self.wakeup_pending:
+                self.wakeup_pending = True
+                POLLER.sched(0, self._wakeup_waiters)
+
+    def snap(self, data):
+        ''' Take a snapshot of negotiate server state '''
+        data['negotiate'] = {
+                             'notified': len(self.notified),
+                             'queue': len(self.queue),
+                            }
+        self.admission.snap(data)
 
 # No poller, so it cannot be used directly
 NEGOTIATE_SERVER = NegotiateServer(None)
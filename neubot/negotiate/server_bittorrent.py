@@ -27,8 +27,12 @@ import hashlib
 
 from neubot.negotiate.server import NegotiateServerModule
 from neubot.backend import BACKEND
+from neubot.compat import json
 from neubot import privacy
 
+# Maximum number of parallel flows per session
+MAXSTREAMS = 8
+
 class NegotiateServerBitTorrent(NegotiateServerModule):
 
     ''' Negotiator for BitTorrent '''
@@ -55,14 +59,20 @@ class NegotiateServerBitTorrent(NegotiateServerModule):
         sha1 = self._stream_to_sha1(stream)
         if sha1 not in self.peers:
             test_version = int(request_body.get('test_version', 1))
-            if test_version < 1 or test_version > 2:
+            if test_version < 1 or test_version > 3:
                 raise ValueError('Invalid test_version')
             target_bytes = int(request_body.get('target_bytes', 0))
             if target_bytes < 0:
                 raise ValueError('Invalid target_bytes')
+            streams = int(request_body.get('streams', 1))
+            if streams < 1 or streams > MAXSTREAMS:
+                raise ValueError('Invalid streams')
             # Create record for this stream
             self.peers[sha1] = {'target_bytes': target_bytes,
-                                'test_version': test_version}
+                                'test_version': test_version,
+                                'streams': streams,
+                                'connected': 0,
+                                'flows': []}
             stream.atclose(self._update_peers)
             return {'authorization': self._stream_to_ident(stream)}
         else:
@@ -95,6 +105,9 @@ class NegotiateServerBitTorrent(NegotiateServerModule):
             #
             request_body['timestamp'] = result['timestamp']
             request_body['upload_speed'] = result['upload_speed']
+            request_body['upload_speeds'] = json.dumps(
+                                              result['upload_speeds'])
+            request_body['streams'] = result['streams']
 
             if privacy.collect_allowed(request_body):
                 BACKEND.bittorrent_store(request_body)
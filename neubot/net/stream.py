@@ -44,13 +44,17 @@ except ImportError:
 if __name__ == "__main__":
     sys.path.insert(0, ".")
 
+from neubot.buffer_pool import BUFFER_POOL
 from neubot.config import CONFIG
 from neubot.log import oops
 from neubot.net.poller import POLLER
 from neubot.net.poller import Pollable
+from neubot.listener import MAXACCEPT
 
+from neubot import connector
 from neubot import utils
 from neubot import utils_net
+from neubot import utils_sendfile
 
 from neubot.main import common
 
@@ -63,10 +67,38 @@ MAXBUF = 1 << 18
 # Soft errors on sockets, i.e. we can retry later
 SOFT_ERRORS = [ errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR ]
 
+#
+# We gather small pieces of the send queue (e.g. the headers and
+# the body of an HTTP message) and we send them with a single
+# system call.  Python 2 sockets have no sendmsg(), so we join the
+# pieces, and we gather little to avoid copying big pieces.
+#
+MAXGATHER = 1 << 14
+MAXIOV = 64
+
 if ssl:
     class SSLWrapper(object):
-        def __init__(self, sock):
+        def __init__(self, sock, handshake):
             self.sock = sock
+            self.handshake = handshake
+
+        #
+        # We run the handshake steps by ourself, rather than letting
+        # SSL_read() and SSL_write() do that, so that we can measure
+        # them (see neubot/sslstream.py).
+        #
+        def _handshake(self):
+            try:
+                self.handshake.step()
+            except ssl.SSLError, exception:
+                if exception[0] == ssl.SSL_ERROR_WANT_READ:
+                    return WANT_READ, None
+                elif exception[0] == ssl.SSL_ERROR_WANT_WRITE:
+                    return WANT_WRITE, None
+                else:
+                    return ERROR, exception
+            self.handshake = None
+            return SUCCESS, None
 
         def soclose(self):
             try:
@@ -75,6 +107,10 @@ if ssl:
                 logging.error('Exception', exc_info=1)
 
         def sorecv(self, maxlen):
+            if self.handshake:
+                status, exception = self._handshake()
+                if status != SUCCESS:
+                    return status, exception or ""
             try:
                 octets = self.sock.read(maxlen)
                 return SUCCESS, octets
@@ -86,7 +122,29 @@ if ssl:
                 else:
                     return ERROR, exception
 
+        def sorecv_into(self, buff, maxlen):
+            if self.handshake:
+                status, exception = self._handshake()
+                if status != SUCCESS:
+                    return status, exception or ""
+            try:
+                count = self.sock.recv_into(buff, min(maxlen, len(buff)))
+                if count == 0:
+                    return SUCCESS, ""
+                return SUCCESS, buffer(buff, 0, count)
+            except ssl.SSLError, exception:
+                if exception[0] == ssl.SSL_ERROR_WANT_READ:
+                    return WANT_READ, ""
+                elif exception[0] == ssl.SSL_ERROR_WANT_WRITE:
+                    return WANT_WRITE, ""
+                else:
+                    return ERROR, exception
+
         def sosend(self, octets):
+            if self.handshake:
+                status, exception = self._handshake()
+                if status != SUCCESS:
+                    return status, exception or 0
             try:
                 count = self.sock.write(octets)
                 return SUCCESS, count
@@ -98,6 +156,11 @@ if ssl:
                 else:
                     return ERROR, exception
 
+        def sosendv(self, vector):
+            if len(vector) == 1:
+                return self.sosend(vector[0])
+            return self.sosend("".join([str(piece) for piece in vector]))
+
 class SocketWrapper(object):
     def __init__(self, sock):
         self.sock = sock
@@ -120,6 +183,20 @@ class SocketWrapper(object):
             else:
                 return ERROR, exception
 
+    def sorecv_into(self, buff, maxlen):
+        try:
+            count = self.sock.recv_into(buff, min(maxlen, len(buff)))
+            if count == 0:
+                return SUCCESS, ""
+            return SUCCESS, buffer(buff, 0, count)
+        except socket.error, exception:
+            if exception[0] in SOFT_ERRORS:
+                return WANT_READ, ""
+            elif exception[0] == errno.ECONNRESET:
+                return CONNRESET, ""
+            else:
+                return ERROR, exception
+
     def sosend(self, octets):
         try:
             count = self.sock.send(octets)
@@ -132,6 +209,25 @@ class SocketWrapper(object):
             else:
                 return ERROR, exception
 
+    def sosendv(self, vector):
+        if len(vector) == 1:
+            return self.sosend(vector[0])
+        return self.sosend("".join([str(piece) for piece in vector]))
+
+    def sosendfile(self, filep):
+        fileno, offset, count = utils_sendfile.region(filep)
+        try:
+            count = utils_sendfile.sendfile(self.sock.fileno(), fileno,
+                                            offset, count)
+            return SUCCESS, count
+        except (OSError, socket.error), exception:
+            if exception[0] in SOFT_ERRORS:
+                return WANT_WRITE, 0
+            elif exception[0] == errno.ECONNRESET:
+                return CONNRESET, 0
+            else:
+                return ERROR, exception
+
 class Stream(Pollable):
     def __init__(self, poller):
         Pollable.__init__(self)
@@ -152,6 +248,23 @@ class Stream(Pollable):
         self.recv_blocked = False
         self.recv_pending = False
         self.recv_ssl_needs_kickoff = False
+
+        #
+        # When this is True recv_complete() receives a view of a
+        # buffer from BUFFER_POOL, which is valid only until the
+        # recv_complete() returns.  Subclasses that just count or
+        # skip the received bytes should set it.
+        #
+        self.recv_viewmode = False
+
+        #
+        # When this is True and the send queue contains a file-like
+        # backed by a regular file, we send it using sendfile(), and
+        # in such case self.send_octets is the file-like.  We cannot
+        # use sendfile() with SSL, of course.
+        #
+        self.send_file_ok = False
+
         self.send_blocked = False
         self.send_octets = None
         self.send_queue = collections.deque()
@@ -159,6 +272,7 @@ class Stream(Pollable):
 
         self.bytes_recv_tot = 0
         self.bytes_sent_tot = 0
+        self.handshake = None
 
         self.opaque = None
         self.atclosev = set()
@@ -192,14 +306,16 @@ class Stream(Pollable):
             if not certfile:
                 certfile = None
 
-            ssl_sock = ssl.wrap_socket(sock, do_handshake_on_connect=False,
-              certfile=certfile, server_side=server_side)
-            self.sock = SSLWrapper(ssl_sock)
+            from neubot import sslstream
+            ssl_sock = sslstream.wrap_socket(sock, certfile, server_side)
+            self.handshake = sslstream.HandshakeTimer(ssl_sock, server_side)
+            self.sock = SSLWrapper(ssl_sock, self.handshake)
 
             self.recv_ssl_needs_kickoff = not server_side
 
         else:
             self.sock = SocketWrapper(sock)
+            self.send_file_ok = utils_sendfile.HAVE_SENDFILE
 
         self.connection_made()
 
@@ -287,7 +403,12 @@ class Stream(Pollable):
             self.handle_write()
             return
 
-        status, octets = self.sock.sorecv(MAXBUF)
+        if not self.recv_viewmode:
+            buff = None
+            status, octets = self.sock.sorecv(MAXBUF)
+        else:
+            buff = BUFFER_POOL.get()
+            status, octets = self.sock.sorecv_into(buff, MAXBUF)
 
         if status == SUCCESS and octets:
 
@@ -296,8 +417,13 @@ class Stream(Pollable):
             self.poller.unset_readable(self)
 
             self.recv_complete(octets)
+            if buff:
+                BUFFER_POOL.put(buff)
             return
 
+        if buff:
+            BUFFER_POOL.put(buff)
+
         if status == WANT_READ:
             return
 
@@ -333,12 +459,20 @@ class Stream(Pollable):
 
         while self.send_queue:
             octets = self.send_queue[0]
-            if isinstance(octets, basestring):
+            if isinstance(octets, (basestring, buffer)):
                 # remove the piece in any case
                 self.send_queue.popleft()
                 if octets:
                     break
             else:
+                if self.send_file_ok:
+                    region = utils_sendfile.region(octets)
+                    if region:
+                        self.send_queue.popleft()
+                        if region[2] > 0:
+                            break
+                        octets = ""
+                        continue
                 octets = octets.read(MAXBUF)
                 if octets:
                     break
@@ -352,6 +486,46 @@ class Stream(Pollable):
 
         return octets
 
+    def gather_send_queue(self, octets):
+        vector = [octets]
+        total = len(octets)
+
+        while (self.send_queue and len(vector) < MAXIOV and
+               total < MAXGATHER):
+            octets = self.send_queue[0]
+            if isinstance(octets, (basestring, buffer)):
+                # don't copy big pieces, we'll send them later
+                if len(octets) > MAXGATHER - total:
+                    break
+                self.send_queue.popleft()
+            else:
+                # don't read big files, we'll sendfile() them later
+                if self.send_file_ok:
+                    region = utils_sendfile.region(octets)
+                    if region and region[2] > MAXGATHER - total:
+                        break
+                #
+                # Read as much as read_send_queue() would, because some
+                # file-likes (e.g. BytegenSpeedtest) only return whole
+                # pieces, and send later what does not fit.
+                #
+                octets = octets.read(MAXBUF)
+                if not octets:
+                    # remove the file-like when it is empty
+                    self.send_queue.popleft()
+                    continue
+                if len(octets) > MAXGATHER - total:
+                    self.send_queue.appendleft(octets)
+                    break
+            if octets:
+                if type(octets) == types.UnicodeType:
+                    oops("Received unicode input")
+                    octets = octets.encode("utf-8")
+                vector.append(octets)
+                total += len(octets)
+
+        return vector
+
     def start_send(self, octets):
         if self.close_complete or self.close_pending:
             return
@@ -380,31 +554,64 @@ class Stream(Pollable):
             self.handle_read()
             return
 
-        status, count = self.sock.sosend(self.send_octets)
+        if isinstance(self.send_octets, (basestring, buffer)):
+            vector = self.gather_send_queue(self.send_octets)
+            status, count = self.sock.sosendv(vector)
+        else:
+            vector = None
+            status, count = self.sock.sosendfile(self.send_octets)
 
         if status == SUCCESS and count > 0:
             self.bytes_sent_tot += count
 
-            if count == len(self.send_octets):
+            if vector is None:
+                utils_sendfile.advance(self.send_octets, count)
+                if utils_sendfile.region(self.send_octets)[2] > 0:
+                    return
 
-                self.send_octets = self.read_send_queue()
-                if self.send_octets:
+            else:
+                # Move the cursor forward
+                index = 0
+                while index < len(vector) and count >= len(vector[index]):
+                    count -= len(vector[index])
+                    index += 1
+
+                if index < len(vector):
+                    # Put back what we've not sent
+                    self.send_queue.extendleft(reversed(vector[index + 1:]))
+                    self.send_octets = vector[index]
+                    if count > 0:
+                        self.send_octets = buffer(self.send_octets, count)
+                    self.poller.set_writable(self)
                     return
 
-                self.send_pending = False
-                self.poller.unset_writable(self)
+                if count > 0:
+                    raise RuntimeError("Sent more than expected")
 
-                self.send_complete()
-                if self.close_pending:
-                    self.poller.close(self)
+            self.send_octets = self.read_send_queue()
+            if self.send_octets:
                 return
 
-            if count < len(self.send_octets):
-                self.send_octets = buffer(self.send_octets, count)
-                self.poller.set_writable(self)
-                return
+            self.send_pending = False
+            self.poller.unset_writable(self)
 
-            raise RuntimeError("Sent more than expected")
+            self.send_complete()
+            if self.close_pending:
+                self.poller.close(self)
+            return
+
+        #
+        # Fall back to read() and send() if this file does not
+        # support sendfile(), e.g. because it lives on a file system
+        # that does not implement it.
+        #
+        if (status == ERROR and vector is None and
+            count[0] in utils_sendfile.UNSUPPORTED):
+            logging.debug("stream: sendfile() failed: %s", str(count))
+            self.send_file_ok = False
+            self.send_queue.appendleft(self.send_octets)
+            self.send_octets = self.read_send_queue()
+            return
 
         if status == WANT_WRITE:
             return
@@ -437,68 +644,35 @@ class Stream(Pollable):
     def send_complete(self):
         pass
 
-class Connector(Pollable):
+class Connector(object):
+
+    #
+    # Adapter that uses neubot/connector.py, which races the
+    # connection attempts, on behalf of the old-style stream
+    # handlers.
+    #
+
     def __init__(self, poller, parent):
-        Pollable.__init__(self)
         self.poller = poller
         self.parent = parent
-        self.sock = None
-        self.timestamp = 0
         self.endpoint = None
-        self.epnts = collections.deque()
-        self.watchdog = 10
 
     def __repr__(self):
         return "connector to %s" % str(self.endpoint)
 
-    def _connection_failed(self):
-        if self.sock:
-            self.poller.unset_writable(self)
-            self.sock = None
-        if not self.epnts:
-            self.parent._connection_failed(self, None)
-            return
-        self.connect(self.epnts.popleft(), None)
-
     def connect(self, endpoint, conf):
-
-        # Connect first address in a list
-        if ' ' in endpoint[0]:
-            logging.debug('* Connecting to %s', str(endpoint))
-            for address in endpoint[0].split():
-                epnt = (address.strip(), endpoint[1])
-                self.epnts.append(epnt)
-            endpoint = self.epnts.popleft()
-
+        logging.debug('* Connecting to %s', str(endpoint))
         self.endpoint = endpoint
-
         prefer_ipv6 = CONFIG["prefer_ipv6"]
         if conf and "prefer_ipv6" in conf:
             prefer_ipv6 = conf["prefer_ipv6"]
-        sock = utils_net.connect(endpoint, prefer_ipv6)
-        if not sock:
-            self._connection_failed()
-            return
+        connector.Connector(self, endpoint, prefer_ipv6, None, None)
 
-        self.sock = sock
-        self.timestamp = utils.ticks()
-        self.poller.set_writable(self)
-
-    def fileno(self):
-        return self.sock.fileno()
+    def handle_connect(self, connector_, sock, rtt, sslconfig, extra):
+        self.parent._connection_made(sock, connector_.winner, rtt)
 
-    def handle_write(self):
-        self.poller.unset_writable(self)
-
-        if not utils_net.isconnected(self.endpoint, self.sock):
-            self._connection_failed()
-            return
-
-        rtt = utils.ticks() - self.timestamp
-        self.parent._connection_made(self.sock, self.endpoint, rtt)
-
-    def handle_close(self):
-        self._connection_failed()
+    def handle_connect_error(self, connector_):
+        self.parent._connection_failed(self, None)
 
 class Listener(Pollable):
     def __init__(self, poller, parent, sock, endpoint):
@@ -527,15 +701,23 @@ class Listener(Pollable):
     # listening for new connections.
     #
     def handle_read(self):
-        try:
-            sock = self.lsock.accept()[0]
-            sock.setblocking(False)
-            self.parent.connection_made(sock, self.endpoint, 0)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception, exception:
-            self.parent.accept_failed(self, exception)
-            return
+        for _ in range(MAXACCEPT):
+            try:
+                sock = self.lsock.accept()[0]
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception, exception:
+                if getattr(exception, 'errno',
+                           None) not in utils_net.WOULDBLOCK:
+                    self.parent.accept_failed(self, exception)
+                return
+            try:
+                sock.setblocking(False)
+                self.parent.connection_made(sock, self.endpoint, 0)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception, exception:
+                self.parent.accept_failed(self, exception)
 
     def handle_close(self):
         self.parent.bind_failed(self.endpoint)  # XXX
@@ -553,7 +735,8 @@ class StreamHandler(object):
         self.conf = conf
 
     def listen(self, endpoint):
-        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'])
+        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'],
+                                   CONFIG['net.listen.reuseport'])
         if not sockets:
             self.bind_failed(endpoint)
             return
@@ -636,6 +819,7 @@ class GenericProtocolStream(Stream):
         if duration >= 0:
             POLLER.sched(duration, self._do_close)
         if self.kind == "discard":
+            self.recv_viewmode = True
             self.start_recv()
         elif self.kind == "chargen":
             self.start_send(self.buffer)
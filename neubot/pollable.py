@@ -37,9 +37,51 @@ class Pollable(object):
 
     ''' Base class for pollable objects '''
 
+    #
+    # The poller keeps an index of the watchdog deadlines of
+    # the pollables it monitors, therefore `created` and
+    # `watchdog` are properties and we tell the poller when
+    # they change.  Code can keep assigning them directly.
+    #
+
     def __init__(self):
-        self.created = utils.ticks()
-        self.watchdog = WATCHDOG
+        self.indexed_deadline = None
+        self.indexed_poller = None
+        self._created = utils.ticks()
+        self._watchdog = WATCHDOG
+
+    def _get_created(self):
+        ''' Get creation (or last activity) time '''
+        return self._created
+
+    def _set_created(self, value):
+        ''' Set creation (or last activity) time '''
+        self._created = value
+        self._deadline_changed()
+
+    created = property(_get_created, _set_created)
+
+    def _get_watchdog(self):
+        ''' Get watchdog timeout '''
+        return self._watchdog
+
+    def _set_watchdog(self, value):
+        ''' Set watchdog timeout '''
+        self._watchdog = value
+        self._deadline_changed()
+
+    watchdog = property(_get_watchdog, _set_watchdog)
+
+    def _deadline_changed(self):
+        ''' Tell the poller that the deadline has changed '''
+        if self.indexed_poller:
+            self.indexed_poller.update_watchdog(self)
+
+    def watchdog_deadline(self):
+        ''' Return watchdog deadline or None if there's no watchdog '''
+        if self._watchdog < 0:
+            return None
+        return self._created + self._watchdog
 
     def fileno(self):
         ''' Return file descriptor number '''
@@ -60,5 +102,5 @@ class Pollable(object):
 
     def set_timeout(self, timeo):
         ''' Set timeout of this pollable '''
-        self.created = utils.ticks()
+        self._created = utils.ticks()
         self.watchdog = timeo
@@ -26,81 +26,105 @@
 # Was neubot/net/poller.py
 # Python3-ready: yes
 
+import heapq
+import itertools
 import logging
 import errno
 import select
-import sched
 import sys
 
+from neubot.config import CONFIG
 from neubot.utils import ticks
 from neubot.utils import timestamp
 
+from neubot import poller_engine
+from neubot import poller_timers
+
 #
 # Number of seconds between each check for timed-out
 # I/O operations.
 #
 CHECK_TIMEOUT = 10
 
-class Poller(sched.scheduler):
+class Poller(object):
 
     ''' Dispatch read, write, periodic and other events '''
 
     #
     # We always keep the check_timeout() event registered
-    # so the scheduler is alive forever.
-    # We register self._poll() as the delay function and
-    # in that function we either invoke select() or we
-    # sleep for the requested amount of time.
+    # so the timer wheel is alive forever.
+    # At each iteration of run() we fire expired timers and
+    # then we invoke self._poll() where we wait for I/O until
+    # the next timer is expected to expire.
     #
 
     def __init__(self, select_timeout):
         ''' Initialize '''
-        sched.scheduler.__init__(self, ticks, self._poll)
         self.select_timeout = select_timeout
         self.again = True
         self.readset = {}
         self.writeset = {}
+        self.engine = None
+        self.timers = poller_timers.TimerWheel()
+        self.watchdogs = []
+        self.watchdog_seq = itertools.count()
         self.check_timeout()
 
+    #
+    # The engine is created lazily, when the first stream is
+    # registered, so that the `poller.engine` setting has been
+    # read from the database and from the command line before
+    # we pick the engine (the poller is created at import time).
+    #
+
+    def _update_interest(self, fileno, setmask, clearmask):
+        ''' Update the interest of fileno known by the engine '''
+        if not self.engine:
+            self.engine = poller_engine.create(CONFIG['poller.engine'])
+        mask = self.engine.interest.get(fileno, 0)
+        self.engine.modify(fileno, (mask | setmask) & ~clearmask)
+
     def sched(self, delta, func, *args):
         ''' Schedule task '''
         #logging.debug('poller: sched: %s, %s, %s', delta, func, args)
-        self.enter(delta, 0, self._run_task, (func, args))
+        self.timers.schedule(ticks(), delta, func, args)
         return timestamp() + delta
 
-    @staticmethod
-    def _run_task(func, args):
-        ''' Safely run task '''
-        #logging.debug('poller: run_task: %s, %s', func, args)
-        try:
-            if args:
-                func(args)
-            else:
-                func()
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except:
-            logging.error('poller: run_task() failed', exc_info=1)
+    def schedule(self, delta, func, *args):
+        ''' Schedule task and return a timer that can be cancelled '''
+        return self.timers.schedule(ticks(), delta, func, args)
 
     def set_readable(self, stream):
         ''' Monitor for readability '''
-        self.readset[stream.fileno()] = stream
+        fileno = stream.fileno()
+        registered = fileno in self.readset
+        self.readset[fileno] = stream
+        if not registered:
+            self._update_interest(fileno, poller_engine.READ, 0)
+            self.update_watchdog(stream)
 
     def set_writable(self, stream):
         ''' Monitor for writability '''
-        self.writeset[stream.fileno()] = stream
+        fileno = stream.fileno()
+        registered = fileno in self.writeset
+        self.writeset[fileno] = stream
+        if not registered:
+            self._update_interest(fileno, poller_engine.WRITE, 0)
+            self.update_watchdog(stream)
 
     def unset_readable(self, stream):
         ''' Stop monitoring for readability '''
         fileno = stream.fileno()
         if fileno in self.readset:
             del self.readset[fileno]
+            self._update_interest(fileno, 0, poller_engine.READ)
 
     def unset_writable(self, stream):
         ''' Stop monitoring for writability '''
         fileno = stream.fileno()
         if fileno in self.writeset:
             del self.writeset[fileno]
+            self._update_interest(fileno, 0, poller_engine.WRITE)
 
     def close(self, stream):
         ''' Safely close a stream '''
@@ -153,12 +177,18 @@ class Poller(sched.scheduler):
         ''' Break out of poller loop '''
         self.again = False
 
+    def run(self):
+        ''' Run expired timers and dispatch I/O events '''
+        while True:
+            self.timers.run(ticks())
+            self._poll(self.timers.timeout(ticks()))
+
     def loop(self):
         ''' Poller loop '''
         while True:
             try:
                 self.run()
-            except (SystemExit, select.error):
+            except (SystemExit, select.error, EnvironmentError):
                 raise
             except KeyboardInterrupt:
                 break  # overriden semantic: break out of poller loop NOW
@@ -177,13 +207,12 @@ class Poller(sched.scheduler):
 
             # Get list of readable/writable streams
             try:
-                res = select.select(list(self.readset.keys()),
-                                    list(self.writeset.keys()),
-                                    [], timeout)
-            except select.error:
-                code = sys.exc_info()[1][0]
+                res = self.engine.poll(timeout)
+            except (select.error, IOError, OSError):
+                code = sys.exc_info()[1].args[0]
                 if code != errno.EINTR:
-                    logging.error('poller: select() failed', exc_info=1)
+                    logging.error('poller: %s() failed', self.engine.name,
+                                  exc_info=1)
                     raise
 
                 else:
@@ -200,26 +229,92 @@ class Poller(sched.scheduler):
         else:
             raise KeyboardInterrupt('poller: no I/O pending')
 
+    #
+    # The watchdog index is a min-heap of (deadline, seq, stream)
+    # where deadline is `created + watchdog`.  Entries are never
+    # removed from the middle of the heap: when the deadline of a
+    # stream is postponed we keep the old entry and we re-arm it
+    # with the new deadline when it expires, and when the deadline
+    # is anticipated we add a new entry and the old one becomes
+    # stale (stream.indexed_deadline tells which one is current).
+    # So check_timeout() only touches expired and stale entries.
+    #
+
+    def update_watchdog(self, stream):
+        ''' Make sure the watchdog index knows stream deadline '''
+        deadline = stream.watchdog_deadline()
+        if deadline is None:
+            return
+        if (stream.indexed_deadline is not None and
+              stream.indexed_deadline <= deadline):
+            return
+        stream.indexed_deadline = deadline
+        stream.indexed_poller = self
+        heapq.heappush(self.watchdogs, (deadline,
+          next(self.watchdog_seq), stream))
+
+    def _is_registered(self, stream):
+        ''' Returns True if stream is readable or writable '''
+        try:
+            fileno = stream.fileno()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            return False
+        return (self.readset.get(fileno) is stream or
+                self.writeset.get(fileno) is stream)
+
     def check_timeout(self):
         ''' Dispatch the periodic event '''
 
         self.sched(CHECK_TIMEOUT, self.check_timeout)
-        if self.readset or self.writeset:
 
+        timenow = ticks()
+        rearm = []
+        while self.watchdogs and self.watchdogs[0][0] < timenow:
+            deadline, _, stream = heapq.heappop(self.watchdogs)
+            if stream.indexed_deadline != deadline:
+                continue  # Stale entry
+            stream.indexed_deadline = None
+            if not self._is_registered(stream):
+                continue
+            if stream.handle_periodic(timenow):
+                logging.debug('poller: watchdog timeout: %s', str(stream))
+                self.close(stream)
+            else:
+                rearm.append(stream)
+        for stream in rearm:
+            self.update_watchdog(stream)
+
+        #
+        # Closed streams stay in the heap until their deadline
+        # expires, so periodically get rid of the stale entries
+        # if they are the majority.
+        #
+        if len(self.watchdogs) > 2 * (len(self.readset) +
+                                      len(self.writeset)) + 64:
+            for entry in self.watchdogs:
+                entry[2].indexed_deadline = None
+            self.watchdogs = []
             streams = set()
             streams.update(list(self.readset.values()))
             streams.update(list(self.writeset.values()))
-
-            timenow = ticks()
             for stream in streams:
-                if stream.handle_periodic(timenow):
-                    logging.debug('poller: watchdog timeout: %s', str(stream))
-                    self.close(stream)
+                self.update_watchdog(stream)
 
     def snap(self, data):
         ''' Take a snapshot of poller state '''
         data['poller'] = { "readset": self.readset, "writeset": self.writeset }
-        if hasattr(self, 'queue'):
-            data['poller']['queue'] = self.queue
+        if self.engine:
+            data['poller']['engine'] = self.engine.name
+        data['poller']['queue'] = self.timers.snap()
+
+CONFIG.register_defaults({
+    'poller.engine': 'auto',
+})
+
+CONFIG.register_descriptions({
+    'poller.engine': 'I/O engine (auto, epoll, kqueue, poll or select)',
+})
 
 POLLER = Poller(1)
@@ -0,0 +1,306 @@
+# neubot/poller_engine.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' I/O multiplexing engines used by the poller '''
+
+# Python3-ready: yes
+
+#
+# Each engine keeps track of the interest set of each file
+# descriptor, so that the poller just tells the engine the
+# new interest of a file descriptor and the engine issues
+# the minimum number of system calls to update the kernel
+# state (with epoll and kqueue the registration persists
+# across calls to poll(), with select it is rebuilt each
+# time but that is unavoidable).
+#
+# All engines are level-triggered: as long as a socket is
+# readable (or writable) and we're interested in the event,
+# each call to poll() returns it.  This is the semantic the
+# rest of Neubot expects, since it was written on top of the
+# select() system call.
+#
+
+import errno
+import logging
+import select
+import sys
+
+# Interest flags
+READ, WRITE = 1, 2
+
+class SelectEngine(object):
+
+    ''' Engine based on select() '''
+
+    name = 'select'
+
+    def __init__(self):
+        self.interest = {}
+
+    def modify(self, fileno, mask):
+        ''' Modify the interest set of fileno '''
+        if mask:
+            self.interest[fileno] = mask
+        elif fileno in self.interest:
+            del self.interest[fileno]
+
+    def poll(self, timeout):
+        ''' Poll for I/O and return readable and writable filenos '''
+        readset, writeset = [], []
+        for fileno, mask in self.interest.items():
+            if mask & READ:
+                readset.append(fileno)
+            if mask & WRITE:
+                writeset.append(fileno)
+        res = select.select(readset, writeset, [], timeout)
+        return res[0], res[1]
+
+    def close(self):
+        ''' Release engine resources '''
+        self.interest.clear()
+
+class PollEngine(SelectEngine):
+
+    ''' Engine based on poll() '''
+
+    name = 'poll'
+
+    # Note: getattr() because not all platforms have poll()
+    _readmask = getattr(select, 'POLLIN', 0) | getattr(select, 'POLLPRI', 0)
+    _writemask = getattr(select, 'POLLOUT', 0)
+    _errmask = (getattr(select, 'POLLERR', 0) | getattr(select, 'POLLHUP', 0)
+                | getattr(select, 'POLLNVAL', 0))
+
+    def __init__(self):
+        SelectEngine.__init__(self)
+        self.pollobj = select.poll()
+
+    def _translate(self, mask):
+        ''' Translate our mask into the kernel mask '''
+        result = 0
+        if mask & READ:
+            result |= self._readmask
+        if mask & WRITE:
+            result |= self._writemask
+        return result
+
+    def modify(self, fileno, mask):
+        oldmask = self.interest.get(fileno, 0)
+        if mask == oldmask:
+            return
+        if not mask:
+            del self.interest[fileno]
+            try:
+                self.pollobj.unregister(fileno)
+            except KeyError:
+                pass
+            return
+        self.interest[fileno] = mask
+        # Note: with poll() register() also modifies
+        self.pollobj.register(fileno, self._translate(mask))
+
+    def _wait(self, timeout):
+        ''' Wait for events '''
+        if timeout is None or timeout < 0:
+            return self.pollobj.poll()
+        return self.pollobj.poll(int(timeout * 1000))
+
+    def poll(self, timeout):
+        readset, writeset = [], []
+        for fileno, events in self._wait(timeout):
+            #
+            # Errors are reported to both handlers (as select()
+            # does) so that they see the error when they invoke
+            # recv() or send() on the socket.
+            #
+            if events & (self._readmask | self._errmask):
+                readset.append(fileno)
+            if events & (self._writemask | self._errmask):
+                writeset.append(fileno)
+        return readset, writeset
+
+    def close(self):
+        SelectEngine.close(self)
+        self.pollobj = None
+
+class EpollEngine(PollEngine):
+
+    ''' Engine based on Linux epoll() '''
+
+    name = 'epoll'
+
+    _readmask = getattr(select, 'EPOLLIN', 0) | getattr(select, 'EPOLLPRI', 0)
+    _writemask = getattr(select, 'EPOLLOUT', 0)
+    _errmask = getattr(select, 'EPOLLERR', 0) | getattr(select, 'EPOLLHUP', 0)
+
+    def __init__(self):
+        SelectEngine.__init__(self)
+        self.pollobj = select.epoll()
+
+    def modify(self, fileno, mask):
+        oldmask = self.interest.get(fileno, 0)
+        if mask == oldmask:
+            return
+
+        if not mask:
+            del self.interest[fileno]
+            try:
+                self.pollobj.unregister(fileno)
+            except (IOError, OSError, ValueError):
+                # The kernel already forgot fileno when it was closed
+                pass
+            return
+
+        self.interest[fileno] = mask
+        events = self._translate(mask)
+
+        #
+        # The kernel removes a file descriptor from the epoll set
+        # when it's closed, hence oldmask might be stale if code
+        # closed a socket without clearing its interest first and
+        # then the file descriptor number was reused.  Therefore
+        # we try to fix things up when the kernel disagrees with
+        # what we believe.
+        #
+        try:
+            if oldmask:
+                self.pollobj.modify(fileno, events)
+            else:
+                self.pollobj.register(fileno, events)
+        except (IOError, OSError):
+            code = _get_errno()
+            if code == errno.ENOENT:
+                self.pollobj.register(fileno, events)
+            elif code == errno.EEXIST:
+                self.pollobj.modify(fileno, events)
+            else:
+                del self.interest[fileno]
+                raise
+
+    def _wait(self, timeout):
+        if timeout is None:
+            timeout = -1
+        return self.pollobj.poll(timeout, max(1, len(self.interest)))
+
+    def close(self):
+        SelectEngine.close(self)
+        self.pollobj.close()
+
+class KqueueEngine(SelectEngine):
+
+    ''' Engine based on BSD kqueue() '''
+
+    name = 'kqueue'
+
+    def __init__(self):
+        SelectEngine.__init__(self)
+        self.kqueue = select.kqueue()
+
+    def modify(self, fileno, mask):
+        oldmask = self.interest.get(fileno, 0)
+        if mask == oldmask:
+            return
+        if mask:
+            self.interest[fileno] = mask
+        else:
+            del self.interest[fileno]
+
+        changes = []
+        for flag, kfilter in ((READ, select.KQ_FILTER_READ),
+                              (WRITE, select.KQ_FILTER_WRITE)):
+            if (mask & flag) and not (oldmask & flag):
+                changes.append(select.kevent(fileno, kfilter,
+                                             select.KQ_EV_ADD))
+            elif (oldmask & flag) and not (mask & flag):
+                changes.append(select.kevent(fileno, kfilter,
+                                             select.KQ_EV_DELETE))
+
+        #
+        # One change at a time, because otherwise a failure in
+        # deleting a filter for an already-closed file descriptor
+        # would prevent the other changes from being applied.
+        #
+        for change in changes:
+            try:
+                self.kqueue.control([change], 0, 0)
+            except (IOError, OSError):
+                if change.flags != select.KQ_EV_DELETE:
+                    raise
+
+    def poll(self, timeout):
+        if timeout is not None and timeout < 0:
+            timeout = None
+        readset, writeset = [], []
+        maxevents = max(1, 2 * len(self.interest))
+        for kevent in self.kqueue.control(None, maxevents, timeout):
+            if kevent.flags & select.KQ_EV_ERROR:
+                readset.append(kevent.ident)
+                writeset.append(kevent.ident)
+            elif kevent.filter == select.KQ_FILTER_READ:
+                readset.append(kevent.ident)
+            elif kevent.filter == select.KQ_FILTER_WRITE:
+                writeset.append(kevent.ident)
+        return readset, writeset
+
+    def close(self):
+        SelectEngine.close(self)
+        self.kqueue.close()
+
+def _get_errno():
+    ''' Return the errno of the exception being handled '''
+    exception = sys.exc_info()[1]
+    code = getattr(exception, 'errno', None)
+    if code is None and exception.args:
+        code = exception.args[0]
+    return code
+
+ENGINES = {
+    'epoll': (EpollEngine, 'epoll'),
+    'kqueue': (KqueueEngine, 'kqueue'),
+    'poll': (PollEngine, 'poll'),
+    'select': (SelectEngine, 'select'),
+}
+
+# Order of preference when the engine is `auto`
+AUTO = ('epoll', 'kqueue', 'poll', 'select')
+
+def is_available(name):
+    ''' Returns True if the named engine is available '''
+    if name not in ENGINES:
+        return False
+    return hasattr(select, ENGINES[name][1])
+
+def create(name):
+    ''' Create the named engine (or the best one, if name is auto) '''
+    if name == 'auto':
+        for candidate in AUTO:
+            if is_available(candidate):
+                name = candidate
+                break
+    if not is_available(name):
+        logging.warning('poller: engine %s not available; using select',
+                        name)
+        name = 'select'
+    logging.debug('poller: using %s engine', name)
+    return ENGINES[name][0]()
@@ -0,0 +1,145 @@
+# neubot/poller_timers.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Timers used by the poller '''
+
+# Python3-ready: yes
+
+#
+# This is a hashed timing wheel with a heap of slots.  The
+# time is divided into slots of GRANULARITY seconds and each
+# timer is hashed into the slot that contains its deadline.
+# Each slot is a list of timers, and the heap only contains
+# the numbers of the slots that are not empty.
+#
+# Most timers in Neubot are periodic (1 s snapshots of the
+# raw test, notifier, logger, watchdog) and are rescheduled
+# from within the same poller iteration, so they end up in
+# the same slot.  Therefore, insert is O(1) in the common
+# case and O(log n) in the worst case, where n is the number
+# of non-empty slots (not the number of timers).  Cancel is
+# O(1): the timer is just marked as cancelled and skipped
+# when its slot expires.
+#
+# A slot expires when its end is reached, so a timer might
+# fire up to GRANULARITY seconds late but never early, which
+# is the same guarantee provided by sched.scheduler.
+#
+
+import heapq
+import logging
+
+# Size of a slot in seconds
+GRANULARITY = 0.01
+
+class Timer(object):
+
+    ''' A cancellable timer '''
+
+    __slots__ = ('deadline', 'func', 'args')
+
+    def __init__(self, deadline, func, args):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+
+    def cancel(self):
+        ''' Cancel this timer '''
+        self.func = None
+        self.args = None
+
+    def cancelled(self):
+        ''' Returns True if this timer has been cancelled '''
+        return self.func is None
+
+    def __repr__(self):
+        return 'timer(%f, %s, %s)' % (self.deadline, self.func, self.args)
+
+class TimerWheel(object):
+
+    ''' A hashed timing wheel '''
+
+    def __init__(self, granularity=GRANULARITY):
+        self.granularity = granularity
+        self.slots = {}
+        self.heap = []
+
+    def __len__(self):
+        ''' Return the number of pending timers '''
+        count = 0
+        for timers in self.slots.values():
+            for timer in timers:
+                if not timer.cancelled():
+                    count += 1
+        return count
+
+    def schedule(self, now, delta, func, args):
+        ''' Schedule func(args) after delta seconds and return a timer '''
+        timer = Timer(now + delta, func, args)
+        slot = int(timer.deadline / self.granularity)
+        timers = self.slots.get(slot)
+        if timers is None:
+            timers = self.slots[slot] = []
+            heapq.heappush(self.heap, slot)
+        timers.append(timer)
+        return timer
+
+    def timeout(self, now):
+        ''' Seconds until the next slot expires or None if no timers '''
+        if not self.heap:
+            return None
+        return max(0, (self.heap[0] + 1) * self.granularity - now)
+
+    def expired(self, now):
+        ''' Remove and return the list of expired timers '''
+        result = []
+        current = int(now / self.granularity)
+        while self.heap and self.heap[0] < current:
+            slot = heapq.heappop(self.heap)
+            result.extend(self.slots.pop(slot))
+        return result
+
+    def run(self, now):
+        ''' Run expired timers '''
+        for timer in self.expired(now):
+            func, args = timer.func, timer.args
+            if func is None:
+                continue
+            timer.cancel()
+            try:
+                if args:
+                    func(args)
+                else:
+                    func()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                logging.error('poller: run_task() failed', exc_info=1)
+
+    def snap(self):
+        ''' Return the sorted list of pending timers '''
+        timers = []
+        for slot in sorted(self.slots):
+            timers.extend(timer for timer in self.slots[slot]
+                          if not timer.cancelled())
+        return timers
@@ -37,7 +37,7 @@ import sys
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
-from neubot.brigade import Brigade
+from neubot.brigade import RingBrigade
 from neubot.defer import Deferred
 from neubot.handler import Handler
 from neubot.poller import POLLER
@@ -55,12 +55,12 @@ AUTH_LEN = 64
 LEN_MESSAGE = 32768
 MAXRECV = 262144
 
-class ClientContext(Brigade):
+class ClientContext(RingBrigade):
 
     ''' Client context '''
 
     def __init__(self, state):
-        Brigade.__init__(self)
+        RingBrigade.__init__(self)
         self.ticks = 0.0
         self.count = 0
         self.left = 0
@@ -161,12 +161,14 @@ class RawClient(Handler):
 
     def _rawtest_sent(self, stream):
         ''' The RAWTEST message has been sent '''
-        stream.recv(MAXRECV, self._waiting_piece)
+        stream.recv_view(MAXRECV, self._waiting_piece)
 
     def _waiting_piece(self, stream, data):
         ''' Invoked when new data is available '''
         # Note: this loop cannot be adapted to process other messages
         # easily, as pointed out in <raw_defs.py>.
+        # Note: data is a view that is valid only until we return, so
+        # we unshare() the few unprocessed bytes before returning.
         context = stream.opaque
         context.bufferise(data)
         context.state['rcvr_data'].append((utils.ticks(), len(data)))
@@ -210,7 +212,8 @@ class RawClient(Handler):
                     return
             else:
                 raise RuntimeError('raw_clnt: internal error')
-        stream.recv(MAXRECV, self._waiting_piece)
+        context.unshare()
+        stream.recv_view(MAXRECV, self._waiting_piece)
 
     def _periodic(self, args):
         ''' Periodically snap goodput '''
@@ -36,7 +36,7 @@ import sys
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
-from neubot.brigade import Brigade
+from neubot.brigade import RingBrigade
 from neubot.defer import Deferred
 from neubot.handler import Handler
 from neubot.poller import POLLER
@@ -49,6 +49,7 @@ from neubot.raw_defs import PIECE_CODE
 from neubot.raw_defs import PING_CODE
 from neubot.raw_defs import PINGBACK
 from neubot.stream import Stream
+from neubot.utils_random import ARENA
 
 from neubot import six
 from neubot import utils
@@ -59,12 +60,12 @@ from neubot import web100
 LEN_MESSAGE = 32768
 MAXRECV = 262144
 
-class ServerContext(Brigade):
+class ServerContext(RingBrigade):
 
     ''' Server context '''
 
     def __init__(self):
-        Brigade.__init__(self)
+        RingBrigade.__init__(self)
         self.ticks = 0.0
         self.count = 0
         self.message = six.b('')
@@ -148,7 +149,7 @@ class RawServer(Handler):
         context.count = context.snap_count = stream.bytes_out
         context.ticks = context.snap_ticks = utils.ticks()
         context.snap_utime, context.snap_stime = os.times()[:2]
-        message = PIECE_CODE + context.auth * int(LEN_MESSAGE / AUTH_LEN)
+        message = PIECE_CODE + bytes(ARENA.view(LEN_MESSAGE))
         context.message = struct.pack('!I', len(message)) + message
         stream.send(context.message, self._piece_sent)
         #logging.debug('> PIECE')
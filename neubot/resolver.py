@@ -0,0 +1,227 @@
+# neubot/resolver.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Asynchronous name resolver '''
+
+#
+# getaddrinfo() blocks, and, when it ran on the poller thread, a slow
+# resolver froze all the tests in progress and made them measure bogus
+# latencies.  So, a small pool of resolver threads runs getaddrinfo()
+# on behalf of the poller thread, and the poller thread is woken up
+# via a self-pipe when the results are ready.  Numeric addresses do
+# not need a lookup, hence we resolve them immediately.  The pipe is
+# monitored only while lookups are pending: otherwise the poller loop
+# would never run out of I/O and would not return.
+#
+# We cache the results, so that connecting again and again to the
+# same host, e.g. master.neubot.org or an M-Lab server, does not cause
+# a lookup each time.  getaddrinfo() does not tell us the TTL of the
+# records, therefore we keep successful lookups for POSITIVE_TTL and
+# failed lookups for NEGATIVE_TTL seconds, which are well below the
+# TTLs typically used by the servers we connect to.
+#
+# On Windows pipes are not pollable, so we resolve synchronously, but
+# we still use the cache.
+#
+
+import collections
+import logging
+import os
+import socket
+import sys
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from neubot.poller import POLLER
+from neubot.wakeup_pipe import WakeupPipe
+
+from neubot import utils
+from neubot import utils_net
+
+# Number of resolver threads
+WORKERS = 4
+
+# How long we cache successful and failed lookups
+POSITIVE_TTL = 300.0
+NEGATIVE_TTL = 30.0
+
+# Maximum number of cached lookups
+MAXCACHE = 1024
+
+# Give up waiting for a lookup after TIMEOUT seconds
+TIMEOUT = 20.0
+
+class Resolver(object):
+
+    ''' Asynchronous name resolver '''
+
+    def __init__(self, poller, workers=WORKERS):
+        self.poller = poller
+        self.workers = workers
+        self.cache = {}
+        self.pending = {}
+        self.queue = queue.Queue()
+        self.results = collections.deque()
+        self.pipe = None
+        self.threads = []
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, epnt, callback):
+        '''
+         Resolve the @epnt endpoint and then invoke @callback on the
+         poller thread, passing it the endpoint and the addrinfo list,
+         which is None if we cannot resolve the endpoint.  The callback
+         is invoked immediately if we don't need to do a lookup.
+        '''
+        key = (epnt[0], epnt[1])
+
+        addrinfo = self._numeric(key)
+        if addrinfo:
+            callback(epnt, addrinfo)
+            return
+
+        entry = self.cache.get(key)
+        if entry and entry[0] > utils.ticks():
+            logging.debug('resolver: cache hit for %s',
+                          utils_net.format_epnt(epnt))
+            self.hits += 1
+            callback(epnt, entry[1])
+            return
+        self.misses += 1
+
+        if os.name != 'posix':
+            self._store(key, *self._lookup(key))
+            callback(epnt, self.cache[key][1])
+            return
+
+        # Coalesce concurrent lookups of the same endpoint
+        if key in self.pending:
+            self.pending[key].append((epnt, callback))
+            return
+        waiters = self.pending[key] = [(epnt, callback)]
+        self.poller.sched(TIMEOUT, self._timeout, key, waiters)
+
+        if not self.threads:
+            self._start()
+        self.poller.set_readable(self.pipe)
+        logging.debug('resolver: looking up %s', utils_net.format_epnt(epnt))
+        self.queue.put(key)
+
+    @staticmethod
+    def _numeric(key):
+        ''' Returns the addrinfo of a numeric address or None '''
+        try:
+            return socket.getaddrinfo(key[0], key[1], socket.AF_UNSPEC,
+                                      socket.SOCK_STREAM, 0,
+                                      socket.AI_NUMERICHOST)
+        except socket.error:
+            return None
+
+    @staticmethod
+    def _lookup(key):
+        ''' Returns the (addrinfo, error) tuple of @key '''
+        try:
+            return socket.getaddrinfo(key[0], key[1], socket.AF_UNSPEC,
+                                      socket.SOCK_STREAM), None
+        except socket.error:
+            return None, str(sys.exc_info()[1])
+
+    def _start(self):
+        ''' Start the resolver threads '''
+        self.pipe = WakeupPipe(self.poller, self._resolved)
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        ''' Main loop of a resolver thread '''
+        while True:
+            key = self.queue.get()
+            addrinfo, error = self._lookup(key)
+            self.results.append((key, addrinfo, error))
+            self.pipe.wakeup()
+
+    def _store(self, key, addrinfo, error):
+        ''' Cache the result of a lookup '''
+        if error:
+            logging.error('resolver: cannot resolve %s: %s',
+                          utils_net.format_epnt(key), error)
+            ttl = NEGATIVE_TTL
+        else:
+            ttl = POSITIVE_TTL
+        now = utils.ticks()
+        if len(self.cache) >= MAXCACHE:
+            for other, entry in list(self.cache.items()):
+                if entry[0] <= now:
+                    del self.cache[other]
+            if len(self.cache) >= MAXCACHE:
+                self.cache.clear()
+        self.cache[key] = (now + ttl, addrinfo)
+
+    def _resolved(self):
+        ''' Process the results of the lookups (poller thread) '''
+        while self.results:
+            key, addrinfo, error = self.results.popleft()
+            self._store(key, addrinfo, error)
+            self._notify(self.pending.pop(key, ()), addrinfo)
+        self._idle()
+
+    def _timeout(self, args):
+        ''' Give up waiting for a lookup '''
+        key, waiters = args
+        if self.pending.get(key) is waiters:
+            logging.error('resolver: lookup of %s timed out',
+                          utils_net.format_epnt(key))
+            del self.pending[key]
+            self._notify(waiters, None)
+            self._idle()
+
+    def _idle(self):
+        '''
+         Stop monitoring the pipe when no lookup is pending, so that
+         the poller loop can exit.  A result that arrives later (e.g.
+         after a timeout) is processed at the next lookup.
+        '''
+        if not self.pending:
+            self.poller.unset_readable(self.pipe)
+
+    @staticmethod
+    def _notify(waiters, addrinfo):
+        ''' Pass the result of a lookup to the @waiters '''
+        for epnt, callback in waiters:
+            try:
+                callback(epnt, addrinfo)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                logging.error('resolver: callback failed', exc_info=1)
+
+RESOLVER = Resolver(POLLER)
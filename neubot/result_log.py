@@ -0,0 +1,352 @@
+# neubot/result_log.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Append-only segmented result log '''
+
+#
+# The results of a test are appended to a log, which is split into
+# segments of at most SEGMENT_RECORDS records.  Each segment is a file
+# named <test>.log.<sequence-number> and, when the current segment is
+# full, we just start a new one and delete the oldest one if we have
+# more than MAX_SEGMENTS segments, so there is no need to rename files.
+#
+# Each record is the record header, i.e. the length of the payload and
+# the timestamp of the result, followed by the payload, i.e. the result
+# serialized using pickle.  So, we can walk a segment reading just the
+# record headers and build an index of the timestamps, which we use to
+# seek straight to the records in a given time range.  We build the
+# index of a segment the first time we need it and we keep it up to
+# date when we append to the current segment.
+#
+# Appends are flushed immediately, so readers always see them, but
+# we fsync() at most every FSYNC_RECORDS records or FSYNC_DELAY seconds.
+# When appending from a thread other than the poller one, autosync
+# must be False and the caller must invoke sync() by itself, because
+# the poller is not thread safe.
+#
+# If the last record of the current segment is incomplete, e.g. because
+# we crashed while writing it, we truncate the segment just before it.
+#
+# With the storage pipeline (see backend_pipeline.py) records are
+# appended and indexed by the storage thread while the poller thread
+# reads them, so each segment guards its index with a lock.  The storage
+# thread may also rotate the log while the poller thread is streaming it
+# (see iter_range()), so readers skip the segments that are gone.
+#
+
+import bisect
+import errno
+import logging
+import os
+import struct
+import sys
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from neubot.poller import POLLER
+
+# Maximum number of records in a segment
+SEGMENT_RECORDS = 1024
+
+# Number of segments we keep (the current one included)
+MAX_SEGMENTS = 16
+
+# Do fsync() every FSYNC_RECORDS records or FSYNC_DELAY seconds
+FSYNC_RECORDS = 16
+FSYNC_DELAY = 1.0
+
+# Length of payload and timestamp
+RECORD_HEADER = struct.Struct('!Id')
+
+class LogSegment(object):
+
+    ''' A segment of the result log '''
+
+    def __init__(self, path):
+        ''' Initialize segment stored at @path '''
+        self.path = path
+        self.timestamps = []
+        self.offsets = [0]
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def load(self, repair=False):
+        ''' Build the index reading the record headers '''
+        self.lock.acquire()
+        try:
+            self._load(repair)
+        finally:
+            self.lock.release()
+
+    def _load(self, repair):
+        ''' Build the index (with the lock held) '''
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.isfile(self.path):
+            return
+        filep = open(self.path, 'rb')
+        size = os.fstat(filep.fileno()).st_size
+        offset = 0
+        while True:
+            header = filep.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, timestamp = RECORD_HEADER.unpack(header)
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            filep.seek(end)
+            self.timestamps.append(timestamp)
+            self.offsets.append(end)
+            offset = end
+        filep.close()
+        if offset < size:
+            logging.warning('result_log: %s: incomplete record at %d',
+                            self.path, offset)
+            if repair:
+                filep = open(self.path, 'r+b')
+                filep.truncate(offset)
+                filep.close()
+
+    def indexed(self, record, timestamp):
+        ''' Add to the index a record that has been appended '''
+        self.lock.acquire()
+        try:
+            self.offsets.append(self.offsets[-1] + len(record))
+            self.timestamps.append(timestamp)
+        finally:
+            self.lock.release()
+
+    def read(self, start=0, stop=None):
+        ''' Read records from @start to @stop (excluded) '''
+        self.load()
+        self.lock.acquire()
+        try:
+            if stop is None:
+                stop = len(self.timestamps)
+            if start >= stop:
+                return []
+            begin, end = self.offsets[start], self.offsets[stop]
+        finally:
+            self.lock.release()
+        filep = open(self.path, 'rb')
+        filep.seek(begin)
+        data = filep.read(end - begin)
+        filep.close()
+        results = []
+        offset = 0
+        for _ in range(stop - start):
+            length = RECORD_HEADER.unpack_from(data, offset)[0]
+            offset += RECORD_HEADER.size
+            results.append(pickle.loads(data[offset:offset + length]))
+            offset += length
+        return results
+
+    def select(self, since, until):
+        ''' Returns the (start, stop) range of records with
+            timestamp between @since and @until (negative
+            values mean that there is no limit) '''
+        self.load()
+        self.lock.acquire()
+        try:
+            start, stop = 0, len(self.timestamps)
+            if since >= 0:
+                start = bisect.bisect_left(self.timestamps, since)
+            if until >= 0:
+                stop = bisect.bisect_right(self.timestamps, until)
+        finally:
+            self.lock.release()
+        return start, max(start, stop)
+
+class ResultLog(object):
+
+    ''' Append-only segmented result log '''
+
+    def __init__(self, test, datadir, touch,
+                 segment_records=SEGMENT_RECORDS,
+                 max_segments=MAX_SEGMENTS, autosync=True):
+        '''
+         Initialize the log of @test, stored in @datadir.  Use the
+         @touch function, which receives a list of path components
+         and returns the full path, to create new segments.  Unless
+         @autosync is False, the log schedules its own fsync().
+        '''
+        self.test = test
+        self.datadir = datadir
+        self.touch = touch
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.autosync = autosync
+        self.segments = {}
+        self.current = None
+        self.filep = None
+        self.unsynced = 0
+        self.sync_pending = False
+        self._scan()
+
+    def _name(self, sequence):
+        ''' Returns the file name of segment @sequence '''
+        return '%s.log.%d' % (self.test, sequence)
+
+    def _scan(self):
+        ''' Find the existing segments '''
+        prefix = self.test + '.log.'
+        for name in os.listdir(self.datadir):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                sequence = int(name[len(prefix):])
+                self.segments[sequence] = LogSegment(
+                  os.path.join(self.datadir, name))
+        if not self.segments:
+            self._import_pickles()
+        if self.segments:
+            self.current = max(self.segments)
+
+    def _import_pickles(self):
+        ''' Import the results saved by the old pickle backend '''
+        fullpath = os.path.join(self.datadir, '%s.pickle' % self.test)
+        paths = [fullpath + '.' + str(index)
+                 for index in range(self.max_segments - 1, -1, -1)]
+        paths.append(fullpath)
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            filep = open(path, 'rb')
+            content = filep.read()
+            filep.close()
+            if content:
+                logging.info('result_log: importing %s', path)
+                self._start_segment()
+                for result in pickle.loads(content):
+                    self._write(result)
+                self.sync()
+            os.unlink(path)
+
+    def _start_segment(self):
+        ''' Start a new segment and forget the oldest ones '''
+        if self.filep:
+            self.sync()
+            self.filep.close()
+            self.filep = None
+        if self.current is None:
+            self.current = 0
+        else:
+            self.current += 1
+        path = self.touch([self._name(self.current)])
+        self.segments[self.current] = LogSegment(path)
+        self.segments[self.current].loaded = True
+        while len(self.segments) > self.max_segments:
+            oldest = min(self.segments)
+            os.unlink(self.segments.pop(oldest).path)
+
+    def _write(self, result):
+        ''' Append @result to the current segment '''
+        segment = self.segments[self.current]
+        if not self.filep:
+            segment.load(repair=True)
+            self.filep = open(segment.path, 'ab')
+        payload = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        timestamp = float(result.get('timestamp', 0))
+        record = RECORD_HEADER.pack(len(payload), timestamp) + payload
+        self.filep.write(record)
+        self.filep.flush()
+        segment.indexed(record, timestamp)
+        self.unsynced += 1
+
+    def append(self, result):
+        ''' Append @result to the log '''
+        if (self.current is None or
+            len(self._segment(self.current)) >= self.segment_records):
+            self._start_segment()
+        self._write(result)
+        if self.unsynced >= FSYNC_RECORDS:
+            self.sync()
+        elif self.autosync and not self.sync_pending:
+            self.sync_pending = True
+            POLLER.sched(FSYNC_DELAY, self._sync_later)
+
+    def _sync_later(self, *args):
+        ''' Periodic fsync() of the log '''
+        self.sync_pending = False
+        self.sync()
+
+    def sync(self):
+        ''' Make sure appended records are on disk '''
+        if self.filep and self.unsynced:
+            os.fsync(self.filep.fileno())
+        self.unsynced = 0
+
+    def _segment(self, sequence):
+        ''' Returns the indexed segment @sequence or None '''
+        segment = self.segments.get(sequence)
+        if segment is not None:
+            segment.load(repair=(sequence == self.current and
+                                 not self.filep))
+        return segment
+
+    def walk(self, index=None):
+        ''' Returns the results in a segment, where @index None
+            is the current segment, 0 the previous one, and so on '''
+        if self.current is None:
+            return []
+        sequence = self.current
+        if index is not None:
+            sequence -= int(index) + 1
+        segment = self._segment(sequence)
+        if segment is None:
+            return []
+        return segment.read()
+
+    def iter_range(self, since=-1, until=-1):
+        ''' Generator that yields the results with timestamp between
+            @since and @until (negative means no limit), newest first,
+            reading one segment at a time '''
+        for sequence in sorted(self.segments, reverse=True):
+            # The segment may be gone if we rotated meanwhile
+            try:
+                segment = self._segment(sequence)
+                if segment is None or not len(segment):
+                    continue
+                start, stop = segment.select(since, until)
+                records = segment.read(start, stop)
+            except IOError:
+                if sys.exc_info()[1].errno != errno.ENOENT:
+                    raise
+                continue
+            records.reverse()
+            for record in records:
+                yield record
+            if start > 0:
+                break
+
+    def walk_range(self, since=-1, until=-1):
+        ''' Returns the results with timestamp between @since and
+            @until (negative means no limit), newest first '''
+        return list(self.iter_range(since, until))
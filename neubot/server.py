@@ -52,11 +52,15 @@ from neubot.config import CONFIG
 from neubot.backend import BACKEND
 from neubot.log import LOG
 from neubot.raw_srvr_glue import RAW_SERVER_EX
+from neubot.server_prefork import HEARTBEAT_INTERVAL
+from neubot.server_prefork import STEER_INTERVAL
+from neubot.server_prefork import Supervisor
 
 from neubot import bittorrent
 from neubot import negotiate
 from neubot import system
 from neubot import utils_modules
+from neubot import utils_net
 from neubot import utils_posix
 
 #from neubot import speedtest           # Not yet
@@ -84,7 +88,8 @@ class DebugAPI(ServerHTTP):
 
                     # Add the length of the most relevant globals
                     'NEGOTIATE_SERVER.queue': len(NEGOTIATE_SERVER.queue),
-                    'NEGOTIATE_SERVER.known': len(NEGOTIATE_SERVER.known),
+                    'NEGOTIATE_SERVER.notified': \
+                        len(NEGOTIATE_SERVER.notified),
                     'NEGOTIATE_SERVER_BITTORRENT.peers': \
                         len(NEGOTIATE_SERVER_BITTORRENT.peers),
                     'NEGOTIATE_SERVER_SPEEDTEST.clients': \
@@ -98,6 +103,11 @@ class DebugAPI(ServerHTTP):
                     'NOTIFIER._tofire': len(NOTIFIER._tofire),
                    }
 
+        elif request.uri == '/api/debug':
+            body = {}
+            NEGOTIATE_SERVER.snap(body)
+            BACKEND.snap(body)
+
         elif request.uri == '/debugmem/garbage':
             body = [str(obj) for obj in gc.garbage]
 
@@ -156,6 +166,7 @@ class ServerSideAPI(ServerHTTP):
         stream.send_response(request, response)
 
 SETTINGS = {
+    "poller.engine": "auto",
     "server.bittorrent": True,
     "server.daemonize": True,
     "server.datadir": '',
@@ -163,8 +174,10 @@ SETTINGS = {
     "server.negotiate": True,
     "server.raw": True,
     "server.rendezvous": False,         # For backward compatibility only
+    "server.reuseport": False,
     "server.sapi": True,
     "server.speedtest": True,
+    "server.workers": 0,
 }
 
 USAGE = '''\
@@ -176,6 +189,7 @@ valid backends:
   null   Do not save results but pretend to do so
 
 valid defines:
+  poller.engine     Set I/O engine: auto, epoll, kqueue, poll, select
   server.bittorrent Set to nonzero to enable BitTorrent server (default: 1)
   server.daemonize  Set to nonzero to run in the background (default: 1)
   server.datadir    Set data directory (default: LOCALSTATEDIR/neubot)
@@ -183,12 +197,15 @@ valid defines:
   server.negotiate  Set to nonzero to enable negotiate server (default: 1)
   server.raw        Set to nonzero to enable RAW server (default: 1)
   server.rendezvous Set to nonzero to enable rendezvous server (default: 0)
+  server.reuseport  Set to nonzero to share ports with other servers (default: 0)
   server.sapi       Set to nonzero to enable nagios API (default: 1)
-  server.speedtest  Set to nonzero to enable speedtest server (default: 1)'''
+  server.speedtest  Set to nonzero to enable speedtest server (default: 1)
+  server.workers    Set number of worker processes, 0 for none (default: 0)'''
 
-VALID_MACROS = ('server.bittorrent', 'server.daemonize', 'server.datadir',
-                'server.debug', 'server.negotiate', 'server.raw',
-                'server.rendezvous', 'server.sapi', 'server.speedtest')
+VALID_MACROS = ('poller.engine', 'server.bittorrent', 'server.daemonize',
+                'server.datadir', 'server.debug', 'server.negotiate',
+                'server.raw', 'server.rendezvous', 'server.reuseport',
+                'server.sapi', 'server.speedtest', 'server.workers')
 
 def main(args):
     """ Starts the server module """
@@ -214,7 +231,7 @@ def main(args):
             name, value = value.split('=', 1)
             if name not in VALID_MACROS:
                 sys.exit(USAGE)
-            if name != 'server.datadir':  # XXX
+            if name not in ('server.datadir', 'poller.engine'):  # XXX
                 value = int(value)
             SETTINGS[name] = value
         elif name == '-d':
@@ -222,6 +239,99 @@ def main(args):
         elif name == '-v':
             CONFIG['verbose'] = 1
 
+    if SETTINGS['server.workers'] > 0:
+        _supervise(address, backend)
+        return
+
+    _start(address, backend)
+
+    #
+    # Go background and drop privileges,
+    # then enter into the main loop.
+    #
+    if CONFIG["server.daemonize"]:
+        LOG.redirect()
+        system.go_background()
+
+    sigterm_handler = lambda signo, frame: POLLER.break_loop()
+    signal.signal(signal.SIGTERM, sigterm_handler)
+
+    logging.info('Neubot server -- starting up')
+    system.drop_privileges()
+    POLLER.loop()
+
+    logging.info('Neubot server -- shutting down')
+    utils_posix.remove_pidfile('/var/run/neubot.pid')
+
+#
+# In pre-fork mode (see server_prefork.py) the supervisor goes in
+# background and then forks the workers, and each worker configures
+# the backend, starts the servers, and drops privileges by itself.
+# The supervisor must not register anything with the poller, which
+# creates its engine lazily, so that each worker has its own engine.
+#
+def _supervise(address, backend):
+    ''' Run the pre-fork supervisor '''
+
+    # Workers share the ports
+    SETTINGS['server.reuseport'] = True
+
+    if SETTINGS["server.daemonize"]:
+        LOG.redirect()
+        system.go_background()
+
+    logging.info('Neubot server -- starting up %d workers',
+                 SETTINGS['server.workers'])
+    supervisor = Supervisor(SETTINGS['server.workers'],
+      lambda arbiter, index, count: _run_worker(address, backend,
+                                                arbiter))
+    supervisor.run()
+
+    logging.info('Neubot server -- shutting down')
+    utils_posix.remove_pidfile('/var/run/neubot.pid')
+
+def _run_worker(address, backend, arbiter):
+    ''' Main of a pre-fork worker process '''
+
+    _start(address, backend)
+
+    NEGOTIATE_SERVER.use_arbiter(arbiter)
+    lsocks = []
+    for stream in list(POLLER.readset.values()):
+        lsock = getattr(stream, 'lsock', None)
+        if lsock is not None:
+            lsocks.append(lsock)
+
+    steered = [None]
+
+    def steer(*args):
+        ''' Steer connections among the serving workers '''
+        live = max(1, arbiter.live())
+        if live != steered[0]:
+            logging.debug('server: steering among %d workers', live)
+            for lsock in lsocks:
+                utils_net.steer_reuseport(lsock, live)
+            steered[0] = live
+        POLLER.sched(STEER_INTERVAL, steer)
+
+    steer()
+
+    def heartbeat(*args):
+        ''' Tell the supervisor we're alive '''
+        arbiter.heartbeat()
+        POLLER.sched(HEARTBEAT_INTERVAL, heartbeat)
+
+    heartbeat()
+
+    sigterm_handler = lambda signo, frame: POLLER.break_loop()
+    signal.signal(signal.SIGTERM, sigterm_handler)
+
+    system.drop_privileges()
+    POLLER.loop()
+
+def _start(address, backend):
+    ''' Configure the backend and start the servers '''
+
     logging.debug('server: using backend: %s... in progress', backend)
     if backend == 'mlab':
         BACKEND.datadir_init(None, SETTINGS['server.datadir'])
@@ -235,8 +345,12 @@ def main(args):
         BACKEND.use_backend('null')
     logging.debug('server: using backend: %s... complete', backend)
 
+    # Don't wait for the disk while handling /collect requests
+    BACKEND.enable_pipeline(POLLER)
+
     for name, value in SETTINGS.items():
         CONFIG[name] = value
+    CONFIG['net.listen.reuseport'] = CONFIG['server.reuseport']
 
     conf = CONFIG.copy()
 
@@ -321,23 +435,5 @@ def main(args):
         "negotiate_server": NEGOTIATE_SERVER,
     })
 
-    #
-    # Go background and drop privileges,
-    # then enter into the main loop.
-    #
-    if conf["server.daemonize"]:
-        LOG.redirect()
-        system.go_background()
-
-    sigterm_handler = lambda signo, frame: POLLER.break_loop()
-    signal.signal(signal.SIGTERM, sigterm_handler)
-
-    logging.info('Neubot server -- starting up')
-    system.drop_privileges()
-    POLLER.loop()
-
-    logging.info('Neubot server -- shutting down')
-    utils_posix.remove_pidfile('/var/run/neubot.pid')
-
 if __name__ == "__main__":
     main(sys.argv)
@@ -0,0 +1,277 @@
+# neubot/server_prefork.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Pre-fork server supervisor '''
+
+#
+# A single server process uses a single core.  In pre-fork mode the
+# supervisor process forks server.workers worker processes, and each
+# worker binds its own sockets to the server ports with SO_REUSEPORT,
+# runs its own poller loop, and shares the test slots with the other
+# workers using the arbiter (see negotiate/arbiter.py).
+#
+# A client talks to the negotiate server and then to the test server,
+# using distinct connections and, often, distinct ports, and both
+# must land on the same worker, which knows the client.  So, we start
+# the workers one at a time, waiting for each one to be ready before
+# starting the next one, so that each SO_REUSEPORT group contains the
+# sockets of the workers in the same order, and each worker attaches
+# to its sockets a BPF program that selects the socket using the
+# client prefix (see utils_net.steer_reuseport()).
+#
+# The program selects the socket modulo the number of serving workers,
+# which the supervisor publishes using the arbiter, and not modulo
+# server.workers.  When a worker exits, the kernel moves the last
+# socket of each group in the place of the closed one, so each group
+# has one socket less, in the same order.  Had we kept the program
+# unchanged, the clients mapped to the missing position would have
+# fallen back to the kernel hash of the 4-tuple, and their negotiate
+# and test connections would have landed on different workers until
+# the restart.  Instead, the supervisor decrements the live count when
+# it reaps the worker, and the workers re-attach the program, so the
+# window lasts at most CHECK_INTERVAL plus STEER_INTERVAL seconds.
+# A restarted worker appends its sockets at the end of the groups,
+# where the program does not look, and the supervisor increments the
+# live count only when all its sockets are bound.  So, clients are
+# only remapped when the live count changes, and a client that is
+# negotiating at that moment may have to retry.
+#
+# The supervisor restarts the workers that exit and kills the ones
+# that stop sending their heartbeat.  It does not own any socket,
+# poller, or thread: it only forks, waits, and forwards SIGTERM.
+#
+
+import atexit
+import errno
+import logging
+import os
+import signal
+import sys
+import time
+
+from neubot.negotiate.arbiter import Arbiter
+
+# How long we wait for a worker to start
+STARTUP_TIMEOUT = 30.0
+
+# Interval between heartbeats and after which we kill a worker
+HEARTBEAT_INTERVAL = 5.0
+HEARTBEAT_TIMEOUT = 30.0
+
+# Interval between supervisor checks
+CHECK_INTERVAL = 1.0
+
+# Interval between workers checks of the live count
+STEER_INTERVAL = 0.5
+
+# Restart delay, doubled if a worker keeps dying
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+# How long we wait for the workers at exit
+EXIT_TIMEOUT = 10.0
+
+class Supervisor(object):
+
+    ''' Pre-fork server supervisor '''
+
+    def __init__(self, count, worker_func):
+        '''
+         Initialize the supervisor of @count workers.  Each worker
+         invokes @worker_func(arbiter, index, count), which must call
+         arbiter.heartbeat() when ready to serve and periodically
+         afterwards, must steer its sockets using arbiter.live(), and
+         returns when the worker should exit.
+        '''
+        self.count = count
+        self.worker_func = worker_func
+        self.arbiter = Arbiter(count)
+        self.pids = {}
+        self.delays = {}
+        self.restarts = {}
+        self.stopping = False
+
+    def _spawn(self, index):
+        ''' Fork worker @index, returns its pid or 0 on failure '''
+        self.arbiter.reset(index)
+        try:
+            pid = os.fork()
+        except OSError:
+            logging.error('server_prefork: fork() failed', exc_info=1)
+            return 0
+        if pid == 0:
+            self._worker(index)
+        self.pids[pid] = index
+        logging.info('server_prefork: worker %d has pid %d', index, pid)
+        return pid
+
+    def _worker(self, index):
+        ''' Body of worker process @index, never returns '''
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            self.arbiter.attach(index)
+            self.worker_func(self.arbiter, index, self.count)
+        except SystemExit:
+            code = sys.exc_info()[1].code
+            if code:
+                if not isinstance(code, int):
+                    logging.error('server_prefork: %s', code)
+                    code = 1
+                status = code
+        except:
+            logging.error('server_prefork: worker %d failed', index,
+                          exc_info=1)
+            status = 1
+        try:
+            atexit._run_exitfuncs()
+        finally:
+            os._exit(status)
+
+    def _wait_ready(self, pid, index):
+        ''' Wait until worker @index is ready, returns False if
+            it died or did not become ready in time '''
+        deadline = time.time() + STARTUP_TIMEOUT
+        while time.time() < deadline:
+            if self.arbiter.is_ready(index):
+                self._update_live()
+                return True
+            if self._reap(pid):
+                return False
+            time.sleep(0.1)
+        logging.error('server_prefork: worker %d did not start', index)
+        self._kill(pid, signal.SIGKILL)
+        return False
+
+    def _reap(self, pid=-1):
+        ''' Reap dead workers, returns True if we reaped one '''
+        reaped = False
+        while True:
+            try:
+                child, status = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                error = sys.exc_info()[1]
+                if error.errno == errno.EINTR:
+                    continue
+                if error.errno != errno.ECHILD:
+                    raise
+                break
+            if child == 0:
+                break
+            index = self.pids.pop(child, None)
+            if index is not None:
+                reaped = True
+                self._update_live()
+                if not self.stopping:
+                    logging.warning('server_prefork: worker %d (pid %d) '
+                                    'exited with status %d', index, child,
+                                    status)
+                    self._schedule_restart(index)
+            if pid != -1:
+                break
+        return reaped
+
+    def _update_live(self):
+        ''' Publish the number of serving workers '''
+        live = 0
+        for index in self.pids.values():
+            if self.arbiter.is_ready(index):
+                live += 1
+        self.arbiter.set_live(live)
+
+    def _schedule_restart(self, index):
+        ''' Schedule the restart of worker @index '''
+        delay = self.delays.get(index, 0.0)
+        delay = min(MAX_RESTART_DELAY, max(RESTART_DELAY, 2 * delay))
+        self.delays[index] = delay
+        self.restarts[index] = time.time() + delay
+
+    def _kill(self, pid, signo):
+        ''' Send @signo to worker @pid '''
+        try:
+            os.kill(pid, signo)
+        except OSError:
+            pass
+
+    def _check_heartbeats(self):
+        ''' Kill the workers that are stuck '''
+        now = time.time()
+        for pid, index in list(self.pids.items()):
+            if now - self.arbiter.last_heartbeat(index) > HEARTBEAT_TIMEOUT:
+                logging.error('server_prefork: worker %d (pid %d) is stuck',
+                              index, pid)
+                self._kill(pid, signal.SIGKILL)
+            elif self.arbiter.is_ready(index):
+                # It's up and running, so forget past failures
+                self.delays.pop(index, None)
+
+    def _restart(self):
+        ''' Restart the workers whose delay expired '''
+        now = time.time()
+        for index, when in sorted(self.restarts.items()):
+            if when <= now:
+                del self.restarts[index]
+                pid = self._spawn(index)
+                if not pid or not self._wait_ready(pid, index):
+                    self._schedule_restart(index)
+
+    def _stop(self, signo, frame):
+        ''' SIGTERM handler '''
+        self.stopping = True
+
+    def run(self):
+        ''' Start the workers and supervise them until SIGTERM '''
+        signal.signal(signal.SIGTERM, self._stop)
+        for index in range(self.count):
+            pid = self._spawn(index)
+            if not pid or not self._wait_ready(pid, index):
+                self._schedule_restart(index)
+        while not self.stopping:
+            time.sleep(CHECK_INTERVAL)
+            self._reap()
+            self._check_heartbeats()
+            self._restart()
+        self.shutdown()
+
+    def shutdown(self):
+        ''' Stop the workers, killing them if needed '''
+        self.stopping = True
+        for pid in list(self.pids):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.time() + EXIT_TIMEOUT
+        while self.pids and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.pids):
+            logging.warning('server_prefork: killing pid %d', pid)
+            self._kill(pid, signal.SIGKILL)
+        while self.pids:
+            try:
+                child = os.waitpid(-1, 0)[0]
+            except OSError:
+                error = sys.exc_info()[1]
+                if error.errno == errno.EINTR:
+                    continue
+                break
+            self.pids.pop(child, None)
@@ -375,7 +375,7 @@ if PY3:
     def buff(string, offset, size=None):
         if not size:
             size = len(string)
-        return memoryview(string)[offset:size]
+        return memoryview(string)[offset:offset + size]
 
     import urllib.parse as urlparse
     from collections import OrderedDict
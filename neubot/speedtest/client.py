@@ -76,7 +76,11 @@ class ClientLatency(ClientHTTP):
         stream.send_request(request)
 
     def got_response(self, stream, request, response):
-        ticks = utils.ticks() - self.ticks[stream]
+        now = utils.ticks()
+        ticks = now - self.ticks[stream]
+        # Don't count the SSL handshake as latency
+        if stream.handshake:
+            ticks -= stream.handshake.overlap(self.ticks[stream], now)
         self.conf.setdefault("speedtest.client.latency",
           []).append(ticks)
 
@@ -22,7 +22,7 @@
 
 ''' Speedtest server '''
 
-from neubot.utils_random import RandomBody
+from neubot.utils_random import RandomFileBody
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
 
@@ -90,7 +90,7 @@ class SpeedtestServer(ServerHTTP):
             first, last = self._parse_range(request)
             response = Message()
             response.compose(code='200', reason='Ok',
-              body=RandomBody(last - first + 1),
+              body=RandomFileBody(last - first + 1),
               mimetype='application/octet-stream')
             stream.send_response(request, response)
 
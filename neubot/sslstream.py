@@ -24,6 +24,24 @@
 
 # Python3-ready: yes
 
+#
+# A full handshake costs a round of asymmetric crypto on both sides,
+# which is significant for a server that handles many short-lived
+# connections, e.g. the speedtest ones.  So, we share one SSL context
+# per certificate, and OpenSSL, which keeps the session cache and the
+# session ticket keys in the context, can resume sessions.  We replace
+# the server context every TICKET_LIFETIME seconds, which rotates the
+# ticket keys (Python does not allow to set them) and also flushes the
+# session cache.  Clients save the session of each server and offer it
+# when they connect again, but only when the ssl module exposes the
+# sessions (Python >= 3.6); otherwise they just share the context.
+#
+# We also measure the handshake, so that latency measurements can
+# exclude it: the elapsed time, from the first to the last handshake
+# step, and the CPU time, i.e. the time spent inside the handshake
+# steps, which is CPU-bound because sockets are nonblocking.
+#
+
 import logging
 import ssl
 import sys
@@ -37,6 +55,114 @@ from neubot.pollable import WANT_READ
 from neubot.pollable import WANT_WRITE
 from neubot.poller import POLLER
 
+from neubot import six
+from neubot import utils
+from neubot import utils_net
+
+# Replace the server context (and its ticket keys) every TICKET_LIFETIME s
+TICKET_LIFETIME = 3600
+
+# Maximum number of client sessions we save
+MAXSESSIONS = 256
+
+SERVER_CONTEXTS = {}
+CLIENT_CONTEXT = []
+CLIENT_SESSIONS = {}
+
+def _new_context():
+    ''' Create a new SSL context '''
+    return ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS', ssl.PROTOCOL_SSLv23))
+
+def _server_context(certfile):
+    ''' Returns the context for @certfile, rotated if too old '''
+    now = utils.ticks()
+    entry = SERVER_CONTEXTS.get(certfile)
+    if entry is None or now - entry[1] > TICKET_LIFETIME:
+        try:
+            context = _new_context()
+            context.load_cert_chain(certfile)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            if entry is None:
+                raise
+            # E.g. we dropped privileges and cannot read it anymore
+            logging.warning('sslstream: cannot rotate context', exc_info=1)
+            context = entry[0]
+        else:
+            logging.debug('sslstream: new context for %s', certfile)
+        entry = SERVER_CONTEXTS[certfile] = (context, now)
+    return entry[0]
+
+def _client_context():
+    ''' Returns the shared client context '''
+    if not CLIENT_CONTEXT:
+        CLIENT_CONTEXT.append(_new_context())
+    return CLIENT_CONTEXT[0]
+
+def wrap_socket(sock, certfile, server_side):
+    ''' Wrap @sock for a nonblocking SSL handshake, reusing the
+        context and, if possible, the client session '''
+    if not hasattr(ssl, 'SSLContext'):                  # Python < 2.7.9
+        return ssl.wrap_socket(sock, do_handshake_on_connect=False,
+          certfile=certfile, server_side=server_side)
+    if server_side:
+        return _server_context(certfile).wrap_socket(sock,
+          do_handshake_on_connect=False, server_side=True)
+    kwargs = {}
+    session = CLIENT_SESSIONS.get(utils_net.getpeername(sock))
+    if session is not None:
+        kwargs['session'] = session
+    return _client_context().wrap_socket(sock,
+      do_handshake_on_connect=False, **kwargs)
+
+def save_session(sslsock, server_side):
+    ''' Save the session of the client @sslsock '''
+    session = getattr(sslsock, 'session', None)
+    if server_side or session is None:
+        return
+    if len(CLIENT_SESSIONS) >= MAXSESSIONS:
+        CLIENT_SESSIONS.clear()
+    CLIENT_SESSIONS[utils_net.getpeername(sslsock)] = session
+
+class HandshakeTimer(object):
+    ''' Measures the SSL handshake of a connection '''
+
+    def __init__(self, sslsock, server_side):
+        self.sslsock = sslsock
+        self.server_side = server_side
+        self.begin = 0.0
+        self.end = 0.0
+        self.cpu = 0.0
+        self.reused = None
+
+    def step(self):
+        ''' Run a handshake step, raises SSLError if we must retry '''
+        ticks = utils.ticks()
+        if not self.begin:
+            self.begin = ticks
+        try:
+            self.sslsock.do_handshake()
+        finally:
+            self.end = utils.ticks()
+            self.cpu += self.end - ticks
+        # None means that the ssl module does not tell us
+        self.reused = getattr(self.sslsock, 'session_reused', None)
+        save_session(self.sslsock, self.server_side)
+        self.sslsock = None
+        logging.debug('sslstream: handshake: %s elapsed, %s CPU, reused: %s',
+                      utils.time_formatter(self.elapsed()),
+                      utils.time_formatter(self.cpu), self.reused)
+
+    def elapsed(self):
+        ''' Returns the time from the first to the last step '''
+        return self.end - self.begin
+
+    def overlap(self, begin, end):
+        ''' Returns how much of the [@begin, @end] interval
+            was spent doing the handshake '''
+        return max(0.0, min(end, self.end) - max(begin, self.begin))
+
 class SSLWrapper(object):
     ''' Wrapper for an SSL socket '''
 
@@ -72,6 +198,22 @@ class SSLWrapper(object):
             else:
                 raise
 
+    def sorecv_into(self, buff, maxlen):
+        ''' Wrapper for SSL_read() into a buffer '''
+        try:
+            count = self.sock.recv_into(buff, min(maxlen, len(buff)))
+            if count == 0:
+                return SUCCESS, ''
+            return SUCCESS, six.buff(buff, 0, count)
+        except ssl.SSLError:
+            exception = sys.exc_info()[1]
+            if exception.args[0] == ssl.SSL_ERROR_WANT_READ:
+                return WANT_READ, ''
+            elif exception.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                return WANT_WRITE, ''
+            else:
+                raise
+
     def sosend(self, octets):
         ''' Wrapper for SSL_write() '''
         try:
@@ -112,7 +254,7 @@ class Handshaker(Pollable):
     def handshake(self):
         ''' Async SSL handshake '''
         try:
-            self.opaque.sock.sock.do_handshake()
+            self.opaque.handshake.step()
         except ssl.SSLError:
             exception = sys.exc_info()[1]
             if exception.args[0] == ssl.SSL_ERROR_WANT_READ:
@@ -147,8 +289,9 @@ def initialise(stream, sock, sslcert):
     else:
         server_side = True
 
-    stream.sock = SSLWrapper(ssl.SSLSocket(sock, do_handshake_on_connect=False,
-                                   certfile=sslcert, server_side=server_side))
+    sslsock = wrap_socket(sock, sslcert, server_side)
+    stream.sock = SSLWrapper(sslsock)
+    stream.handshake = HandshakeTimer(sslsock, server_side)
 
     handshaker = Handshaker(stream)
     handshaker.handshake()
@@ -30,6 +30,7 @@ import os
 import socket
 import sys
 
+from neubot.buffer_pool import BUFFER_POOL
 from neubot.defer import Deferred
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
@@ -83,6 +84,22 @@ class StreamWrapper(object):
             else:
                 raise
 
+    def sorecv_into(self, buff, maxlen):
+        ''' Wrapper for socket recv_into() '''
+        try:
+            count = self.sock.recv_into(buff, min(maxlen, len(buff)))
+            if count == 0:
+                return SUCCESS, EMPTY_STRING
+            return SUCCESS, six.buff(buff, 0, count)
+        except socket.error:
+            exception = sys.exc_info()[1]
+            if exception.args[0] in SOFT_ERRORS:
+                return WANT_READ, EMPTY_STRING
+            elif exception.args[0] == errno.ECONNRESET:
+                return CONNRST, EMPTY_STRING
+            else:
+                raise
+
     def sosend(self, octets):
         ''' Wrapper for socket send() '''
         try:
@@ -103,6 +120,10 @@ class StreamWrapperDebug(StreamWrapper):
         maxlen = 1
         return StreamWrapper.sorecv(self, maxlen)
 
+    def sorecv_into(self, buff, maxlen):
+        maxlen = 1
+        return StreamWrapper.sorecv_into(self, buff, maxlen)
+
 def _stream_wrapper(sock):
     ''' Create the right stream wrapper '''
     if not os.environ.get('NEUBOT_STREAM_DEBUG'):
@@ -143,10 +164,12 @@ class Stream(Pollable):
         self.sock = None
 
         # Variables we don't need to clear
+        self.recv_viewmode = False
         self.bytes_in = 0
         self.bytes_out = 0
         self.conn_rst = False
         self.eof = False
+        self.handshake = None
         self.isclosed = False
         self.recv_bytes = 0
         self.recv_blocked = False
@@ -236,6 +259,7 @@ class Stream(Pollable):
 
         self.recv_bytes = recv_bytes
         self.recv_complete = recv_complete
+        self.recv_viewmode = False
 
         if self.recv_blocked:
             logging.debug('stream: recv() is blocked')
@@ -243,6 +267,18 @@ class Stream(Pollable):
 
         POLLER.set_readable(self)
 
+    def recv_view(self, recv_bytes, recv_complete):
+        ''' Async recv() that passes recv_complete() a view '''
+
+        #
+        # Like recv(), except that recv_complete() receives a view of
+        # a buffer from BUFFER_POOL, which is valid only until the
+        # recv_complete() callback returns.  Use this mode when the
+        # protocol just counts or skips most of the received bytes.
+        #
+        self.recv(recv_bytes, recv_complete)
+        self.recv_viewmode = True
+
     def handle_read(self):
 
         #
@@ -259,7 +295,12 @@ class Stream(Pollable):
             self.handle_write()
             return
 
-        status, octets = self.sock.sorecv(self.recv_bytes)
+        if not self.recv_viewmode:
+            buff = None
+            status, octets = self.sock.sorecv(self.recv_bytes)
+        else:
+            buff = BUFFER_POOL.get()
+            status, octets = self.sock.sorecv_into(buff, self.recv_bytes)
 
         #
         # Optimisation: reorder if branches such that the ones more relevant
@@ -273,8 +314,13 @@ class Stream(Pollable):
             self.recv_bytes = 0
             POLLER.unset_readable(self)
             self.recv_complete(self, octets)
+            if buff:
+                BUFFER_POOL.put(buff)
             return
 
+        if buff:
+            BUFFER_POOL.put(buff)
+
         if status == WANT_READ:
             return
 
@@ -26,11 +26,29 @@ import errno
 import logging
 import os
 import socket
+import struct
 import sys
 
 # Winsock returns EWOULDBLOCK
 INPROGRESS = [ 0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN ]
 
+# Returned by accept() when there are no more pending connections
+WOULDBLOCK = (errno.EWOULDBLOCK, errno.EAGAIN)
+
+# Python 2 does not export SO_REUSEPORT
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+if SO_REUSEPORT is None:
+    if sys.platform.startswith('linux'):
+        SO_REUSEPORT = 15
+    elif sys.platform == 'darwin' or 'bsd' in sys.platform:
+        SO_REUSEPORT = 0x200
+
+# The kernel caps the backlog at net.core.somaxconn anyway
+BACKLOG = 1024
+
+# Linux only, not exported by Python
+SO_ATTACH_REUSEPORT_CBPF = 51
+
 def format_epnt(epnt):
     ''' Format endpoint for printing '''
     address, port = epnt[:2]
@@ -92,8 +110,13 @@ def addrinfo_key(ainfo):
     ''' Map addrinfo to protocol family '''
     return COMPARE_AF[ainfo[0]]
 
-def listen(epnt, prefer_ipv6):
-    ''' Listen to all sockets represented by epnt '''
+def listen(epnt, prefer_ipv6, reuseport=False):
+
+    '''
+     Listen to all sockets represented by epnt.  With reuseport, set
+     SO_REUSEPORT, so that many processes can listen to the same port,
+     and the kernel balances the incoming connections among them.
+    '''
 
     logging.debug('listen(): about to listen to: %s', str(epnt))
 
@@ -106,7 +129,8 @@ def listen(epnt, prefer_ipv6):
     # Allow to listen on a list of addresses
     if epnt[0] and ' ' in epnt[0]:
         for address in epnt[0].split():
-            result = listen((address.strip(), epnt[1]), prefer_ipv6)
+            result = listen((address.strip(), epnt[1]), prefer_ipv6,
+                            reuseport)
             sockets.extend(result)
         return sockets
 
@@ -133,10 +157,14 @@ def listen(epnt, prefer_ipv6):
 
             sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuseport:
+                if SO_REUSEPORT is None:
+                    raise RuntimeError('listen(): no SO_REUSEPORT')
+                sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
             sock.setblocking(False)
             sock.bind(ainfo[4])
-            # Probably the backlog here is too big
-            sock.listen(128)
+            # Large, to survive the bursts at the top of the hour
+            sock.listen(BACKLOG)
 
             logging.debug('listen(): listening at: %s', format_epnt(ainfo[4]))
             sockets.append(sock)
@@ -154,6 +182,52 @@ def listen(epnt, prefer_ipv6):
 
     return sockets
 
+#
+# Classic BPF program that selects the socket of a SO_REUSEPORT group
+# using the client prefix, i.e. the /24 of IPv4 addresses and the low
+# 32 bits of the /64 of IPv6 ones, modulo the group size, so that the
+# clients of a prefix (as defined by neubot/negotiate/admission.py)
+# are served by the same socket.  Negative offsets are relative to
+# the network header.
+#
+def _steering_program(count):
+    ''' Returns the (code, length) of the steering program '''
+    net = lambda offset: (offset - 0x100000) & 0xffffffff
+    program = [
+               (0x30, 0, 0, net(0)),            # ldb [net + 0]
+               (0x54, 0, 0, 0xf0),              # and #0xf0
+               (0x15, 3, 0, 0x60),              # jeq #0x60, 6, 3
+               (0x20, 0, 0, net(12)),           # ld [net + 12]
+               (0x74, 0, 0, 8),                 # rsh #8
+               (0x05, 0, 0, 1),                 # ja 7
+               (0x20, 0, 0, net(12)),           # ld [net + 12]
+               (0x94, 0, 0, count),             # mod #count
+               (0x16, 0, 0, 0),                 # ret a
+              ]
+    code = ''.join(struct.pack('HBBI', *insn) for insn in program)
+    return code, len(program)
+
+def steer_reuseport(sock, count):
+
+    '''
+     Make sure that all the connections from the same client address
+     are accepted by the same socket of the SO_REUSEPORT group of sock,
+     which contains count sockets.  Returns False if not supported.
+    '''
+
+    if not sys.platform.startswith('linux'):
+        return False
+    import ctypes
+    code, length = _steering_program(count)
+    buff = ctypes.create_string_buffer(code)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF,
+          struct.pack('HP', length, ctypes.addressof(buff)))
+    except socket.error:
+        logging.warning('steer_reuseport(): not supported', exc_info=1)
+        return False
+    return True
+
 def connect(epnt, prefer_ipv6):
     ''' Connect to epnt '''
 
@@ -167,6 +241,11 @@ def connect(epnt, prefer_ipv6):
                       format_epnt(epnt), exc_info=1)
         return None
 
+    return connect_addrinfo(epnt, addrinfo, prefer_ipv6)
+
+def connect_addrinfo(epnt, addrinfo, prefer_ipv6):
+    ''' Connect to epnt, which resolves to addrinfo '''
+
     message = ['connect(): getaddrinfo() returned: [']
     for ainfo in addrinfo:
         message.append(format_ainfo(ainfo))
@@ -174,33 +253,42 @@ def connect(epnt, prefer_ipv6):
     message[-1] = ']'
     logging.debug(''.join(message))
 
-    addrinfo.sort(key=addrinfo_key, reverse=prefer_ipv6)
+    addrinfo = sorted(addrinfo, key=addrinfo_key, reverse=prefer_ipv6)
 
     for ainfo in addrinfo:
-        try:
-            logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
-
-            sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
-            sock.setblocking(False)
-            result = sock.connect_ex(ainfo[4])
-            if result not in INPROGRESS:
-                raise socket.error(result, os.strerror(result))
-
-            logging.debug('connect(): connection to %s in progress...',
-                          format_epnt(ainfo[4]))
+        sock = connect_ainfo(ainfo)
+        if sock:
             return sock
 
-        except socket.error:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
-        except:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
-
     logging.error('connect(): cannot connect to %s: %s',
       format_epnt(epnt), 'all attempts failed')
     return None
 
+def connect_ainfo(ainfo):
+    ''' Start connecting to the address in ainfo '''
+
+    try:
+        logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
+
+        sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
+        sock.setblocking(False)
+        result = sock.connect_ex(ainfo[4])
+        if result not in INPROGRESS:
+            raise socket.error(result, os.strerror(result))
+
+        logging.debug('connect(): connection to %s in progress...',
+                      format_epnt(ainfo[4]))
+        return sock
+
+    except socket.error:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
+    except:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
+
+    return None
+
 def isconnected(endpoint, sock):
     ''' Check whether connect() succeeded '''
 
@@ -30,12 +30,14 @@
 import collections
 import os.path
 import random
+import tempfile
 
 #
 # Must use WWWDIR because Python modules are not
 # reachable with Windows.  They are stored into
 # library.zip.
 #
+from neubot import six
 from neubot import utils_hier
 
 # Maximum depth
@@ -44,6 +46,14 @@ MAXDEPTH = 16
 # Size of a block
 BLOCKSIZE = 262144
 
+# Size of the random payload arena
+ARENASIZE = 1 << 22
+
+# Maximum size of a view of the arena
+MAXVIEW = 1 << 20
+
+EMPTY = six.b('')
+
 def listdir(curdir, vector, depth):
 
     ''' Make a list of all the files in a given directory
@@ -77,10 +87,10 @@ def create_base_block(length):
         for word in words:
             amount = min(len(word), length)
             word = word[:amount]
-            wordlist = list(word)
+            wordlist = bytearray(word)
             random.shuffle(wordlist)
 
-            base_block.append(''.join(wordlist))
+            base_block.append(bytes(wordlist))
             length -= amount
             if length <= 0:
                 break
@@ -97,7 +107,7 @@ def block_generator(size):
     block = create_base_block(size)
     while True:
         block.rotate(random.randrange(4, 16))
-        yield ''.join(block)
+        yield EMPTY.join(block)
 
 class RandomBlocks(object):
 
@@ -114,24 +124,58 @@ class RandomBlocks(object):
 
     def get_block(self):
         ''' Return a block of data '''
-        return self._generator.next()
+        return next(self._generator)
 
 RANDOMBLOCKS = RandomBlocks()
 
 #
-# XXX Create and discard the first block at the very
-# beginning, so we are sure that we can fetch all the
-# needed files in the common case, i.e. when we
-# startup as root.
+# Regenerating blocks is expensive, because each block is the
+# join of thousands of words, so the test servers don't do that
+# on the hot path.  Instead, they send zero-copy views of this
+# arena of random bytes.  The arena is filled from os.urandom(),
+# so that it does not compress and does not repeat, and it is
+# created the first time it's needed, so that processes that do
+# not send payloads, e.g. the client agent, do not pay for it.
+#
+# The arena contains @size random bytes followed by a copy of
+# the first @maxview bytes, so that a view of up to @maxview
+# bytes can start at any offset below @size.
 #
-RANDOMBLOCKS.get_block()
+
+class RandomArena(object):
+
+    ''' Immutable arena of random bytes '''
+
+    def __init__(self, size=ARENASIZE, maxview=MAXVIEW):
+        ''' Initialize random arena '''
+        self.data = None
+        self.size = size
+        self.maxview = maxview
+
+    def get_data(self):
+        ''' Return the arena content, creating it if needed '''
+        if self.data is None:
+            data = os.urandom(self.size)
+            self.data = data + data[:self.maxview]
+        return self.data
+
+    def view(self, length, offset=None):
+        ''' Return a view of @length bytes at @offset or at random '''
+        if length <= 0:
+            return EMPTY
+        if length > self.maxview:
+            raise ValueError('utils_random: view too large')
+        if offset is None:
+            offset = random.randrange(self.size)
+        return six.buff(self.get_data(), offset % self.size, length)
+
+ARENA = RandomArena()
 
 class RandomBody(object):
 
     '''
      This class implements a minimal file-like interface and
-     employs the random number generator to create the content
-     returned by its read() method.
+     returns views of ARENA from its read() method.
     '''
 
     def __init__(self, total):
@@ -145,9 +189,9 @@ class RandomBody(object):
         amt = min(self.total, min(want, RANDOMBLOCKS.blocksiz))
         if amt:
             self.total -= amt
-            return RANDOMBLOCKS.get_block()[:amt]
+            return ARENA.view(amt)
         else:
-            return ''
+            return EMPTY
 
     def seek(self, offset=0, whence=0):
         ''' Seek stub '''
@@ -155,3 +199,72 @@ class RandomBody(object):
     def tell(self):
         ''' Tell the amounts of bytes left '''
         return self.total
+
+class RandomFile(object):
+
+    '''
+     A preallocated temporary file with the same content of
+     ARENA, so that servers can send random bodies using
+     sendfile().  The file is created the first time it's needed.
+    '''
+
+    def __init__(self):
+        ''' Initialize random file '''
+        self.filep = None
+        self.size = ARENA.size
+
+    def fileno(self):
+        ''' Return the file descriptor, creating the file if needed '''
+        if not self.filep:
+            filep = tempfile.TemporaryFile()
+            filep.write(six.buff(ARENA.get_data(), 0, self.size))
+            filep.flush()
+            self.filep = filep
+        return self.filep.fileno()
+
+RANDOMFILE = RandomFile()
+
+class RandomFileBody(object):
+
+    '''
+     A file-like object of @total bytes that repeats the content
+     of RANDOMFILE, starting from a random offset.  It can be sent
+     using sendfile() and also implements read(), which returns
+     views of ARENA, so that it can be sent over SSL.
+    '''
+
+    def __init__(self, total):
+        ''' Initialize random file body object '''
+        self.total = int(total)
+        self.pos = 0
+        self.start = random.randrange(RANDOMFILE.size)
+
+    def sendfile_region(self):
+        ''' Return the (fileno, offset, count) to send next '''
+        fileno = RANDOMFILE.fileno()
+        offset = (self.start + self.pos) % RANDOMFILE.size
+        count = min(self.total - self.pos, RANDOMFILE.size - offset)
+        return fileno, offset, count
+
+    def read(self, want=None):
+        ''' Read up to @want bytes '''
+        offset = (self.start + self.pos) % RANDOMFILE.size
+        count = min(self.total - self.pos, RANDOMFILE.size - offset,
+                    ARENA.maxview)
+        if want:
+            count = min(count, want)
+        octets = ARENA.view(count, offset)
+        self.pos += len(octets)
+        return octets
+
+    def seek(self, offset=0, whence=os.SEEK_SET):
+        ''' Seek to @offset relative to @whence '''
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.total
+        self.pos = max(0, min(self.total, offset))
+
+    def tell(self):
+        ''' Tell the current position '''
+        return self.pos
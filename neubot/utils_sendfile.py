@@ -0,0 +1,113 @@
+# neubot/utils_sendfile.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Portable sendfile() '''
+
+# Python3-ready: yes
+
+#
+# With sendfile() the kernel copies a file into a socket, so
+# big bodies don't need to be read into Python strings and
+# then written to the socket.  Python 3.3+ exposes it as the
+# os.sendfile() function.  Python 2 does not, so under Linux
+# we call the libc function using ctypes.  Elsewhere we just
+# say that sendfile() is not available and the caller must
+# fall back to read() and send().
+#
+
+import errno
+import os
+import stat
+import sys
+
+def _libc_sendfile():
+    ''' Return a ctypes-based sendfile() or None '''
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # sendfile64 makes sure that off_t is 64 bit on 32 bit systems
+        func = getattr(libc, 'sendfile64', None)
+        if not func:
+            func = libc.sendfile
+    except (ImportError, OSError, AttributeError):
+        return None
+
+    func.argtypes = [ctypes.c_int, ctypes.c_int,
+                     ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    func.restype = ctypes.c_ssize_t
+
+    def sendfile(outfd, infd, offset, count):
+        ''' Wrapper around libc sendfile() '''
+        offset = ctypes.c_int64(offset)
+        result = func(outfd, infd, ctypes.byref(offset), count)
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+
+    return sendfile
+
+if hasattr(os, 'sendfile'):
+    sendfile = os.sendfile
+else:
+    sendfile = _libc_sendfile()
+
+HAVE_SENDFILE = sendfile is not None
+
+def region(filep):
+
+    '''
+     Returns the (fileno, offset, count) tuple that describes
+     what sendfile() should send next from the file-like object
+     @filep, or None if @filep is not backed by a regular file.
+     A count of zero means that we've reached the end of file.
+    '''
+
+    #
+    # File-likes that are not plain files (e.g. the random
+    # body backed by a preallocated file) describe the region
+    # to send by themselves.
+    #
+    if hasattr(filep, 'sendfile_region'):
+        return filep.sendfile_region()
+
+    try:
+        fileno = filep.fileno()
+        info = os.fstat(fileno)
+    except (AttributeError, ValueError, EnvironmentError):
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return None
+
+    offset = filep.tell()
+    return fileno, offset, max(0, info.st_size - offset)
+
+def advance(filep, count):
+    ''' Move the file-like @filep position @count bytes forward '''
+    filep.seek(count, os.SEEK_CUR)
+
+# Errors meaning that sendfile() cannot be used with this file
+UNSUPPORTED = (errno.EINVAL, errno.ENOSYS)
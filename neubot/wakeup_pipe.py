@@ -0,0 +1,89 @@
+# neubot/wakeup_pipe.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Wake up the poller from another thread '''
+
+#
+# The poller is not thread safe, so threads that work on behalf of
+# the poller thread, e.g. the storage pipeline and the resolver, put
+# their results into a thread-safe queue and then write one byte into
+# a non-blocking self-pipe.  The poller thread wakes up, drains the
+# pipe and invokes the callback, which processes the queued results.
+# Pipes are not pollable on Windows, so this is POSIX only.
+#
+
+import errno
+import os
+import sys
+
+if os.name == 'posix':
+    import fcntl
+
+from neubot.pollable import Pollable
+from neubot import six
+
+class WakeupPipe(Pollable):
+
+    ''' Self-pipe used to wake up the poller thread '''
+
+    def __init__(self, poller, callback):
+        Pollable.__init__(self)
+        self.poller = poller
+        self.callback = callback
+        self.rfd, self.wfd = os.pipe()
+        for fileno in (self.rfd, self.wfd):
+            flags = fcntl.fcntl(fileno, fcntl.F_GETFL)
+            fcntl.fcntl(fileno, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.watchdog = -1
+        self.poller.set_readable(self)
+
+    def __repr__(self):
+        return 'wakeup pipe %d' % self.rfd
+
+    def fileno(self):
+        return self.rfd
+
+    def wakeup(self):
+        ''' Wake up the poller thread (any thread) '''
+        try:
+            os.write(self.wfd, six.b('A'))
+        except OSError:
+            # If the pipe is full, the poller will wake up anyway
+            if sys.exc_info()[1].errno not in (errno.EAGAIN,
+                                               errno.EWOULDBLOCK):
+                raise
+
+    def handle_read(self):
+        try:
+            os.read(self.rfd, 4096)
+        except OSError:
+            if sys.exc_info()[1].errno not in (errno.EAGAIN,
+                                               errno.EWOULDBLOCK):
+                raise
+        self.callback()
+
+    def close(self):
+        ''' Close the pipe '''
+        self.poller.unset_readable(self)
+        os.close(self.rfd)
+        os.close(self.wfd)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/api_data.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.api_data import StreamingJSONList
+from neubot.backend import BACKEND
+from neubot.compat import json
+from neubot.http.message import Message
+
+from neubot import api_data
+
+class MinimalStream(object):
+    ''' Minimal HTTP stream '''
+
+    def __init__(self):
+        self.response = None
+
+    def send_response(self, request, response):
+        ''' Keep a copy of the response '''
+        self.response = response
+
+def read_body(body, chunked=False):
+    ''' Read the whole body and remove chunked framing '''
+    data = []
+    while True:
+        piece = body.read()
+        if not piece:
+            break
+        if chunked:
+            length, piece = piece.split('\r\n', 1)
+            if int(length, 16) == 0:
+                continue
+            piece = piece[:int(length, 16)]
+        data.append(piece)
+    return ''.join(data)
+
+class TestStreamingJSONList(unittest.TestCase):
+    ''' Regression test for StreamingJSONList '''
+
+    def test_list(self):
+        ''' Make sure the list is serialized correctly '''
+        rows = [({'x': index}, str(index)) for index in range(5000)]
+        body = StreamingJSONList(rows, chunked=False)
+        self.assertEqual(json.loads(read_body(body)),
+                         [row for row, _ in rows])
+        self.assertEqual(json.loads(read_body(StreamingJSONList(
+                         [], chunked=False))), [])
+
+    def test_chunked(self):
+        ''' Make sure chunked encoding is correct '''
+        rows = [({'x': index}, str(index)) for index in range(5000)]
+        body = StreamingJSONList(rows, 10, True)
+        self.assertEqual(json.loads(read_body(body, True)), {
+                         'results': [row for row, _ in rows[:10]],
+                         'next': '9'})
+
+        body = StreamingJSONList(rows[:10], 10, True)
+        self.assertEqual(json.loads(read_body(body, True))['next'], None)
+
+class TestApiData(unittest.TestCase):
+    ''' Regression test for api_data() '''
+
+    def setUp(self):
+        BACKEND.use_backend('volatile')
+        for timestamp in (1, 2, 2, 2, 3, 4):
+            BACKEND.store_generic('foo', {'timestamp': timestamp})
+
+    def tearDown(self):
+        BACKEND.use_backend('null')
+
+    def _get(self, query):
+        ''' Perform a request and return the parsed body '''
+        request = Message(protocol='HTTP/1.0')
+        stream = MinimalStream()
+        api_data.api_data(stream, request, query)
+        return json.loads(read_body(stream.response.body))
+
+    def test_pages(self):
+        ''' Make sure we can walk results page by page '''
+        cursor, pages = '', []
+        while True:
+            query = 'test=foo&limit=2'
+            if cursor:
+                query += '&cursor=' + cursor
+            page = self._get(query)
+            pages.append([elem['timestamp'] for elem in page['results']])
+            cursor = page['next']
+            if not cursor:
+                break
+        self.assertEqual(pages, [[4, 3], [2, 2], [2, 1]])
+
+    def test_range(self):
+        ''' Make sure the old API still works '''
+        self.assertEqual([elem['timestamp'] for elem in
+                          self._get('test=foo&since=2&until=3')],
+                         [3, 2, 2, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/archive_writer.py '''
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.archive_writer import ArchiveWriter
+from neubot.archive_writer import segment_components
+from neubot.compat import json
+
+class TestArchiveWriter(unittest.TestCase):
+    ''' Regression test for ArchiveWriter '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.touched = []
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def _touch(self, components):
+        ''' Create file below datadir '''
+        self.touched.append(components)
+        path = self.datadir
+        for component in components[:-1]:
+            path = os.path.join(path, component)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        path = os.path.join(path, components[-1])
+        open(path, 'ab').close()
+        return path
+
+    def test_segment_components(self):
+        ''' Make sure segments are hourly '''
+        self.assertEqual(segment_components('raw', 1367000000.5), [
+                         '2013', '04', '26',
+                         '20130426T18:00:00.000000000Z_raw.gz'])
+
+    def test_batch(self):
+        ''' Make sure results are appended to the segment '''
+        writer = ArchiveWriter(self._touch)
+        for index in range(10):
+            writer.append('foo', {'index': index})
+            if index % 4 == 3:
+                writer.flush()
+        writer.flush()
+
+        # Touched only once, even though we flushed three times
+        self.assertEqual(len(self.touched), 1)
+        components = self.touched[0]
+        filep = gzip.open(os.path.join(self.datadir, *components), 'rb')
+        lines = filep.read().splitlines()
+        filep.close()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'index': index} for index in range(10)])
+
+    def test_moved_away(self):
+        ''' Make sure we touch again segments moved away '''
+        writer = ArchiveWriter(self._touch)
+        writer.append('foo', {'index': 0})
+        writer.flush()
+        os.unlink(os.path.join(self.datadir, *self.touched[0]))
+        writer.append('foo', {'index': 1})
+        writer.flush()
+        self.assertEqual(len(self.touched), 2)
+        shutil.rmtree(os.path.join(self.datadir, self.touched[0][0]))
+        writer.append('foo', {'index': 2})
+        writer.flush()
+        self.assertEqual(len(self.touched), 3)
+
+    def test_failure(self):
+        ''' Make sure flush() raises when it cannot write '''
+        writer = ArchiveWriter(lambda components: os.path.join(
+                               self.datadir, 'nonexistent', components[-1]))
+        writer.append('foo', {'index': 0})
+        self.assertRaises(RuntimeError, writer.flush)
+        # The failed results are dropped
+        writer.flush()
+
+if __name__ == '__main__':
+    unittest.main()
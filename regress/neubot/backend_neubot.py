@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Regression test for neubot/backend_neubot.py '''
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.backend_neubot import BackendNeubot
+from neubot.result_log import ResultLog
+
+from neubot import backend_neubot
+
+class FakeProxy(object):
+    ''' Minimal backend proxy '''
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        self.pipeline = True
+
+    def datadir_touch(self, components):
+        ''' Create file below datadir '''
+        path = os.path.join(self.datadir, *components)
+        open(path, 'ab').close()
+        return path
+
+class TestBackendNeubot(unittest.TestCase):
+    ''' Regression test for BackendNeubot '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.opened = []
+
+    def tearDown(self):
+        backend_neubot.ResultLog = ResultLog
+        shutil.rmtree(self.datadir)
+
+    def _slow_result_log(self, *args):
+        ''' Open a result log, slowly '''
+        self.opened.append(args[0])
+        time.sleep(0.1)
+        return ResultLog(*args)
+
+    def test_open_once(self):
+        ''' Make sure concurrent threads open the log only once '''
+        backend_neubot.ResultLog = self._slow_result_log
+        backend = BackendNeubot(FakeProxy(self.datadir))
+        logs = []
+        threads = [threading.Thread(target=lambda:
+                   logs.append(backend._result_log('foo')))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.opened, ['foo'])
+        self.assertTrue(logs[0] is logs[1])
+
+        backend.store_generic('foo', {'timestamp': 1})
+        self.assertEqual(backend.walk_generic('foo', None),
+                         [{'timestamp': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/backend_pipeline.py '''
+
+import logging
+import sys
+import threading
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.backend_pipeline import StoragePipeline
+from neubot.poller import POLLER
+
+class FakeBackend(object):
+    ''' Backend that records stores and flushes '''
+
+    def __init__(self):
+        self.stored = []
+        self.flushed = []
+        self.threads = set()
+
+    def store_generic(self, test, results):
+        ''' Store the results of a generic test '''
+        self.threads.add(threading.current_thread())
+        if results.get('fail'):
+            raise RuntimeError('cannot store')
+        if results.get('warn'):
+            logging.warning('fake_backend: %s', results['warn'])
+        self.stored.append((test, results))
+
+    def flush(self):
+        ''' Flush the stored results '''
+        self.flushed.append(len(self.stored))
+
+class RecordingHandler(logging.Handler):
+    ''' Handler that records messages and threads '''
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.getMessage(),
+                              threading.current_thread()))
+
+class FakeProxy(object):
+    ''' Minimal backend proxy '''
+
+    def __init__(self):
+        self.backend = FakeBackend()
+
+class TestStoragePipeline(unittest.TestCase):
+    ''' Regression test for StoragePipeline '''
+
+    def test_store_and_ack(self):
+        ''' Make sure results are stored off-loop and acknowledged '''
+        proxy = FakeProxy()
+        pipeline = StoragePipeline(proxy, POLLER, 16, 60.0, 2)
+
+        message = {'index': 0}
+        pipeline.submit('store_generic', 'foo', message)
+        message['index'] = 1   # Must not change the queued copy
+        pipeline.submit('store_generic', 'foo', {'fail': 1})
+        pipeline.submit('store_generic', 'foo', {'index': 2})
+        pipeline.close()
+
+        self.assertEqual(proxy.backend.stored, [('foo', {'index': 0}),
+                                                ('foo', {'index': 2})])
+        self.assertEqual(proxy.backend.flushed, [1, 2])
+        self.assertFalse(threading.current_thread() in
+                         proxy.backend.threads)
+
+        data = {}
+        pipeline.snap(data)
+        self.assertEqual(data['storage'], {
+                                           'failed': 1,
+                                           'pending': 0,
+                                           'queued': 3,
+                                           'stored': 2,
+                                           'waited': 0,
+                                          })
+
+    def test_ack_pipe(self):
+        ''' Make sure acknowledgements wake up the poller '''
+        proxy = FakeProxy()
+        pipeline = StoragePipeline(proxy, POLLER, 16, 0.0, 1)
+        pipeline.submit('store_generic', 'foo', {'index': 0})
+        while not pipeline.stored:
+            POLLER._poll(1.0)
+        self.assertTrue(pipeline.pipe.fileno() in POLLER.readset)
+        pipeline.close()
+        self.assertFalse(pipeline.thread)
+
+    def test_deferred_logging(self):
+        ''' Make sure the storage thread does not log by itself '''
+        handler = RecordingHandler()
+        logging.getLogger().addHandler(handler)
+        try:
+            proxy = FakeProxy()
+            pipeline = StoragePipeline(proxy, POLLER, 16, 0.0, 1)
+            pipeline.submit('store_generic', 'foo', {'warn': 'disk full'})
+            while not pipeline.stored:
+                POLLER._poll(1.0)
+            pipeline.close()
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(handler.messages, [('fake_backend: disk full',
+                                             threading.current_thread())])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/bittorrent/aggregate.py '''
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.bittorrent import aggregate
+
+class FakeStream(object):
+    ''' Fake stream '''
+    def __init__(self):
+        self.bytes_recv_tot = 0
+
+class FakeClock(object):
+    ''' Fake clock '''
+    def __init__(self):
+        self.now = 1.0
+    def __call__(self):
+        return self.now
+
+# pylint: disable=R0904
+class TestAggregateSpeed(unittest.TestCase):
+
+    ''' Tests aggregate speed of parallel flows '''
+
+    def setUp(self):
+        self.saved_ticks = aggregate.utils.ticks
+        self.clock = FakeClock()
+        aggregate.utils.ticks = self.clock
+
+    def tearDown(self):
+        aggregate.utils.ticks = self.saved_ticks
+
+    def test_window(self):
+        ''' Make sure we measure when all flows are downloading '''
+        first, second = FakeStream(), FakeStream()
+        speed = aggregate.AggregateSpeed(2)
+
+        first.bytes_recv_tot = 100
+        speed.flow_started(first)
+
+        # Not counted: the second flow has not started yet
+        first.bytes_recv_tot = 1000
+        self.clock.now = 2.0
+        second.bytes_recv_tot = 10
+        speed.flow_started(second)
+
+        self.clock.now = 4.0
+        first.bytes_recv_tot = 3000
+        second.bytes_recv_tot = 1010
+        speed.flow_stopped(first)
+
+        # Not counted: the first flow has stopped
+        self.clock.now = 5.0
+        second.bytes_recv_tot = 5000
+        speed.flow_stopped(second)
+
+        self.assertEqual(speed.get_speed([1, 2]), 1500.0)
+
+    def test_fallback(self):
+        ''' Make sure we sum the flows if the window never opened '''
+        speed = aggregate.AggregateSpeed(2)
+        speed.flow_started(FakeStream())
+        speed.flow_stopped(FakeStream())
+        self.assertEqual(speed.get_speed([1, 2]), 3)
+
+    def test_single(self):
+        ''' Make sure a single flow gets its own speed '''
+        stream = FakeStream()
+        speed = aggregate.AggregateSpeed(1)
+        speed.flow_started(stream)
+        self.clock.now = 2.0
+        stream.bytes_recv_tot = 1000
+        speed.flow_stopped(stream)
+        self.assertEqual(speed.get_speed([7]), 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/bittorrent/bitfield.py '''
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.bittorrent.bitfield import Bitfield
+from neubot.bittorrent.bitfield import iter_random
+from neubot.bittorrent.bitfield import make_bitfield
+
+def _setbits(bitfield):
+    ''' Returns the list of bits set, the slow way '''
+    return [index for index in range(len(bitfield)) if bitfield[index]]
+
+# pylint: disable=R0904
+class TestBulk(unittest.TestCase):
+
+    ''' Tests bulk bitfield operations '''
+
+    def test_and_andnot(self):
+        ''' Make sure AND and ANDNOT work '''
+        first = Bitfield(12, chr(0xF0) + chr(0xA0))
+        second = Bitfield(12, chr(0x3C) + chr(0x30))
+        self.assertEqual(str(first & second), chr(0x30) + chr(0x20))
+        self.assertEqual(str(first.andnot(second)), chr(0xC0) + chr(0x80))
+        self.assertEqual(str(second.andnot(first)), chr(0x0C) + chr(0x10))
+
+    def test_lengths(self):
+        ''' Make sure bulk operations check lengths '''
+        self.assertRaises(ValueError, Bitfield(8).andnot, Bitfield(16))
+        self.assertRaises(ValueError, Bitfield(8).__and__, Bitfield(16))
+
+    def test_count(self):
+        ''' Make sure count() is consistent with the bits '''
+        for length in (1, 7, 8, 9, 1000, 4096):
+            bitfield = make_bitfield(length)
+            self.assertEqual(bitfield.count(), len(_setbits(bitfield)))
+
+    def test_all_set(self):
+        ''' Make sure bulk operations work when all bits are set '''
+        full = Bitfield(12, chr(0xFF) + chr(0xF0))
+        self.assertEqual(full.bits, None)
+        self.assertEqual(full.count(), 12)
+        self.assertEqual(full.andnot(full).count(), 0)
+
+# pylint: disable=R0904
+class TestIterRandom(unittest.TestCase):
+
+    ''' Tests random selection of bits '''
+
+    def test_all_once(self):
+        ''' Make sure we get each bit that is set exactly once '''
+        for length in (1, 7, 9, 1000, 4096, 65536):
+            bitfield = make_bitfield(length)
+            seen = list(iter_random(bitfield))
+            self.assertEqual(sorted(seen), _setbits(bitfield))
+
+    def test_sparse(self):
+        ''' Make sure we work when few bits are set '''
+        bitfield = Bitfield(4096)
+        for index in (0, 17, 4095):
+            bitfield[index] = 1
+        self.assertEqual(sorted(iter_random(bitfield)), [0, 17, 4095])
+
+    def test_empty(self):
+        ''' Make sure we work when no bits are set '''
+        self.assertEqual(list(iter_random(Bitfield(64))), [])
+
+    def test_untouched(self):
+        ''' Make sure iter_random() does not modify the bitfield '''
+        bitfield = make_bitfield(1024)
+        before = str(bitfield)
+        list(iter_random(bitfield))
+        self.assertEqual(str(bitfield), before)
+
+if __name__ == '__main__':
+    unittest.main()
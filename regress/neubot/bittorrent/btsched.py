@@ -28,9 +28,12 @@ import sys
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
+from neubot.bittorrent.bitfield import Bitfield
 from neubot.bittorrent.bitfield import make_bitfield
 from neubot.bittorrent.btsched import _sched_piece
 from neubot.bittorrent.btsched import sched_idx
+from neubot.bittorrent.btsched import sched_req
+from neubot.bittorrent.btsched import sched_window
 
 # pylint: disable=R0904
 class TestSchedIdx(unittest.TestCase):
@@ -86,5 +89,42 @@ class TestSchedPiece(unittest.TestCase):
         self.assertEquals(sched.next(), (0, 8, 8))
         self.assertEquals(sched.next(), (1, 0, 3))
 
+# pylint: disable=R0904
+class TestSchedReq(unittest.TestCase):
+
+    ''' Tests BitTorrent requests scheduler '''
+
+    def test_burstlen(self):
+        ''' Make sure the caller can choose the initial burst '''
+        # We miss all the pieces and the peer has all of them
+        bitfield = Bitfield(64)
+        peer_bitfield = Bitfield(64, chr(0xFF) * 8)
+        sched = sched_req(bitfield, peer_bitfield, 64, 16, 16, 48)
+        self.assertEqual(len(sched.next()), 3)
+        self.assertEqual(len(sched.next()), 1)
+        self.assertEqual(len(list(sched)), 3)
+
+    def test_no_burst(self):
+        ''' Make sure that a zero burst yields single requests '''
+        bitfield = Bitfield(64)
+        peer_bitfield = Bitfield(64, chr(0xFF) * 8)
+        sched = sched_req(bitfield, peer_bitfield, 64, 16, 16, 0)
+        self.assertEqual([len(vector) for vector in sched], [1] * 4)
+
+# pylint: disable=R0904
+class TestSchedWindow(unittest.TestCase):
+
+    ''' Tests BitTorrent request window '''
+
+    def test_bdp(self):
+        ''' Make sure the window is twice the BDP in blocks '''
+        self.assertEqual(sched_window(0.1, 1000000, 10000, 2, 64), 20)
+        self.assertEqual(sched_window(0.1, 1000000, 30000, 2, 64), 7)
+
+    def test_bounds(self):
+        ''' Make sure the window is bounded '''
+        self.assertEqual(sched_window(0, 1000000, 10000, 2, 64), 2)
+        self.assertEqual(sched_window(10, 1000000, 10000, 2, 64), 64)
+
 if __name__ == '__main__':
     unittest.main()
@@ -43,7 +43,9 @@ PROPERTIES = (
     'bittorrent.numpieces',
     'bittorrent.piece_len',
     'bittorrent.port',
+    'bittorrent.streams',
     'bittorrent.watchdog',
+    'bittorrent.window',
 )
 
 # pylint: disable=R0904
@@ -179,6 +179,74 @@ class TestReassembler_SingleChar(TestReassembler_Base):
             m = buffer(m, amt)
         self.check_results()
 
+#
+# Make sure that the payload of PIECE messages is counted and not
+# buffered, and that the parent receives index, begin and length
+# regardless of how the incoming stream is split.
+#
+class TestReassembler_Piece(unittest.TestCase):
+
+    def setUp(self):
+        self.numpieces = 16
+        self.pieces = []
+        self.stream = stream.StreamBitTorrent(None)
+        self.stream.parent = self
+        self.stream.start_recv = lambda: None
+        self.stream.left = 0
+        self.stream.complete = True
+        self.data = "".join([
+          struct.pack("!IcII", 9 + 4096, stream.PIECE, 1, 0), "A" * 4096,
+          struct.pack("!Ic", 1, stream.UNCHOKE),
+          struct.pack("!IcII", 9 + 1, stream.PIECE, 2, 17), "B",
+          struct.pack("!I", 0),
+        ])
+
+    def check_results(self):
+        self.assertEqual(self.pieces, [(1, 0, 4096), "UNCHOKE", (2, 17, 1)])
+        self.assertEqual(self.stream.left, 0)
+        self.assertEqual(self.stream.count, 0)
+        self.assertEqual(self.stream.buff, [])
+        self.assertEqual(self.stream.piece, None)
+
+    def test_buffer(self):
+        """Make sure PIECE works when everything is in a single buffer"""
+        self.stream.recv_complete(buffer(self.data))
+        self.check_results()
+
+    def test_small_reads(self):
+        """Make sure PIECE works with small reads"""
+        for amt in range(1, 20):
+            del self.pieces[:]
+            for offset in range(0, len(self.data), amt):
+                self.stream.recv_complete(buffer(self.data, offset, amt))
+            self.check_results()
+
+    def test_index(self):
+        """Make sure PIECE index is checked before reading the payload"""
+        message = struct.pack("!IcII", 9 + 4096, stream.PIECE, 16, 0)
+        self.assertRaises(RuntimeError, self.stream.recv_complete, message)
+
+    def got_unchoke(self, s):
+        self.pieces.append("UNCHOKE")
+    def got_piece(self, s, i, a, b):
+        self.pieces.append((i, a, b))
+
+#
+# Make sure that the PIECE header and block are queued separately,
+# so that the block is not copied.
+#
+class TestSendPiece(unittest.TestCase):
+    def runTest(self):
+        """Make sure that send_piece() does not copy the block"""
+        queue = []
+        s = stream.StreamBitTorrent(None)
+        s.start_send = queue.append
+        block = buffer("A" * 1024)
+        s.send_piece(1, 2, block)
+        self.assertEqual(queue[0], struct.pack("!IcII", 1033,
+                                               stream.PIECE, 1, 2))
+        self.assertTrue(queue[1] is block)
+
 #
 #  ____
 # |  _ \   __ _  _ __  ___   ___  _ __
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/brigade.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.brigade import Brigade
+from neubot.brigade import RingBrigade
+
+from neubot import six
+
+class BrigadeTestMixin(object):
+    ''' Tests that all brigades must pass '''
+
+    klass = None
+
+    def setUp(self):
+        ''' Create the brigade '''
+        self.brigade = self.klass()
+
+    def test_getline(self):
+        ''' Make sure getline() works across buckets '''
+        self.brigade.bufferise(six.b('HTTP/1.1 200'))
+        self.assertEqual(self.brigade.getline(1024), six.b(''))
+        self.brigade.bufferise(six.b(' Ok\r\nContent-'))
+        self.brigade.bufferise(six.b('Length: 0\r\n\r\nBODY'))
+        self.assertEqual(self.brigade.getline(1024),
+                         six.b('HTTP/1.1 200 Ok\r\n'))
+        self.assertEqual(self.brigade.getline(1024),
+                         six.b('Content-Length: 0\r\n'))
+        self.assertEqual(self.brigade.getline(1024), six.b('\r\n'))
+        self.assertEqual(self.brigade.getline(1024), six.b(''))
+        self.assertEqual(self.brigade.total, 4)
+        self.assertEqual(self.brigade.pullup(4), six.b('BODY'))
+        self.assertEqual(self.brigade.total, 0)
+
+    def test_line_too_long(self):
+        ''' Make sure getline() enforces maxline '''
+        self.brigade.bufferise(six.b('A' * 16))
+        self.assertRaises(RuntimeError, self.brigade.getline, 16)
+
+    def test_line_maxline(self):
+        ''' Make sure a line of exactly maxline bytes is accepted '''
+        self.brigade.bufferise(six.b('A' * 15 + '\n'))
+        self.assertEqual(self.brigade.getline(16), six.b('A' * 15 + '\n'))
+
+    def test_pullup(self):
+        ''' Make sure pullup() waits for enough data '''
+        self.brigade.bufferise(six.b('abc'))
+        self.assertEqual(self.brigade.pullup(4), six.b(''))
+        self.brigade.bufferise(six.b('defg'))
+        self.assertEqual(self.brigade.pullup(4), six.b('abcd'))
+        self.assertEqual(self.brigade.pullup(3), six.b('efg'))
+        self.assertEqual(self.brigade.pullup(1), six.b(''))
+
+    def test_skip(self):
+        ''' Make sure skip() returns what's left to skip '''
+        self.brigade.bufferise(six.b('abc'))
+        self.assertEqual(self.brigade.skip(4), 4)
+        self.assertEqual(self.brigade.total, 3)
+        self.brigade.bufferise(six.b('defg'))
+        self.assertEqual(self.brigade.skip(5), 0)
+        self.assertEqual(self.brigade.pullup(2), six.b('fg'))
+
+    def test_unshare(self):
+        ''' Make sure the brigade survives buffer reuse '''
+        buff = bytearray(six.b('0123456789'))
+        self.brigade.bufferise(six.buff(buff, 0, 10))
+        self.assertEqual(self.brigade.skip(8), 0)
+        self.brigade.unshare()
+        buff[8:10] = six.b('XX')
+        self.assertEqual(self.brigade.pullup(2), six.b('89'))
+
+    def test_many_small(self):
+        ''' Make sure many small reads work '''
+        content = six.b('').join(six.b('line %d\n' % num)
+                                 for num in range(1000))
+        lines = []
+        for index in range(0, len(content), 7):
+            self.brigade.bufferise(content[index:index + 7])
+            while True:
+                line = self.brigade.getline(64)
+                if not line:
+                    break
+                lines.append(line)
+        self.assertEqual(six.b('').join(lines), content)
+
+class TestBrigade(BrigadeTestMixin, unittest.TestCase):
+    ''' Regression test for Brigade '''
+    klass = Brigade
+
+class TestRingBrigade(BrigadeTestMixin, unittest.TestCase):
+    ''' Regression test for RingBrigade '''
+    klass = RingBrigade
+
+    def test_no_copy(self):
+        ''' Make sure pulling up a whole bucket does not copy it '''
+        octets = six.b('A' * 65536)
+        self.brigade.bufferise(octets)
+        self.assertTrue(self.brigade.pullup(65536) is octets)
+
+    def test_compact(self):
+        ''' Make sure the consumed head is eventually dropped '''
+        for _ in range(1000):
+            self.brigade.bufferise(six.b('x' * 100))
+            self.brigade.bufferise(six.b('y' * 100))
+            self.assertEqual(len(self.brigade.pullup(150)), 150)
+        self.assertEqual(self.brigade.total, 50 * 1000)
+        self.assertTrue(len(self.brigade.buffer) < 4 * 50 * 1000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Regression test for neubot/bytegen_speedtest.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.bytegen_speedtest import BytegenSpeedtest
+
+class TestBytegenSpeedtest(unittest.TestCase):
+    ''' Regression test for BytegenSpeedtest '''
+
+    def test_chunks(self):
+        ''' Make sure each chunk carries a fresh view of the arena '''
+        bytegen = BytegenSpeedtest(3600.0, 1024)
+        views = []
+        for _ in range(8):
+            self.assertEqual(bytegen.read(), '400\r\n')
+            view = bytegen.read()
+            self.assertTrue(isinstance(view, buffer))
+            self.assertEqual(len(view), 1024)
+            views.append(str(view))
+            self.assertEqual(bytegen.read(), '\r\n')
+        self.assertEqual(len(set(views)), len(views))
+
+    def test_end(self):
+        ''' Make sure the body ends with the last chunk '''
+        bytegen = BytegenSpeedtest(0.0, 1024)
+        self.assertEqual(bytegen.read(), '0\r\n\r\n')
+        self.assertEqual(bytegen.read(), '')
+
+    def test_close(self):
+        ''' Make sure close() drops the pending pieces '''
+        bytegen = BytegenSpeedtest(3600.0, 1024)
+        bytegen.read()
+        bytegen.close()
+        self.assertEqual(bytegen.read(), '')
+
+if __name__ == '__main__':
+    unittest.main()
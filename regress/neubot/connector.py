@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.connector import Connector
+from neubot.connector import interleave
+from neubot.connector import interleave_families
+from neubot.poller import POLLER
+
+from neubot import utils
+
+def _ainfo(family, address):
+    ''' Make a fake addrinfo '''
+    return (family, socket.SOCK_STREAM, 6, '', (address, 80))
+
+class Parent(object):
+    ''' Records the outcome of a connector '''
+
+    def __init__(self):
+        self.connected = []
+        self.failed = []
+
+    def handle_connect(self, connector, sock, rtt, sslconfig, extra):
+        ''' Handle the CONNECT event '''
+        self.connected.append((connector.winner, sock, rtt))
+
+    def handle_connect_error(self, connector):
+        ''' Handle the CONNECT_ERROR event '''
+        self.failed.append(connector)
+
+class TestInterleave(unittest.TestCase):
+    ''' Make sure candidates are interleaved '''
+
+    def test_interleave(self):
+        ''' Make sure interleave() alternates the lists '''
+        self.assertEqual(interleave([1, 2, 3], ['a']), [1, 'a', 2, 3])
+        self.assertEqual(interleave([], ['a', 'b']), ['a', 'b'])
+
+    def test_families(self):
+        ''' Make sure the preferred family comes first '''
+        addrinfo = [_ainfo(socket.AF_INET, '10.0.0.1'),
+                    _ainfo(socket.AF_INET, '10.0.0.2'),
+                    _ainfo(socket.AF_INET6, '::2')]
+        self.assertEqual([ainfo[4][0] for ainfo in
+                          interleave_families(addrinfo, True)],
+                         ['::2', '10.0.0.1', '10.0.0.2'])
+        self.assertEqual([ainfo[4][0] for ainfo in
+                          interleave_families(addrinfo, False)],
+                         ['10.0.0.1', '::2', '10.0.0.2'])
+
+class TestConnector(unittest.TestCase):
+    ''' Make sure the connector races the endpoints '''
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.port = self.listener.getsockname()[1]
+        self.parent = Parent()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def _run(self, connector):
+        ''' Run the poller until the connector is done '''
+        while not connector.done:
+            POLLER.timers.run(utils.ticks())
+            POLLER._poll(0.1)
+
+    def test_race(self):
+        ''' Make sure the working endpoint wins '''
+        connector = Connector(self.parent, ('192.0.2.1 127.0.0.1',
+                              self.port), False, None, None)
+        self._run(connector)
+        self.assertEqual(self.parent.failed, [])
+        winner, sock, rtt = self.parent.connected[0]
+        self.assertEqual(winner, ('127.0.0.1', self.port))
+        self.assertTrue(rtt < 1.0)
+        self.assertEqual(connector.attempts, [])
+        sock.close()
+
+    def test_failure(self):
+        ''' Make sure we report failure when all attempts fail '''
+        self.listener.close()
+        connector = Connector(self.parent, ('127.0.0.1 ::1', self.port),
+                              False, None, None)
+        self._run(connector)
+        self.assertEqual(self.parent.connected, [])
+        self.assertEqual(self.parent.failed, [connector])
+
+    def test_timeout(self):
+        ''' Make sure we close the attempts that time out '''
+        connector = Connector(self.parent, ('127.0.0.1 127.0.0.2',
+                              self.port), False, None, None)
+        socks = []
+        while connector.attempts:
+            attempt = connector.attempts[0]
+            socks.append(attempt.sock)
+            POLLER.close(attempt)  # As the watchdog does
+        self.assertEqual(self.parent.failed, [connector])
+        self.assertEqual(len(socks), 2)
+        closed = 0
+        for sock in socks:
+            try:
+                sock.fileno()
+            except socket.error:
+                closed += 1
+        self.assertEqual(closed, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,7 @@ import unittest
 if __name__ == "__main__":
     sys.path.insert(0, ".")
 
+from neubot.database import _table_utils
 from neubot.database import table_speedtest
 from neubot import utils
 
@@ -60,5 +61,36 @@ class TestDatabase(unittest.TestCase):
         table_speedtest.prune(connection, until)
         self.assertTrue(len(table_speedtest.listify(connection)) < len(v1))
 
+class TestWalk(unittest.TestCase):
+
+    def runTest(self):
+        """Make sure we can walk speedtest table page by page"""
+
+        connection = sqlite3.connect(":memory:")
+        connection.row_factory = sqlite3.Row
+        table_speedtest.create(connection)
+
+        v = map(None, ResultIterator())
+        for d in v:
+            table_speedtest.insert(connection, d, override_timestamp=False)
+        v1 = table_speedtest.listify(connection)
+
+        # Make sure we fetch more than one batch
+        saved, _table_utils.WALK_BATCH = _table_utils.WALK_BATCH, 16
+        try:
+            v2 = [row for row, _ in table_speedtest.walk(connection)]
+        finally:
+            _table_utils.WALK_BATCH = saved
+        self.assertEquals(v1, v2)
+
+        v3, cursor = [], None
+        while True:
+            page = list(table_speedtest.walk(connection, cursor=cursor))[:7]
+            if not page:
+                break
+            v3.extend(row for row, _ in page)
+            cursor = page[-1][1]
+        self.assertEquals(v1, v3)
+
 if __name__ == "__main__":
     unittest.main()
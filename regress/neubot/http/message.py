@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/http/message.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http import message
+
+class TestSerializeHeaders(unittest.TestCase):
+    ''' Regression test for Message.serialize_headers() '''
+
+    def setUp(self):
+        ''' Start with an empty cache '''
+        message.TEMPLATES.clear()
+
+    def test_response(self):
+        ''' Make sure responses are correctly serialized '''
+        response = message.Message()
+        response.compose(code='200', reason='Ok', date=False,
+                         nocache=False)
+        self.assertEqual(response.serialize_headers(),
+                         'HTTP/1.1 200 Ok\r\nContent-Length: 0\r\n\r\n')
+
+    def test_request(self):
+        ''' Make sure requests are correctly serialized '''
+        request = message.Message()
+        request.compose(method='GET', uri='http://127.0.0.1:8080/foo',
+                        date=False, nocache=False)
+        lines = request.serialize_headers().split('\r\n')
+        self.assertEqual(lines[0], 'GET /foo HTTP/1.1')
+        self.assertEqual(sorted(lines[1:]), ['', '', 'Content-Length: 0',
+                                             'Host: 127.0.0.1:8080'])
+
+    def test_no_headers(self):
+        ''' Make sure messages without headers are correctly serialized '''
+        response = message.Message(code='200', reason='Ok',
+                                   protocol='HTTP/1.0')
+        self.assertEqual(response.serialize_headers(),
+                         'HTTP/1.0 200 Ok\r\n\r\n')
+
+    def test_template_reuse(self):
+        ''' Make sure responses with the same headers share a template '''
+        for value in ('1', '22'):
+            response = message.Message()
+            response.compose(code='200', reason='Ok', body=value * 3,
+                             date=False, nocache=False)
+            self.assertEqual(response.serialize_headers(),
+                             'HTTP/1.1 200 Ok\r\nContent-Length: %d\r\n\r\n'
+                             % (len(value) * 3))
+        self.assertEqual(len(message.TEMPLATES), 1)
+
+    def test_canonicalize(self):
+        ''' Make sure header names are canonicalized '''
+        self.assertEqual(message.canonicalize('content-type'),
+                         'Content-Type')
+        self.assertEqual(message.canonicalize('x-neubot-foo'),
+                         'X-Neubot-Foo')
+
+if __name__ == '__main__':
+    unittest.main()
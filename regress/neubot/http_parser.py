@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/http_parser.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http_parser import END_OF_HEADERS
+from neubot.http_parser import HTTPParser
+from neubot.http_parser import split_header
+
+from neubot import six
+
+REQUEST = six.b('GET / HTTP/1.1\r\nHost: a:80\r\n  \r\n')
+
+class TestHTTPParser(unittest.TestCase):
+    ''' Regression test for HTTPParser '''
+
+    def test_headers(self):
+        ''' Make sure we parse the first line and the headers '''
+        parser = HTTPParser()
+        parser.bufferise(REQUEST)
+        self.assertEqual(parser.getline(), six.b('GET / HTTP/1.1\r\n'))
+        self.assertEqual(parser.getheader(), (six.b('Host'), six.b('a:80')))
+        self.assertTrue(parser.getheader() is END_OF_HEADERS)
+        self.assertEqual(parser.getheader(), None)
+        self.assertEqual(parser.total, 0)
+
+    def test_slow_drip(self):
+        ''' Make sure we cope with one byte at a time '''
+        parser = HTTPParser()
+        result = []
+        for index in range(len(REQUEST)):
+            parser.bufferise(REQUEST[index:index + 1])
+            if not result:
+                line = parser.getline()
+                if line:
+                    result.append(line)
+            else:
+                header = parser.getheader()
+                if header:
+                    result.append(header)
+        self.assertEqual(result, [six.b('GET / HTTP/1.1\r\n'),
+                                  (six.b('Host'), six.b('a:80')),
+                                  END_OF_HEADERS])
+
+    def test_folding(self):
+        ''' Make sure continuation lines have no name '''
+        parser = HTTPParser()
+        parser.bufferise(six.b('Accept: a,\r\n\tb\r\n\r\n'))
+        self.assertEqual(parser.getheader(), (six.b('Accept'), six.b('a,')))
+        self.assertEqual(parser.getheader(), (None, six.b('b')))
+        self.assertTrue(parser.getheader() is END_OF_HEADERS)
+
+    def test_invalid(self):
+        ''' Make sure we reject headers without colon '''
+        parser = HTTPParser()
+        parser.bufferise(six.b('Accept\r\n'))
+        self.assertRaises(RuntimeError, parser.getheader)
+
+    def test_maxline(self):
+        ''' Make sure we enforce the maximum line length '''
+        parser = HTTPParser(16)
+        parser.bufferise(six.b('A' * 15))
+        self.assertEqual(parser.getline(), six.b(''))
+        parser.bufferise(six.b('A'))
+        self.assertRaises(RuntimeError, parser.getline)
+        self.assertRaises(RuntimeError, parser.getheader)
+
+    def test_getpiece(self):
+        ''' Make sure getpiece() returns what is buffered '''
+        parser = HTTPParser()
+        parser.bufferise(six.b('HTTP/1.1 200 Ok\r\n\r\nabcdef'))
+        parser.getline()
+        self.assertTrue(parser.getheader() is END_OF_HEADERS)
+        self.assertEqual(bytes(parser.getpiece(4)), six.b('abcd'))
+        self.assertEqual(bytes(parser.getpiece(4)), six.b('ef'))
+        self.assertEqual(parser.getpiece(4), six.b(''))
+
+    def test_split_header(self):
+        ''' Make sure split_header() works '''
+        self.assertEqual(split_header(six.b('A : b:c ')),
+                         (six.b('A'), six.b('b:c')))
+        self.assertEqual(split_header(six.b('A')), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.handler import Handler
+from neubot.listener import Listener
+from neubot.poller import POLLER
+
+from neubot import listener
+from neubot import utils_net
+
+class AcceptingHandler(Handler):
+    ''' Records accepted sockets '''
+
+    def __init__(self):
+        self.accepted = []
+        self.errors = 0
+
+    def handle_accept(self, listener_, sock, sslconfig, sslcert):
+        self.accepted.append(sock)
+
+    def handle_accept_error(self, listener_):
+        self.errors += 1
+
+class TestListener(unittest.TestCase):
+    ''' Regression test for Listener '''
+
+    def setUp(self):
+        self.lsock = utils_net.listen(('127.0.0.1', 0), False)[0]
+        self.handler = AcceptingHandler()
+        self.listener = Listener(self.handler, self.lsock,
+                                 self.lsock.getsockname(), None, None)
+        self.clients = []
+
+    def tearDown(self):
+        POLLER.unset_readable(self.listener)
+        for sock in self.clients + self.handler.accepted:
+            sock.close()
+        self.lsock.close()
+
+    def _connect(self, count):
+        ''' Connect @count clients '''
+        for _ in range(count):
+            sock = socket.create_connection(self.lsock.getsockname())
+            self.clients.append(sock)
+
+    def test_batch(self):
+        ''' Make sure we accept many connections per event '''
+        self._connect(5)
+        self.listener.handle_read()
+        self.assertEqual(len(self.handler.accepted), 5)
+        self.assertEqual(self.handler.errors, 0)
+
+    def test_maxaccept(self):
+        ''' Make sure we accept at most MAXACCEPT connections '''
+        saved = listener.MAXACCEPT
+        listener.MAXACCEPT = 2
+        try:
+            self._connect(3)
+            self.listener.handle_read()
+            self.assertEqual(len(self.handler.accepted), 2)
+            self.listener.handle_read()
+            self.assertEqual(len(self.handler.accepted), 3)
+        finally:
+            listener.MAXACCEPT = saved
+
+class TestReusePort(unittest.TestCase):
+    ''' Make sure many sockets can share a port '''
+
+    def test_reuseport(self):
+        ''' Make sure we can listen twice with SO_REUSEPORT '''
+        if utils_net.SO_REUSEPORT is None:
+            return
+        first = utils_net.listen(('127.0.0.1', 0), False, True)
+        port = first[0].getsockname()[1]
+        second = utils_net.listen(('127.0.0.1', port), False, True)
+        self.assertEqual(len(second), 1)
+        for sock in first + second:
+            sock.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/negotiate/admission.py '''
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot.negotiate.admission import Admission
+from neubot.negotiate.admission import TokenBucket
+from neubot.negotiate.admission import prefix_of
+
+# Make sure negotiate settings are registered
+import neubot.negotiate
+
+class MinimalStream(object):
+    ''' Minimal stream '''
+
+    def __init__(self, address):
+        self.peername = (address, 0)
+
+class TestTokenBucket(unittest.TestCase):
+    ''' Regression test for TokenBucket '''
+
+    def test_take_give(self):
+        ''' Make sure take() and give() work as expected '''
+        bucket = TokenBucket(2)
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        bucket.give()
+        bucket.give()
+        bucket.give()
+        self.assertTrue(bucket.full())
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_refill(self):
+        ''' Make sure the bucket refills over time '''
+        bucket = TokenBucket(1, 10.0)
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.full())
+        bucket.ticks -= 0.2
+        self.assertTrue(bucket.full())
+
+class TestPrefixOf(unittest.TestCase):
+    ''' Regression test for prefix_of() '''
+
+    def test_prefix_of(self):
+        ''' Make sure prefix_of() works as expected '''
+        self.assertEqual(prefix_of('130.192.91.211'), '130.192.91.0/24')
+        self.assertEqual(prefix_of('::ffff:130.192.91.211'),
+                         '130.192.91.0/24')
+        self.assertEqual(prefix_of('2001:db8:1:2:3:4:5:6'),
+                         '2001:db8:1:2::/64')
+        self.assertEqual(prefix_of('abc'), None)
+
+class TestAdmission(unittest.TestCase):
+    ''' Regression test for Admission '''
+
+    def setUp(self):
+        self.saved = CONFIG.copy()
+        CONFIG['negotiate.parallelism'] = 4
+        CONFIG['negotiate.parallelism_bittorrent'] = 2
+        CONFIG['negotiate.parallelism_speedtest'] = 0
+        CONFIG['negotiate.prefix_parallelism'] = 2
+        CONFIG['negotiate.prefix_burst'] = 3
+        CONFIG['negotiate.prefix_rate'] = 3
+        self.admission = Admission()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            CONFIG[name] = value
+
+    def _admit(self, address, module):
+        ''' Make a stream and try to admit it '''
+        stream = MinimalStream(address)
+        if not self.admission.admit(stream, module):
+            return None
+        return stream
+
+    def test_module_slots(self):
+        ''' Make sure heavy tests do not starve light ones '''
+        torrents = [self._admit('10.0.%d.1' % i, 'bittorrent')
+                    for i in range(3)]
+        speedtest = self._admit('10.0.9.1', 'speedtest')
+        self.assertTrue(self.admission.unchoke(torrents[0], 'bittorrent'))
+        self.assertTrue(self.admission.unchoke(torrents[1], 'bittorrent'))
+        self.assertFalse(self.admission.unchoke(torrents[2], 'bittorrent'))
+        self.assertTrue(self.admission.unchoke(speedtest, 'speedtest'))
+
+        self.assertTrue(self.admission.release(torrents[0]))
+        self.assertTrue(self.admission.can_unchoke(torrents[2]))
+        self.assertFalse(self.admission.release(MinimalStream('10.0.0.1')))
+
+    def test_global_parallelism(self):
+        ''' Make sure at most negotiate.parallelism streams run '''
+        streams = [self._admit('10.0.%d.1' % i, 'speedtest')
+                   for i in range(5)]
+        for stream in streams[:4]:
+            self.assertTrue(self.admission.unchoke(stream, 'speedtest'))
+        self.assertFalse(self.admission.unchoke(streams[4], 'speedtest'))
+
+    def test_prefix_slots(self):
+        ''' Make sure a single NAT cannot take all the slots '''
+        streams = [self._admit('10.0.0.%d' % i, 'speedtest')
+                   for i in range(3)]
+        other = self._admit('10.0.1.1', 'speedtest')
+        self.assertTrue(self.admission.unchoke(streams[0], 'speedtest'))
+        self.assertTrue(self.admission.unchoke(streams[1], 'speedtest'))
+        self.assertFalse(self.admission.unchoke(streams[2], 'speedtest'))
+        self.assertTrue(self.admission.unchoke(other, 'speedtest'))
+
+        snap = {}
+        self.admission.snap(snap)
+        self.assertEqual(snap['admission']['prefixes_running'],
+                         {'10.0.0.0/24': 2, '10.0.1.0/24': 1})
+        self.assertEqual(snap['admission']['running'], 3)
+        self.assertEqual(snap['admission']['waiting'], 1)
+
+    def test_prefix_rate(self):
+        ''' Make sure a prefix is rate limited '''
+        for index in range(3):
+            self.assertTrue(self._admit('10.0.0.%d' % index, 'speedtest'))
+        self.assertFalse(self._admit('10.0.0.9', 'speedtest'))
+        self.assertTrue(self._admit('10.0.1.1', 'speedtest'))
+        self.assertTrue(self._admit('abc', 'speedtest'))
+        self.assertEqual(self.admission.rejected, 1)
+
+if __name__ == '__main__':
+    unittest.main()
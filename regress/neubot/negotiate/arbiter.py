@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/negotiate/arbiter.py '''
+
+import copy
+import os
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot.negotiate.admission import Admission
+from neubot.negotiate.arbiter import Arbiter
+
+# Make sure negotiate settings are registered
+import neubot.negotiate
+
+class MinimalStream(object):
+    ''' Minimal stream '''
+
+    def __init__(self, address):
+        self.peername = (address, 0)
+
+class TestArbiter(unittest.TestCase):
+    ''' Regression test for Arbiter '''
+
+    def setUp(self):
+        self.saved = CONFIG.copy()
+        CONFIG['negotiate.parallelism'] = 3
+        CONFIG['negotiate.parallelism_bittorrent'] = 1
+        CONFIG['negotiate.parallelism_speedtest'] = 0
+        self.workers = []
+        arbiter = Arbiter(2)
+        for index in range(2):
+            arbiter.reset(index)
+            worker = copy.copy(arbiter)
+            worker.attach(index)
+            self.workers.append(worker)
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            CONFIG[name] = value
+
+    def test_shared_slots(self):
+        ''' Make sure workers share the slots '''
+        first, second = self.workers
+        self.assertTrue(first.take('bittorrent'))
+        self.assertFalse(second.available('bittorrent'))
+        self.assertFalse(second.take('bittorrent'))
+        self.assertTrue(second.take('speedtest'))
+        self.assertTrue(first.take('speedtest'))
+        self.assertFalse(second.take('speedtest'))
+
+        generation = second.generation()
+        first.give('bittorrent')
+        self.assertTrue(second.generation() > generation)
+        self.assertTrue(second.take('bittorrent'))
+
+        snap = {}
+        second.snap(snap)
+        self.assertEqual(snap['arbiter']['running'], 3)
+        self.assertEqual(snap['arbiter']['modules']['bittorrent'], 1)
+
+    def test_reset(self):
+        ''' Make sure the slots of a dead worker are given back '''
+        first, second = self.workers
+        for _ in range(3):
+            self.assertTrue(first.take('speedtest'))
+        self.assertFalse(second.take('speedtest'))
+        second.reset(0)
+        self.assertTrue(second.take('speedtest'))
+
+    def test_heartbeat(self):
+        ''' Make sure heartbeat() marks the worker as ready '''
+        first = self.workers[0]
+        self.assertFalse(first.is_ready(0))
+        first.heartbeat()
+        self.assertTrue(first.is_ready(0))
+        self.assertTrue(first.last_heartbeat(0) > 0)
+
+    def test_fork(self):
+        ''' Make sure the state is shared with child processes '''
+        first, second = self.workers
+        pid = os.fork()
+        if pid == 0:
+            status = int(not second.take('bittorrent'))
+            os._exit(status)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertFalse(first.take('bittorrent'))
+
+    def test_admission(self):
+        ''' Make sure admission control uses the arbiter '''
+        CONFIG['negotiate.prefix_burst'] = 0
+        admissions = []
+        for worker in self.workers:
+            admission = Admission()
+            admission.arbiter = worker
+            admissions.append(admission)
+        streams = [MinimalStream('10.0.%d.1' % i) for i in range(4)]
+        self.assertTrue(admissions[0].unchoke(streams[0], 'speedtest'))
+        self.assertTrue(admissions[0].unchoke(streams[1], 'speedtest'))
+        self.assertTrue(admissions[1].unchoke(streams[2], 'speedtest'))
+        self.assertFalse(admissions[1].unchoke(streams[3], 'speedtest'))
+        self.assertTrue(admissions[0].release(streams[0]))
+        self.assertTrue(admissions[1].unchoke(streams[3], 'speedtest'))
+
+if __name__ == '__main__':
+    unittest.main()
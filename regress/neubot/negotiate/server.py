@@ -143,7 +143,7 @@ class ProcessRequest(unittest.TestCase):
         server = NegotiateServer(None)
         stream = MinimalHttpStream()
         server.queue.append(stream)
-        server.known.add(stream)
+        server.notified[stream] = 0
 
         request = Message(uri='/negotiate/')
         server.process_request(stream, request)
@@ -167,12 +167,12 @@ class ProcessRequest(unittest.TestCase):
             # Should ALWAYS accept
             if len(server.queue) < CONFIG['negotiate.min_thresh']:
                 server.process_request(stream, request)
-                self.assertEquals(server.queue[-1], stream)
+                self.assertTrue(stream in server.queue)
 
             # MAY accept or reject
             elif len(server.queue) < CONFIG['negotiate.max_thresh']:
                 server.process_request(stream, request)
-                if server.queue[-1] == stream:
+                if stream in server.queue:
                     red_accepted += 1
                 else:
                     red_rejected += 1
@@ -180,7 +180,7 @@ class ProcessRequest(unittest.TestCase):
             # MUST reject
             else:
                 server.process_request(stream, request)
-                self.assertNotEqual(server.queue[-1], stream)
+                self.assertFalse(stream in server.queue)
                 red_discarded += 1
                 if red_discarded == 64:
                     break
@@ -276,87 +276,140 @@ class UpdateQueue(unittest.TestCase):
     ''' Verifies the behavior of _update_queue() method
         of NEGOTIATE_SERVER '''
 
-    def test_stream_before(self):
-        ''' Verify what happens to a stream before the lost one '''
-
+    def make_server(self, count, waiting):
+        ''' Make a server with @count streams in queue and make
+            the streams in @waiting have a pending comet request '''
         server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
+        streams = []
+        for position in range(count):
             stream = MinimalHttpStream()
             server.queue.append(stream)
-            server.known.add(stream)
-            server.queue[-1].opaque = position
+            server.notified[stream] = position
+            if position in waiting:
+                stream.opaque = position
+            streams.append(stream)
+        return server, streams
+
+    def test_stream_before(self):
+        ''' Verify what happens to a stream before the lost one '''
 
-        server._update_queue(server.queue[-1], None)
+        server, streams = self.make_server(5, range(5))
+        server._update_queue(streams[-1], None)
+        server._wakeup_waiters()
 
         self.assertEqual(len(server.queue), 4)
+        self.assertEqual(list(server.queue), streams[:4])
         for position, stream in enumerate(server.queue):
             self.assertEqual(stream.opaque, position)
-            self.assertTrue(stream in server.known)
+            self.assertEqual(server.queue.position(stream), position)
+        self.assertEqual(server.negotiated, [])
 
     def test_stream_lost(self):
         ''' Verify what happens to the lost stream '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for _ in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
+        server, streams = self.make_server(5, ())
+        server._update_queue(streams[3], None)
 
-        lost_stream = server.queue[3]
-        server._update_queue(lost_stream, None)
-
-        self.assertTrue(lost_stream not in server.queue)
-        self.assertTrue(lost_stream not in server.known)
+        self.assertTrue(streams[3] not in server.queue)
+        self.assertTrue(streams[3] not in server.notified)
+        self.assertEqual(server.queue.position(streams[4]), 3)
 
     def test_stream_after__no_send(self):
         ''' Verify what happens to streams after that don't have to send '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for _ in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-
-        lost_stream = server.queue[2]
-        server._update_queue(lost_stream, None)
+        server, streams = self.make_server(5, ())
+        server._update_queue(streams[2], None)
+        server._wakeup_waiters()
 
         self.assertEqual(server.negotiated, [])
 
     def test_stream_after__send(self):
         ''' Verify what happens to streams after that has to send '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-            stream.opaque = position
+        server, streams = self.make_server(5, range(5))
+        server._update_queue(streams[2], None)
 
-        lost_stream = server.queue[2]
-        server._update_queue(lost_stream, None)
+        # Nothing is sent until the next poller tick
+        self.assertEqual(server.negotiated, [])
+        self.assertTrue(server.wakeup_pending)
 
+        server._wakeup_waiters()
         self.assertEqual(server.negotiated, [
-                                             (server.queue[2], 3, 2),
-                                             (server.queue[3], 4, 3),
+                                             (streams[3], 3, 2),
+                                             (streams[4], 4, 3),
                                             ])
+        self.assertFalse(server.wakeup_pending)
 
     def test_stream_after__error(self):
         ''' Verify what happens when a stream after raises an error '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-            stream.opaque = position
+        server, streams = self.make_server(5, range(5))
+        streams[3].generate_error = True
+        server._update_queue(streams[2], None)
+        server._wakeup_waiters()
 
-        lost_stream = server.queue[2]
-        server.queue[3].generate_error = True
-        server._update_queue(lost_stream, None)
+        self.assertEqual(server.negotiated, [
+                                             (streams[4], 4, 2),
+                                            ])
+        self.assertTrue(streams[3] not in server.queue)
+        self.assertEqual(server.queue.position(streams[4]), 2)
+
+    def test_coalesce(self):
+        ''' Make sure we wakeup each stream at most once per tick '''
+
+        server, streams = self.make_server(6, range(6))
+        server._update_queue(streams[1], None)
+        server._update_queue(streams[3], None)
+        server._wakeup_waiters()
 
         self.assertEqual(server.negotiated, [
-                                             (server.queue[2], 4, 2),
+                                             (streams[2], 2, 1),
+                                             (streams[4], 4, 2),
+                                             (streams[5], 5, 3),
                                             ])
 
+    def test_late_comet(self):
+        ''' Make sure a comet request arriving after the position
+            has changed is answered immediately '''
+
+        server, streams = self.make_server(3, ())
+        server._update_queue(streams[0], None)
+        server._wakeup_waiters()
+        self.assertEqual(server.negotiated, [])
+
+        request = Message(uri='/negotiate/abc')
+        server.process_request(streams[2], request)
+        self.assertEqual(server.negotiated, [(streams[2], request, 1)])
+        self.assertEqual(streams[2].opaque, None)
+
+        # No change, so we wait
+        request = Message(uri='/negotiate/abc')
+        server.process_request(streams[2], request)
+        self.assertEqual(len(server.negotiated), 1)
+        self.assertEqual(streams[2].opaque, request)
+
+    def test_released(self):
+        ''' Make sure a stream is woken up when it can be unchoked,
+            even if its position does not change '''
+
+        saved = CONFIG['negotiate.parallelism']
+        CONFIG['negotiate.parallelism'] = 1
+        try:
+            server, streams = self.make_server(3, ())
+            streams[0].opaque = 'comet'
+            for stream in streams:
+                server.admission.admit(stream, 'abc')
+            self.assertTrue(server.admission.unchoke(streams[1], 'abc'))
+            self.assertFalse(server.admission.can_unchoke(streams[0]))
+
+            server._update_queue(streams[1], None)
+            server._wakeup_waiters()
+            self.assertEqual(server.negotiated, [(streams[0], 'comet', 0)])
+
+            # The comet request of streams[2] is in flight
+            self.assertEqual(server.notified[streams[2]], None)
+        finally:
+            CONFIG['negotiate.parallelism'] = saved
+
 if __name__ == "__main__":
     unittest.main()
@@ -21,9 +21,12 @@
 #
 
 import StringIO
+import errno
 import random
+import socket
 import struct
 import sys
+import tempfile
 import unittest
 
 if __name__ == "__main__":
@@ -31,6 +34,9 @@ if __name__ == "__main__":
 
 from neubot.config import CONFIG
 from neubot.net import stream
+from neubot.utils_random import RandomFileBody
+
+from neubot import utils_sendfile
 
 #
 # Provide the bare minimum needed to look
@@ -469,5 +475,175 @@ class TestStreamSend_ReandSendQueue_NotEmpty(unittest.TestCase):
     def set_writable(self, stream):
         pass
 
+#
+# Make sure that the send path gathers small pieces of the
+# send queue and that, after a partial write, what has not
+# been sent goes back to the send queue in the right order.
+#
+class TestStreamSend_Gather(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = stream.Stream(self)
+        self.stream.attach(self, FakeSocket(), CONFIG)
+        self.sent = []
+        self.count = None
+        self.stream.sock.sosendv = self.sosendv
+
+    def sosendv(self, vector):
+        vector = [str(piece) for piece in vector]
+        self.sent.append(vector)
+        count = self.count
+        if count is None:
+            count = len("".join(vector))
+        return stream.SUCCESS, count
+
+    def test_gather(self):
+        """Make sure the send path gathers small pieces"""
+        self.stream.start_send("HEADERS")
+        self.stream.start_send(StringIO.StringIO("BODY"))
+        self.stream.start_send("")
+        self.stream.start_send("TRAILER")
+        self.count = 9
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["HEADERS", "BODY", "TRAILER"])
+        self.count = None
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["DY", "TRAILER"])
+        self.assertFalse(self.stream.send_pending)
+
+    def test_big_pieces(self):
+        """Make sure the send path does not gather big pieces"""
+        big = "A" * (stream.MAXGATHER + 1)
+        self.stream.start_send("HEADERS")
+        self.stream.start_send(big)
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["HEADERS"])
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], [big])
+
+    def test_big_read(self):
+        """Make sure we don't read less than MAXBUF from file-likes"""
+        body = StringIO.StringIO("A" * stream.MAXGATHER)
+        body.read = lambda count: (StringIO.StringIO.read(body, count)
+                                   if count >= stream.MAXBUF else 1/0)
+        self.stream.start_send("HEADERS")
+        self.stream.start_send(body)
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["HEADERS"])
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["A" * stream.MAXGATHER])
+
+    def test_buffers(self):
+        """Make sure the send path gathers buffers like strings"""
+        self.stream.start_send(buffer("xxHEADERS", 2))
+        self.stream.start_send(buffer("BODYxx", 0, 4))
+        self.stream.handle_write()
+        self.assertEqual(self.sent[-1], ["HEADERS", "BODY"])
+        self.assertFalse(self.stream.send_pending)
+
+    def connection_lost(self, stream):
+        pass
+    def set_writable(self, stream):
+        pass
+    def unset_writable(self, stream):
+        pass
+
+class TestStreamSend_Sendfile(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = stream.Stream(self)
+        self.stream.attach(self, FakeSocket(), CONFIG)
+        self.left, self.right = socket.socketpair()
+        self.left.setblocking(False)
+        self.right.setblocking(False)
+        self.stream.sock.sock = self.left
+        self.sendfile = []
+        self.stream.sock.sosendfile = self.sosendfile
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def sosendfile(self, filep):
+        self.sendfile.append(filep)
+        return stream.SocketWrapper.sosendfile(self.stream.sock, filep)
+
+    def transfer(self):
+        received = []
+        while self.stream.send_pending:
+            self.stream.handle_write()
+            while True:
+                try:
+                    octets = self.right.recv(65536)
+                except socket.error, exception:
+                    if exception[0] != errno.EAGAIN:
+                        raise
+                    break
+                received.append(octets)
+        return "".join(received)
+
+    def test_regular_file(self):
+        """Make sure the send path uses sendfile() for big files"""
+        if not utils_sendfile.HAVE_SENDFILE:
+            return
+        content = "".join(chr(random.randrange(256))
+                          for _ in range(stream.MAXGATHER * 4))
+        filep = tempfile.TemporaryFile()
+        filep.write(content)
+        filep.seek(0)
+        self.stream.start_send("HEADERS")
+        self.stream.start_send(filep)
+        self.stream.start_send("TRAILER")
+        self.assertEqual(self.transfer(), "HEADERS" + content + "TRAILER")
+        self.assertTrue(self.sendfile)
+        self.assertEqual(self.stream.bytes_sent_tot, len(content) + 14)
+
+    def test_small_file(self):
+        """Make sure the send path gathers small files"""
+        filep = tempfile.TemporaryFile()
+        filep.write("BODY")
+        filep.seek(0)
+        self.stream.start_send("HEADERS")
+        self.stream.start_send(filep)
+        self.assertEqual(self.transfer(), "HEADERSBODY")
+        self.assertFalse(self.sendfile)
+
+    def test_random_body(self):
+        """Make sure we can sendfile() a random body"""
+        if not utils_sendfile.HAVE_SENDFILE:
+            return
+        body = RandomFileBody(3 << 20)
+        self.stream.start_send(body)
+        self.assertEqual(len(self.transfer()), 3 << 20)
+        self.assertTrue(self.sendfile)
+
+    def test_random_body_read(self):
+        """Make sure a random body can be read like a file"""
+        body = RandomFileBody(1 << 24)
+        body.seek(0, 2)
+        self.assertEqual(body.tell(), 1 << 24)
+        body.seek(0)
+        total = 0
+        while True:
+            octets = body.read(1 << 20)
+            if not octets:
+                break
+            total += len(octets)
+        self.assertEqual(total, 1 << 24)
+
+    def test_no_sendfile(self):
+        """Make sure we fall back to read() when sendfile() is off"""
+        self.stream.send_file_ok = False
+        self.stream.start_send(RandomFileBody(1 << 20))
+        self.assertEqual(len(self.transfer()), 1 << 20)
+        self.assertFalse(self.sendfile)
+
+    def connection_lost(self, stream):
+        pass
+    def set_writable(self, stream):
+        pass
+    def unset_writable(self, stream):
+        pass
+
 if __name__ == "__main__":
     unittest.main()
@@ -28,28 +28,38 @@ import unittest
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
+from neubot.pollable import Pollable
 from neubot.poller import Poller
+from neubot.poller_engine import SelectEngine
 
-class TestCheckTimeoutStream(object):
+from neubot import utils
+
+def _create_poller():
+    ''' Create a poller that does not care about filenos validity '''
+    poller = Poller(1)
+    poller.engine = SelectEngine()
+    return poller
+
+class TestCheckTimeoutStream(Pollable):
     ''' Fake stream for TestCheckTimeout '''
 
     def __init__(self, result, fileno):
         '''Initialize fake stream '''
+        Pollable.__init__(self)
         self._result = result
         self._fileno = fileno
 
-    def fileno(self):
-        ''' Return file number '''
-        return self._fileno
-
-    def handle_periodic(self, timenow):
-        ''' Return True if this stream has run for too much
-            time and must be pruned '''
         #
         # We want to prune all odd streams and make sure that
         # even ones are still tracked by the poller.
         #
-        return self._fileno % 2
+        if self._fileno % 2:
+            self.created = utils.ticks() - 2
+            self.watchdog = 1
+
+    def fileno(self):
+        ''' Return file number '''
+        return self._fileno
 
     def handle_close(self):
         ''' Invoked when this stream is closed '''
@@ -65,25 +75,25 @@ class TestCheckTimeout(unittest.TestCase):
 
     def test_readable(self):
         ''' Make sure it runs when there's only readable stuff '''
-        poller = Poller(1)
+        poller = _create_poller()
         result = []
         stream = TestCheckTimeoutStream(result, 1)
-        poller.readset[1] = stream
+        poller.set_readable(stream)
         poller.check_timeout()
         self.assertEqual(result, [1])
 
     def test_writable(self):
         ''' Make sure it runs when there's only writable stuff '''
-        poller = Poller(1)
+        poller = _create_poller()
         result = []
         stream = TestCheckTimeoutStream(result, 1)
-        poller.writeset[1] = stream
+        poller.set_writable(stream)
         poller.check_timeout()
         self.assertEqual(result, [1])
 
     def test_complete(self):
         ''' Make sure it works with both readable and writable streams '''
-        poller = Poller(1)
+        poller = _create_poller()
         result = []
 
         #
@@ -94,9 +104,9 @@ class TestCheckTimeout(unittest.TestCase):
         #
         for i in range(256):
             stream = TestCheckTimeoutStream(result, i)
-            poller.readset[i] = stream
+            poller.set_readable(stream)
             if i > 14 and i < 128:
-                poller.writeset[i] = stream
+                poller.set_writable(stream)
 
         # This should close odd streams only
         poller.check_timeout()
@@ -110,5 +120,55 @@ class TestCheckTimeout(unittest.TestCase):
         # Make sure the writable set is consistent
         self.assertEqual(sorted(poller.writeset), range(16, 128, 2))
 
+        # Make sure the engine is consistent
+        self.assertEqual(sorted(poller.engine.interest), range(0, 256, 2))
+
+class TestWatchdogIndex(unittest.TestCase):
+    ''' Regression test for the watchdog index '''
+
+    def test_toggle(self):
+        ''' Make sure toggling readability does not grow the index '''
+        poller = _create_poller()
+        stream = TestCheckTimeoutStream([], 2)
+        for _ in range(16):
+            poller.set_readable(stream)
+            poller.unset_readable(stream)
+        self.assertEqual(len(poller.watchdogs), 1)
+
+    def test_anticipate(self):
+        ''' Make sure an anticipated deadline is honored '''
+        poller = _create_poller()
+        result = []
+        stream = TestCheckTimeoutStream(result, 2)
+        poller.set_readable(stream)
+        poller.check_timeout()
+        self.assertEqual(result, [])
+        stream.created = utils.ticks() - 10
+        stream.watchdog = 5
+        poller.check_timeout()
+        self.assertEqual(result, [2])
+
+    def test_postpone(self):
+        ''' Make sure a postponed deadline is honored '''
+        poller = _create_poller()
+        result = []
+        stream = TestCheckTimeoutStream(result, 2)
+        stream.created = utils.ticks() - 10
+        stream.watchdog = 5
+        poller.set_readable(stream)
+        stream.created = utils.ticks()
+        poller.check_timeout()
+        self.assertEqual(result, [])
+        self.assertEqual(poller.readset, {2: stream})
+        self.assertEqual(len(poller.watchdogs), 1)
+
+    def test_no_watchdog(self):
+        ''' Make sure streams without watchdog are not indexed '''
+        poller = _create_poller()
+        stream = TestCheckTimeoutStream([], 2)
+        stream.watchdog = -1
+        poller.set_readable(stream)
+        self.assertEqual(poller.watchdogs, [])
+
 if __name__ == '__main__':
     unittest.main()
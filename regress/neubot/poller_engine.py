@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/poller_engine.py '''
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import poller_engine
+
+class EngineTestMixin(object):
+    ''' Tests that all engines must pass '''
+
+    name = None
+
+    def setUp(self):
+        ''' Create engine and connected pair of sockets '''
+        if not poller_engine.is_available(self.name):
+            self.engine = None
+            return
+        self.engine = poller_engine.create(self.name)
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        ''' Release resources '''
+        if self.engine:
+            self.engine.close()
+            self.left.close()
+            self.right.close()
+
+    def test_name(self):
+        ''' Make sure we got the engine we asked for '''
+        if self.engine:
+            self.assertEqual(self.engine.name, self.name)
+
+    def test_writable(self):
+        ''' Make sure a fresh socket is writable but not readable '''
+        if not self.engine:
+            return
+        fileno = self.left.fileno()
+        self.engine.modify(fileno, poller_engine.READ | poller_engine.WRITE)
+        self.assertEqual(self.engine.poll(1), ([], [fileno]))
+
+    def test_readable(self):
+        ''' Make sure a socket with pending data is readable '''
+        if not self.engine:
+            return
+        fileno = self.left.fileno()
+        self.engine.modify(fileno, poller_engine.READ)
+        self.assertEqual(self.engine.poll(0), ([], []))
+        self.right.send(b'x')
+        self.assertEqual(self.engine.poll(1), ([fileno], []))
+
+    def test_level_triggered(self):
+        ''' Make sure readability is reported until data is consumed '''
+        if not self.engine:
+            return
+        fileno = self.left.fileno()
+        self.engine.modify(fileno, poller_engine.READ)
+        self.right.send(b'x')
+        self.assertEqual(self.engine.poll(1), ([fileno], []))
+        self.assertEqual(self.engine.poll(1), ([fileno], []))
+        self.left.recv(1)
+        self.assertEqual(self.engine.poll(0), ([], []))
+
+    def test_modify_and_unregister(self):
+        ''' Make sure changing and clearing the interest works '''
+        if not self.engine:
+            return
+        fileno = self.left.fileno()
+        self.engine.modify(fileno, poller_engine.READ)
+        self.engine.modify(fileno, poller_engine.WRITE)
+        self.right.send(b'x')
+        self.assertEqual(self.engine.poll(1), ([], [fileno]))
+        self.engine.modify(fileno, 0)
+        self.assertEqual(self.engine.poll(0), ([], []))
+        self.assertEqual(self.engine.interest, {})
+
+    def test_stale_registration(self):
+        ''' Make sure the engine copes with closed file descriptors '''
+        if not self.engine:
+            return
+        fileno = self.left.fileno()
+        self.engine.modify(fileno, poller_engine.READ)
+        self.left.close()
+        self.engine.modify(fileno, 0)
+        self.left = socket.socket()
+
+class SelectEngine(EngineTestMixin, unittest.TestCase):
+    ''' Regression test for the select engine '''
+    name = 'select'
+
+class PollEngine(EngineTestMixin, unittest.TestCase):
+    ''' Regression test for the poll engine '''
+    name = 'poll'
+
+class EpollEngine(EngineTestMixin, unittest.TestCase):
+    ''' Regression test for the epoll engine '''
+    name = 'epoll'
+
+class KqueueEngine(EngineTestMixin, unittest.TestCase):
+    ''' Regression test for the kqueue engine '''
+    name = 'kqueue'
+
+class Create(unittest.TestCase):
+    ''' Regression test for create() '''
+
+    def test_fallback(self):
+        ''' Make sure we fall back to select for unknown engines '''
+        self.assertEqual(poller_engine.create('nonexistent').name, 'select')
+
+    def test_auto(self):
+        ''' Make sure auto selects an available engine '''
+        engine = poller_engine.create('auto')
+        self.assertTrue(poller_engine.is_available(engine.name))
+        engine.close()
+
+if __name__ == '__main__':
+    unittest.main()
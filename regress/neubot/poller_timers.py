@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/poller_timers.py '''
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.poller_timers import TimerWheel
+
+class TestTimerWheel(unittest.TestCase):
+    ''' Regression test for TimerWheel '''
+
+    def test_never_early(self):
+        ''' Make sure that timers never fire early '''
+        wheel = TimerWheel(1.0)
+        result = []
+        wheel.schedule(10.5, 1.0, result.append, ('a',))
+        wheel.run(11.4)
+        self.assertEqual(result, [])
+        wheel.run(12.0)
+        self.assertEqual(result, [('a',)])
+
+    def test_order(self):
+        ''' Make sure that timers fire in deadline order '''
+        wheel = TimerWheel(1.0)
+        result = []
+        wheel.schedule(0, 5, result.append, (5,))
+        wheel.schedule(0, 1, result.append, (1,))
+        wheel.schedule(0, 3, result.append, (3,))
+        wheel.run(100)
+        self.assertEqual(result, [(1,), (3,), (5,)])
+
+    def test_same_slot(self):
+        ''' Make sure timers in the same slot share a heap entry '''
+        wheel = TimerWheel(1.0)
+        for index in range(16):
+            wheel.schedule(0.001 * index, 1, lambda: None, ())
+        self.assertEqual(len(wheel.heap), 1)
+        self.assertEqual(len(wheel), 16)
+
+    def test_cancel(self):
+        ''' Make sure that cancelled timers do not fire '''
+        wheel = TimerWheel(1.0)
+        result = []
+        timer = wheel.schedule(0, 1, result.append, (1,))
+        wheel.schedule(0, 1, result.append, (2,))
+        timer.cancel()
+        self.assertTrue(timer.cancelled())
+        self.assertEqual(len(wheel), 1)
+        wheel.run(10)
+        self.assertEqual(result, [(2,)])
+        self.assertEqual(len(wheel), 0)
+
+    def test_timeout(self):
+        ''' Make sure timeout() is consistent with the slot end '''
+        wheel = TimerWheel(1.0)
+        self.assertEqual(wheel.timeout(0), None)
+        wheel.schedule(0, 1.5, lambda: None, ())
+        self.assertEqual(wheel.timeout(0), 2.0)
+        self.assertEqual(wheel.timeout(3.0), 0)
+
+    def test_exception(self):
+        ''' Make sure an exception in a timer does not stop others '''
+        wheel = TimerWheel(1.0)
+        result = []
+        wheel.schedule(0, 1, lambda: 1 / 0, ())
+        wheel.schedule(0, 1, result.append, (1,))
+        wheel.run(10)
+        self.assertEqual(result, [(1,)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/resolver.py '''
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.poller import POLLER
+from neubot.resolver import Resolver
+
+from neubot import resolver
+from neubot import utils
+
+class CountingResolver(Resolver):
+    ''' Resolver that counts lookups and fails on .invalid '''
+
+    lookups = []
+
+    @staticmethod
+    def _lookup(key):
+        CountingResolver.lookups.append(key)
+        if key[0].endswith('.invalid'):
+            return None, 'no such host'
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('127.0.0.1', key[1]))], None
+
+class TestResolver(unittest.TestCase):
+    ''' Regression test for Resolver '''
+
+    def setUp(self):
+        CountingResolver.lookups = []
+        self.resolver = CountingResolver(POLLER, 2)
+        self.results = []
+
+    def _callback(self, epnt, addrinfo):
+        ''' Save the result of resolve() '''
+        self.results.append((epnt, addrinfo))
+
+    def _wait(self, count):
+        ''' Run the poller until we have @count results '''
+        while len(self.results) < count:
+            POLLER._poll(1.0)
+
+    def test_numeric(self):
+        ''' Make sure numeric addresses are resolved immediately '''
+        self.resolver.resolve(('::1', 80), self._callback)
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.results[0][1][0][0], socket.AF_INET6)
+        self.assertEqual(CountingResolver.lookups, [])
+        self.assertFalse(self.resolver.threads)
+
+    def test_cache(self):
+        ''' Make sure lookups are coalesced and cached '''
+        self.resolver.resolve(('www.example.com', 80), self._callback)
+        self.resolver.resolve(('www.example.com', 80), self._callback)
+        self.assertEqual(self.results, [])
+        self._wait(2)
+        self.resolver.resolve(('www.example.com', 80), self._callback)
+        self.assertEqual(len(self.results), 3)
+        self.assertEqual(CountingResolver.lookups, [('www.example.com', 80)])
+        self.assertEqual(self.resolver.hits, 1)
+
+    def test_negative(self):
+        ''' Make sure failed lookups are cached for less time '''
+        self.resolver.resolve(('www.example.invalid', 80), self._callback)
+        self._wait(1)
+        self.assertEqual(self.results[0][1], None)
+        expires = self.resolver.cache[('www.example.invalid', 80)][0]
+        self.assertTrue(expires <= utils.ticks() + resolver.NEGATIVE_TTL)
+        self.resolver.resolve(('www.example.invalid', 80), self._callback)
+        self.assertEqual(self.results[1][1], None)
+        self.assertEqual(len(CountingResolver.lookups), 1)
+
+    def test_loop_returns(self):
+        ''' Make sure the poller loop returns after a lookup '''
+        stuck = []
+        def watchdog():
+            stuck.append(True)
+            POLLER.break_loop()
+        self.resolver.resolve(('www.example.com', 80), self._callback)
+        timer = POLLER.schedule(10.0, watchdog)
+        POLLER.loop()
+        timer.cancel()
+        POLLER.again = True
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(stuck, [])
+        self.assertFalse(self.resolver.pending)
+
+if __name__ == '__main__':
+    unittest.main()
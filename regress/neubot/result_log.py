@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/result_log.py '''
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.result_log import ResultLog
+
+class TestResultLog(unittest.TestCase):
+    ''' Regression test for ResultLog '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def _touch(self, components):
+        ''' Create file below datadir '''
+        path = os.path.join(self.datadir, *components)
+        open(path, 'ab').close()
+        return path
+
+    def _open(self):
+        ''' Open the log of the 'foo' test '''
+        return ResultLog('foo', self.datadir, self._touch, 4, 3)
+
+    def _fill(self, count):
+        ''' Append @count results to the log '''
+        result_log = self._open()
+        for timestamp in range(count):
+            result_log.append({'timestamp': timestamp})
+        return result_log
+
+    def test_walk(self):
+        ''' Make sure walk() returns segments by index '''
+        result_log = self._fill(10)
+        self.assertEqual(sorted(os.listdir(self.datadir)),
+                         ['foo.log.0', 'foo.log.1', 'foo.log.2'])
+        self.assertEqual(result_log.walk(), [{'timestamp': 8},
+                                             {'timestamp': 9}])
+        self.assertEqual(len(result_log.walk(0)), 4)
+        self.assertEqual(result_log.walk(1)[0], {'timestamp': 0})
+        self.assertEqual(result_log.walk(2), [])
+
+        # Must be the same after we reopen the log
+        result_log = self._open()
+        self.assertEqual(result_log.walk(0)[0], {'timestamp': 4})
+        result_log.append({'timestamp': 10})
+        result_log.append({'timestamp': 11})
+        result_log.append({'timestamp': 12})
+        self.assertEqual(result_log.walk(), [{'timestamp': 12}])
+        self.assertEqual(sorted(os.listdir(self.datadir)),
+                         ['foo.log.1', 'foo.log.2', 'foo.log.3'])
+
+    def test_walk_range(self):
+        ''' Make sure walk_range() returns results in range '''
+        result_log = self._fill(10)
+        self.assertEqual([elem['timestamp'] for elem in
+                          result_log.walk_range(3, 8)],
+                         [8, 7, 6, 5, 4, 3])
+        self.assertEqual(len(result_log.walk_range()), 10)
+        self.assertEqual(result_log.walk_range(20), [])
+        self.assertEqual(len(self._open().walk_range(since=7)), 3)
+
+    def test_rotate_while_iterating(self):
+        ''' Make sure iter_range() skips the segments that are gone '''
+        result_log = self._fill(10)
+        records = result_log.iter_range()
+        self.assertEqual(next(records), {'timestamp': 9})
+
+        # Rotate away segment 0 and unlink segment 1 after it has
+        # been indexed, as the storage thread may do meanwhile
+        result_log.segments[1].load()
+        for timestamp in range(10, 14):
+            result_log.append({'timestamp': timestamp})
+        self.assertFalse(0 in result_log.segments)
+        os.unlink(result_log.segments[1].path)
+
+        self.assertEqual(list(records), [{'timestamp': 8}])
+
+    def test_incomplete(self):
+        ''' Make sure an incomplete record is truncated '''
+        self._fill(3)
+        path = os.path.join(self.datadir, 'foo.log.0')
+        size = os.path.getsize(path)
+        filep = open(path, 'ab')
+        filep.write('\0\0\1\0abc')
+        filep.close()
+
+        result_log = self._open()
+        self.assertEqual(len(result_log.walk()), 3)
+        result_log.append({'timestamp': 3})
+        self.assertTrue(os.path.getsize(path) > size)
+        self.assertEqual(self._open().walk()[-1], {'timestamp': 3})
+
+    def test_import_pickles(self):
+        ''' Make sure we import the old pickle files '''
+        for suffix, first in (('.pickle.0', 0), ('.pickle', 2)):
+            filep = open(os.path.join(self.datadir, 'foo' + suffix), 'wb')
+            pickle.dump([{'timestamp': first}, {'timestamp': first + 1}],
+                        filep)
+            filep.close()
+        result_log = self._open()
+        self.assertEqual(sorted(os.listdir(self.datadir)),
+                         ['foo.log.0', 'foo.log.1'])
+        self.assertEqual([elem['timestamp'] for elem in
+                          result_log.walk_range()], [3, 2, 1, 0])
+
+    def test_concurrent_append(self):
+        ''' Make sure we can read while another thread appends '''
+        result_log = ResultLog('foo', self.datadir, self._touch,
+                               segment_records=4096, autosync=False)
+        result_log.append({'timestamp': 0})
+
+        def append():
+            ''' Append results from another thread '''
+            for timestamp in range(1, 2000):
+                result_log.append({'timestamp': timestamp})
+
+        thread = threading.Thread(target=append)
+        thread.start()
+        while thread.isAlive():
+            results = result_log.walk_range(0, 1000)
+            self.assertEqual(results[-1], {'timestamp': 0})
+        thread.join()
+        self.assertEqual(len(result_log.walk()), 2000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Regression test for neubot/server_prefork.py '''
+
+import copy
+import os
+import select
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.server_prefork import Supervisor
+from neubot import utils_net
+
+# Number of workers
+WORKERS = 3
+
+class TestSupervisor(unittest.TestCase):
+    ''' Regression test for Supervisor '''
+
+    def setUp(self):
+        self.supervisor = Supervisor(WORKERS, None)
+        self.groups = [[], []]
+        self.ports = [0, 0]
+        for index in range(WORKERS):
+            self._listen(index)
+            self.supervisor.pids[1000000 + index] = index
+            self._heartbeat(index)
+        self.supervisor._update_live()
+        self._steer()
+
+    def tearDown(self):
+        for group in self.groups:
+            for _, sock in group:
+                sock.close()
+
+    def _listen(self, index):
+        ''' Bind the sockets of worker @index '''
+        for num, group in enumerate(self.groups):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, utils_net.SO_REUSEPORT, 1)
+            sock.bind(('127.0.0.1', self.ports[num]))
+            sock.listen(128)
+            sock.setblocking(False)
+            self.ports[num] = sock.getsockname()[1]
+            group.append((index, sock))
+
+    def _heartbeat(self, index):
+        ''' Tell the supervisor that worker @index is ready '''
+        worker = copy.copy(self.supervisor.arbiter)
+        worker.attach(index)
+        worker.heartbeat()
+
+    def _steer(self):
+        ''' Steer the groups like the workers do '''
+        live = max(1, self.supervisor.arbiter.live())
+        for group in self.groups:
+            if not utils_net.steer_reuseport(group[0][1], live):
+                self.skipTest('steering not supported')
+
+    def _accept(self, num):
+        ''' Returns the index of the worker that accepts on group @num '''
+        socks = [sock for _, sock in self.groups[num]]
+        readable = select.select(socks, [], [], 1.0)[0]
+        self.assertEqual(len(readable), 1)
+        conn = readable[0].accept()[0]
+        conn.close()
+        for index, sock in self.groups[num]:
+            if sock is readable[0]:
+                return index
+
+    def _check(self):
+        ''' Make sure each client talks to a single worker '''
+        for prefix in range(1, 7):
+            for _ in range(4):
+                indexes = []
+                for num in range(len(self.groups)):
+                    conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    conn.bind(('127.0.%d.1' % prefix, 0))
+                    conn.connect(('127.0.0.1', self.ports[num]))
+                    indexes.append(self._accept(num))
+                    conn.close()
+                self.assertEqual(indexes[0], indexes[1])
+
+    def test_restart(self):
+        ''' Make sure steering is consistent when a worker restarts '''
+        self.assertEqual(self.supervisor.arbiter.live(), WORKERS)
+        self._check()
+
+        # Worker 1 exits and the supervisor reaps it
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        del self.supervisor.pids[1000001]
+        self.supervisor.pids[pid] = 1
+        for group in self.groups:
+            for position, (index, sock) in enumerate(group):
+                if index == 1:
+                    sock.close()
+                    del group[position]
+                    break
+        while not self.supervisor._reap():
+            pass
+        self.assertEqual(self.supervisor.arbiter.live(), WORKERS - 1)
+        self.assertTrue(1 in self.supervisor.restarts)
+        self._steer()
+        self._check()
+
+        # Worker 1 restarts and binds its sockets
+        self.supervisor.arbiter.reset(1)
+        self.supervisor.pids[1000001] = 1
+        self._listen(1)
+        self._check()
+
+        # Worker 1 is ready
+        self._heartbeat(1)
+        self.supervisor._update_live()
+        self.assertEqual(self.supervisor.arbiter.live(), WORKERS)
+        self._steer()
+        self._check()
+
+if __name__ == '__main__':
+    unittest.main()
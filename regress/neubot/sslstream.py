@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/sslstream.py '''
+
+import ssl
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import sslstream
+
+class FakeSSLSocket(object):
+    ''' Fake SSL socket that needs two handshake steps '''
+
+    def __init__(self, port):
+        self.steps = 0
+        self.port = port
+        self.session = 'session-%d' % port
+
+    def do_handshake(self):
+        ''' Fake handshake step '''
+        self.steps += 1
+        if self.steps < 2:
+            raise ssl.SSLError(ssl.SSL_ERROR_WANT_READ)
+
+    def getpeername(self):
+        ''' Fake getpeername() '''
+        return ('127.0.0.1', self.port)
+
+class TestHandshakeTimer(unittest.TestCase):
+    ''' Regression test for HandshakeTimer '''
+
+    def tearDown(self):
+        sslstream.CLIENT_SESSIONS.clear()
+
+    def test_step(self):
+        ''' Make sure step() measures the handshake '''
+        timer = sslstream.HandshakeTimer(FakeSSLSocket(443), False)
+        self.assertRaises(ssl.SSLError, timer.step)
+        self.assertTrue(timer.begin > 0)
+        timer.step()
+        self.assertTrue(timer.elapsed() >= timer.cpu >= 0)
+        self.assertEqual(sslstream.CLIENT_SESSIONS[('127.0.0.1', 443)],
+                         'session-443')
+
+    def test_overlap(self):
+        ''' Make sure overlap() works as expected '''
+        timer = sslstream.HandshakeTimer(None, False)
+        timer.begin, timer.end = 10.0, 12.0
+        self.assertEqual(timer.overlap(9.0, 15.0), 2.0)
+        self.assertEqual(timer.overlap(11.0, 15.0), 1.0)
+        self.assertEqual(timer.overlap(12.5, 15.0), 0.0)
+
+    def test_server_side(self):
+        ''' Make sure the server does not save sessions '''
+        timer = sslstream.HandshakeTimer(FakeSSLSocket(443), True)
+        self.assertRaises(ssl.SSLError, timer.step)
+        timer.step()
+        self.assertFalse(sslstream.CLIENT_SESSIONS)
+
+    def test_maxsessions(self):
+        ''' Make sure we don't save too many sessions '''
+        for port in range(sslstream.MAXSESSIONS + 1):
+            sslstream.save_session(FakeSSLSocket(port), False)
+        self.assertTrue(len(sslstream.CLIENT_SESSIONS) <=
+                        sslstream.MAXSESSIONS)
+
+if __name__ == '__main__':
+    unittest.main()
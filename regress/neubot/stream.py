@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/stream.py '''
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.brigade import Brigade
+from neubot.buffer_pool import BufferPool
+from neubot.pollable import SUCCESS
+from neubot.pollable import WANT_READ
+from neubot.stream import StreamWrapper
+
+from neubot import six
+
+class TestSorecvInto(unittest.TestCase):
+    ''' Regression test for StreamWrapper.sorecv_into() '''
+
+    def setUp(self):
+        ''' Create a pair of connected sockets '''
+        self.left, self.right = socket.socketpair()
+        self.left.setblocking(False)
+        self.wrapper = StreamWrapper(self.left)
+
+    def tearDown(self):
+        ''' Close the sockets '''
+        self.left.close()
+        self.right.close()
+
+    def test_view(self):
+        ''' Make sure sorecv_into() returns a view of the buffer '''
+        buff = bytearray(16)
+        self.right.send(six.b('abcdef'))
+        status, view = self.wrapper.sorecv_into(buff, 4)
+        self.assertEqual(status, SUCCESS)
+        self.assertEqual(len(view), 4)
+        self.assertEqual(bytes(view), six.b('abcd'))
+        self.assertEqual(bytes(buff[:4]), six.b('abcd'))
+
+    def test_would_block(self):
+        ''' Make sure sorecv_into() copes with EAGAIN '''
+        status, view = self.wrapper.sorecv_into(bytearray(16), 16)
+        self.assertEqual(status, WANT_READ)
+        self.assertFalse(view)
+
+    def test_eof(self):
+        ''' Make sure sorecv_into() returns empty data on EOF '''
+        self.right.close()
+        status, view = self.wrapper.sorecv_into(bytearray(16), 16)
+        self.assertEqual(status, SUCCESS)
+        self.assertFalse(view)
+
+class TestBufferPool(unittest.TestCase):
+    ''' Regression test for BufferPool '''
+
+    def test_reuse(self):
+        ''' Make sure buffers are reused '''
+        pool = BufferPool(16, 1)
+        buff = pool.get()
+        self.assertEqual(len(buff), 16)
+        pool.put(buff)
+        self.assertTrue(pool.get() is buff)
+
+    def test_maxidle(self):
+        ''' Make sure we don't keep too many idle buffers '''
+        pool = BufferPool(16, 1)
+        first, second = pool.get(), pool.get()
+        pool.put(first)
+        pool.put(second)
+        self.assertEqual(pool.idle, [first])
+
+class TestUnshare(unittest.TestCase):
+    ''' Regression test for Brigade.unshare() '''
+
+    def test_unshare(self):
+        ''' Make sure the brigade survives buffer reuse '''
+        buff = bytearray(six.b('0123456789'))
+        brigade = Brigade()
+        brigade.bufferise(six.buff(buff, 0, 10))
+        self.assertEqual(brigade.skip(8), 0)
+        brigade.unshare()
+        buff[8:10] = six.b('XX')
+        self.assertEqual(brigade.pullup(2), six.b('89'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,12 +23,14 @@
 ''' Unit test for neubot/utils_random.py '''
 
 import sys
+import zlib
 
 sys.path.insert(0, '.')
 
 from neubot import utils
 
 BEFORE = utils.ticks()
+from neubot.utils_random import ARENA
 from neubot.utils_random import RANDOMBLOCKS
 from neubot.utils_random import RandomBody
 ELAPSED = utils.ticks() - BEFORE
@@ -38,6 +40,7 @@ def main():
 
     ''' Unit test for neubot/utils_random.py '''
 
+    assert(ARENA.data is None)
     assert(len(RANDOMBLOCKS.get_block()) == RANDOMBLOCKS.blocksiz)
     assert(RANDOMBLOCKS.get_block() != RANDOMBLOCKS.get_block())
 
@@ -55,6 +58,15 @@ def main():
     assert(len(filep.read()) == 789)
     filep.seek(7)
 
+    data = ARENA.get_data()
+    assert(len(data) == ARENA.size + ARENA.maxview)
+    assert(ARENA.get_data() is data)
+    assert(str(ARENA.view(16, ARENA.size - 8)) ==
+           data[ARENA.size - 8:ARENA.size] + data[:8])
+    assert(len(zlib.compress(data[:1048576])) > 1048576)
+    assert(len(ARENA.view(ARENA.maxview)) == ARENA.maxview)
+    assert(ARENA.view(0) == '')
+
     begin, total = utils.ticks(), 0
     while total < 1073741824:
         total += len(RANDOMBLOCKS.get_block())